@@ -0,0 +1,157 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 24 * 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+# Seconds an index generation read from the store is trusted before it is read again
+ANSWER_CACHE_GENERATION_TTL = float(os.getenv("ANSWER_CACHE_GENERATION_TTL", 5))
+
+
+def normalize_query(query):
+    return " ".join(re.findall(r"\w+", query.lower()))
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class AnswerCache:
+    """
+    In-memory cache of generated answers, scoped by (index name, model, search method, top_k).
+
+    A lookup hits on the exact normalized query text, or when the cosine
+    similarity between query embeddings reaches `threshold`. Entries expire
+    after `ttl` seconds and the least recently used are evicted past
+    `max_entries`. The scope also holds the index's generation (see
+    VectorStore.generation), re-read every `generation_ttl` seconds, so an
+    ingest by another process, e.g. batch_ingest, retires older answers.
+    """
+
+    def __init__(self, ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_MAX_ENTRIES, threshold=ANSWER_CACHE_THRESHOLD,
+                 generation_ttl=ANSWER_CACHE_GENERATION_TTL):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.generation_ttl = generation_ttl
+        self._generations = {}  # index name -> (generation, monotonic time read)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, index_name, model, search_type, top_k, query, query_embedding=None):
+        """
+        Return the cached answer for a query, or None.
+
+        `query_embedding` may be a function returning the embedding (or None);
+        it is only called, outside the lock, when there is no exact match and
+        the scope holds answers to other queries.
+        """
+        scope = (index_name, self._generation(index_name), model, search_type, top_k)
+        normalized = normalize_query(query)
+
+        with self._lock:
+            self._expire()
+            if (scope, normalized) in self._entries:
+                return self._hit((scope, normalized))
+            candidates = [(key, entry["vector"]) for key, entry in self._entries.items()
+                          if key[0] == scope and entry["vector"] is not None]
+
+        if callable(query_embedding) and candidates:
+            query_embedding = query_embedding()
+        best_key, best_similarity = None, self.threshold
+        if query_embedding is not None and not callable(query_embedding):
+            query_vector = _unit(query_embedding)
+            for key, vector in candidates:
+                similarity = float(query_vector @ vector)
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+
+        with self._lock:
+            if best_key is None or best_key not in self._entries:
+                self.misses += 1
+                return None
+            return self._hit(best_key)
+
+    def _hit(self, key):
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self._entries[key]["answer"]
+
+    def put(self, index_name, model, search_type, top_k, query, answer, query_embedding=None):
+        """Cache an answer; `query_embedding` may be a function returning the embedding (or None)."""
+        if callable(query_embedding):
+            query_embedding = query_embedding()
+        key = ((index_name, self._generation(index_name), model, search_type, top_k), normalize_query(query))
+        with self._lock:
+            self._entries[key] = {
+                "answer": answer,
+                "vector": _unit(query_embedding) if query_embedding is not None else None,
+                "created": time.monotonic(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, index_name):
+        """Drop every cached answer for an index, e.g. after it is re-ingested."""
+        with self._lock:
+            stale = [key for key in self._entries if key[0][0] == index_name]
+            for key in stale:
+                del self._entries[key]
+            self._generations.pop(index_name, None)
+        if stale:
+            print(f"Invalidated {len(stale)} cached answers for index '{index_name}'")
+
+    def _generation(self, index_name):
+        cached = self._generations.get(index_name)
+        if cached is not None and time.monotonic() - cached[1] < self.generation_ttl:
+            return cached[0]
+
+        from vector_store import get_store, resolve_index
+
+        physical_index, _ = resolve_index(index_name)
+        try:
+            generation = get_store(physical_index).generation(physical_index)
+        except Exception as e:
+            print(f"Could not read the generation of index '{physical_index}': {e}")
+            generation = None
+        self._generations[index_name] = (generation, time.monotonic())
+        return generation
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        expired = [key for key, entry in self._entries.items() if entry["created"] < cutoff]
+        for key in expired:
+            del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """Return the process-wide answer cache, creating it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache()
+    return _cache
+
+
+def replay_stream(answer):
+    """Yield a cached answer word by word, like a streamed generation."""
+    for piece in re.findall(r"\S+\s*|\s+", answer):
+        yield piece
@@ -1,84 +1,35 @@
+import asyncio
+
+from dotenv import load_dotenv
+
+# Settings are read from the environment when the project modules are imported, so .env goes first
+load_dotenv()
+
 import gradio as gr
-import os
-import fitz  # PyMuPDF
-from ingestion import ingest_all_content_into_opensearch
-from chunking import process_images_with_caption, process_tables_with_description, create_semantic_chunks
-from unstructured.partition.pdf import partition_pdf
-from generation import generate_rag_response
-from opensearchpy import OpenSearch
+from async_pipeline import async_generate_rag_response
+from helper import OLLAMA_WARMUP, warm_up_ollama
+from ingest_jobs import get_ingest_queue
+from metrics import METRICS_PORT, start_metrics_server
+from pdf_pages import index_name_for_pdf
+from vector_store import ALL_DOCUMENTS, SHARED_INDEX
 
 # Extract index name from PDF metadata or filename
 def get_index_name_from_pdf(file_path_str):
     tmp_path = file_path_str  # it's already a string path from gr.File
+    return tmp_path, index_name_for_pdf(tmp_path)
 
-    doc = fitz.open(tmp_path)
-    metadata = doc.metadata
-    doc.close()
-
-    title = metadata.get("title")
-    if title and title.strip():
-        index_name = title.strip().lower().replace(" ", "_")
-    else:
-        base_name = os.path.splitext(os.path.basename(tmp_path))[0]
-        index_name = base_name.lower().split('20')[0].replace(" ", "_")
-
-    return tmp_path, index_name
-
-# Check if index already exists
-def index_exists(index_name):
-    client = OpenSearch(
-        hosts=[{"host": "localhost", "port": 9200}],
-        http_auth=("admin", "admin"),
-        use_ssl=False,
-        verify_certs=False
-    )
-    return client.indices.exists(index=index_name)
-
-# Ingest PDF into OpenSearch
-def ingest_pdf(file_path_str, force):
+# Queue PDF ingestion as a background job; re-submitting the same file joins its running job
+def submit_ingestion(file_path_str, force):
     pdf_path, index_name = get_index_name_from_pdf(file_path_str)
+    return get_ingest_queue().submit(pdf_path, index_name, force)
 
-    if force or not index_exists(index_name):
-        # 1. Raw chunks
-        raw_chunks = partition_pdf(
-            filename=pdf_path,
-            strategy="fast",
-            infer_table_structure=True,
-            extract_image_block_types=["Image", "Figure", "Table"],
-            extract_image_block_to_payload=True,
-            chunking_strategy=None,
-        )
-
-        # 2. Process images
-        processed_images = process_images_with_caption(raw_chunks, use_gemini=True)
-
-        # 3. Process tables
-        processed_tables = process_tables_with_description(raw_chunks, use_gemini=True)
-
-        # 4. Re-partition text for semantic chunks
-        text_chunks = partition_pdf(
-            filename=pdf_path,
-            strategy="fast",
-            chunking_strategy="by_title",
-            max_characters=2000,
-            min_chars_to_combine=500,
-            chars_before_new_chunk=1500,
-        )
-        semantic_chunks = create_semantic_chunks(text_chunks)
-
-        # 5. Ingest into OpenSearch
-        ingest_all_content_into_opensearch(
-            processed_images, processed_tables, semantic_chunks, index_name
-        )
-
-        return index_name, "✅ Ingestion completed successfully!"
-    else:
-        return index_name, f"⚠️ Index `{index_name}` already exists. Skipping ingestion."
-
-# Generate RAG answer with streaming
-def answer_query(query, index_name, search_method, model):
+# Generate RAG answer with streaming, on the event loop so concurrent users
+# don't each hold a worker thread for the whole stream
+async def answer_query(query, index_name, search_method, model, all_documents=False):
+    if all_documents:
+        index_name = ALL_DOCUMENTS
     full_response = ""
-    for chunk in generate_rag_response(query, index_name, search_method, 5, model, stream=True):
+    async for chunk in async_generate_rag_response(query, index_name, search_method, 5, model):
         full_response += chunk
         yield full_response + "▌"
     yield full_response
@@ -116,10 +67,15 @@ with gr.Blocks(title="Local QnA RAG", theme="huggingface") as demo:
             with gr.Group():
                 gr.Markdown("#### RAG Search Settings")
                 search_method = gr.Dropdown(
-                    ["semantic", "keyword", "hybrid"],
+                    ["semantic", "keyword", "hybrid", "rrf"],
                     value="hybrid",
                     label="Search Method"
                 )
+                search_all = gr.Checkbox(
+                    label="🌐 Search across all documents",
+                    value=False,
+                    visible=SHARED_INDEX,
+                )
                 model_choice = gr.Dropdown(
                     ["gemini-2.5-flash", "deepseek-r1:1.5b"],
                     value="gemini-2.5-flash",
@@ -141,24 +97,40 @@ with gr.Blocks(title="Local QnA RAG", theme="huggingface") as demo:
     #State variable to hold index name ===
     index_state = gr.State("")
 
-    # Ingestion Logic
-    def handle_ingestion(pdf_input, force_reingest):
+    # Ingestion Logic: poll the background job from the event loop, so a long
+    # ingest holds no worker and the current index stays queryable until it is done
+    async def handle_ingestion(pdf_input, force_reingest, current_index):
         if pdf_input is None:
-            return "", "!!! Please upload a PDF file.", ""
-        index_name, status = ingest_pdf(pdf_input, force_reingest)
-        return index_name, status, index_name
+            yield "", "!!! Please upload a PDF file.", current_index
+            return
+        job = await asyncio.to_thread(submit_ingestion, pdf_input, force_reingest)
+        while job.active:
+            yield job.index_name, job.describe(), current_index
+            await asyncio.sleep(1)
+        yield job.index_name, job.describe(), current_index if job.status == "failed" else job.index_name
 
     ingest_btn.click(
         fn=handle_ingestion,
-        inputs=[pdf_input, force_reingest],
-        outputs=[index_display, ingest_status, index_state]
+        inputs=[pdf_input, force_reingest, index_state],
+        outputs=[index_display, ingest_status, index_state],
+        concurrency_limit=None,
     )
 
     # Query Logic
     query_btn.click(
         fn=answer_query,
-        inputs=[query_input, index_state, search_method, model_choice],
-        outputs=response_output
+        inputs=[query_input, index_state, search_method, model_choice, search_all],
+        outputs=response_output,
+        # Queries are async and wait on I/O, so they need not queue behind each other
+        concurrency_limit=None,
     )
 
-demo.launch()
+# Partition worker processes may re-import this module, so only launch from the main script
+if __name__ == "__main__":
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    if OLLAMA_WARMUP:
+        # Load the models while the UI starts instead of on the first question
+        warm_up_ollama()
+
+    demo.launch()
@@ -0,0 +1,263 @@
+import asyncio
+import json
+import threading
+import time
+
+
+from answer_cache import get_answer_cache, replay_stream
+from context_packer import count_tokens, pack_context
+from embedding import EMBED_URL, get_embedding_cache
+from embedding_models import EMBEDDING_MODEL, reduce_vector
+from generation import GENERATION_CONFIG, OLLAMA_GENERATE_URL, SAFETY_SETTINGS, prompt
+from helper import HTTP_POOL_SIZE, OPENSEARCH_POOL_SIZE, get_gemini_model
+from metrics import incr, observe, span
+from retrieval import answer_cache_embedding, reciprocal_rank_fusion
+from vector_store import (
+    OpenSearchStore,
+    get_store,
+    hybrid_query_body,
+    keyword_and_knn_msearch_body,
+    keyword_query_body,
+    knn_query_body,
+    parse_keyword_and_knn_msearch,
+    resolve_index,
+)
+
+_async_clients = {}
+_async_lock = threading.Lock()
+
+
+def _loop_client(key, factory):
+    # Async clients are bound to the event loop they were created on
+    loop = asyncio.get_running_loop()
+    with _async_lock:
+        client = _async_clients.get((loop, key))
+        if client is None:
+            client = factory()
+            _async_clients[(loop, key)] = client
+    return client
+
+
+def get_async_http_client():
+    """Return the shared keep-alive httpx client for the running event loop."""
+    import httpx
+
+    return _loop_client(
+        "http",
+        lambda: httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, read=None),
+            limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE),
+        ),
+    )
+
+
+def get_async_opensearch_client(host="localhost", port=9200):
+    """Return the shared AsyncOpenSearch client for the running event loop."""
+    from opensearchpy import AsyncOpenSearch
+
+    return _loop_client(
+        ("opensearch", host, port),
+        lambda: AsyncOpenSearch(
+            hosts=[{"host": host, "port": port}],
+            http_compress=True,
+            timeout=30,
+            max_retries=3,
+            retry_on_timeout=True,
+            maxsize=OPENSEARCH_POOL_SIZE,
+        ),
+    )
+
+
+async def async_get_embedding(prompt, model=EMBEDDING_MODEL, use_cache=True):
+    cache = get_embedding_cache() if use_cache else None
+    if cache:
+        # SQLite lookups (and the last_used write on a hit) block, so keep them off the loop
+        cached = (await asyncio.to_thread(cache.get_many, [prompt], model))[0]
+        if cached is not None:
+            incr("embedding_cache_hits", model=model)
+            return cached
+
+    # Same endpoint as ingestion, which returns normalized vectors
+    data = {"model": model, "input": prompt}
+
+    with span("query_embedding", model=model):
+        response = await get_async_http_client().post(EMBED_URL, json=data)
+        response.raise_for_status()
+
+    embedding = response.json()["embeddings"][0]
+    if cache:
+        await asyncio.to_thread(cache.put_many, [prompt], [embedding], model)
+    return embedding
+
+
+async def _opensearch_search(store, index_name, body, doc_id=None):
+    client = get_async_opensearch_client(store.host, store.port)
+    response = await client.search(index=index_name, body=body, routing=doc_id)
+    return response["hits"]["hits"]
+
+
+async def async_search(query_text, search_type="hybrid", top_k=20, indexname:str="pdf_content_index", query_embedding=None):
+    """
+    Async counterpart of the retrieval.*_search functions.
+
+    OpenSearch indices are queried through AsyncOpenSearch; other backends
+    are searched in a worker thread.
+    A given `query_embedding` must come from EMBEDDING_MODEL at its native
+    dimension; it is re-embedded or reduced to match the index as needed.
+
+    Returns:
+        list: Search results
+    """
+    index_name, doc_id = resolve_index(indexname)
+    store = get_store(index_name)
+
+    with span("search", search_type=search_type, path="async") as search_span:
+        try:
+            if search_type != "keyword":
+                config = await asyncio.to_thread(store.embedding_config, index_name)
+                if query_embedding is None or config["model"] != EMBEDDING_MODEL:
+                    query_embedding = await async_get_embedding(query_text, model=config["model"])
+                if config["reduction"] != "none":
+                    projection = await asyncio.to_thread(store.projection, index_name)
+                    query_embedding = reduce_vector(config, query_embedding, projection)
+
+            if not isinstance(store, OpenSearchStore):
+                if search_type == "keyword":
+                    return await asyncio.to_thread(store.keyword_search, index_name, query_text, top_k, doc_id=doc_id)
+                if search_type == "semantic":
+                    return await asyncio.to_thread(store.knn_search, index_name, query_embedding, top_k, doc_id=doc_id)
+                if search_type == "rrf":
+                    keyword_hits, semantic_hits, _ = await asyncio.to_thread(
+                        store.keyword_and_knn_search, index_name, query_text, query_embedding, max(50, top_k), doc_id=doc_id
+                    )
+                    return reciprocal_rank_fusion([keyword_hits, semantic_hits])[:top_k]
+                return await asyncio.to_thread(store.hybrid_search, index_name, query_text, query_embedding, top_k, doc_id=doc_id)
+
+            profile = await asyncio.to_thread(store.index_profile, index_name)
+            if search_type == "keyword":
+                return await _opensearch_search(store, index_name, keyword_query_body(query_text, top_k, doc_id=doc_id), doc_id)
+            if search_type == "semantic":
+                return await _opensearch_search(store, index_name, knn_query_body(query_embedding, top_k, doc_id=doc_id, profile=profile), doc_id)
+            if search_type == "rrf":
+                client = get_async_opensearch_client(store.host, store.port)
+                body = keyword_and_knn_msearch_body(
+                    index_name, query_text, query_embedding, max(50, top_k), doc_id=doc_id, profile=profile
+                )
+                keyword_hits, semantic_hits, _ = parse_keyword_and_knn_msearch(await client.msearch(body=body))
+                return reciprocal_rank_fusion([keyword_hits, semantic_hits])[:top_k]
+            return await _opensearch_search(store, index_name, hybrid_query_body(query_text, query_embedding, top_k, doc_id=doc_id, profile=profile), doc_id)
+        except Exception as e:
+            print(f"Async {search_type} search error: {e}")
+            search_span.add("errors")
+            if search_type not in ("hybrid", "rrf"):
+                return []
+
+    # Fall back to keyword search, as retrieval.hybrid_search and rrf_search do
+    return await async_search(query_text, "keyword", top_k, indexname)
+
+
+async def async_generate_with_gemini(prompt_text, model_name="gemini-2.5-flash"):
+    try:
+        model = await asyncio.to_thread(get_gemini_model, model_name)
+        response = await model.generate_content_async(
+            contents=prompt_text,
+            generation_config=GENERATION_CONFIG,
+            safety_settings=SAFETY_SETTINGS,
+            stream=True,
+        )
+        async for chunk in response:
+            if hasattr(chunk, "text"):
+                if chunk.text:
+                    yield chunk.text
+            elif hasattr(chunk, "parts"):
+                for part in chunk.parts:
+                    if hasattr(part, "text") and part.text:
+                        yield part.text
+    except Exception as e:
+        error_msg = f"Error with Gemini generation: {str(e)}"
+        print(error_msg)
+        yield error_msg
+
+
+async def async_generate_with_ollama(prompt_text, model_name="deepseek-r1:1.5b"):
+    data = {
+        "model": model_name,
+        "prompt": prompt_text,
+        "stream": True,
+        "options": {"temperature": 0.7},
+    }
+
+    try:
+        async with get_async_http_client().stream("POST", OLLAMA_GENERATE_URL, json=data) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line:
+                    try:
+                        chunk = json.loads(line)
+                        if "response" in chunk:
+                            yield chunk["response"]
+                    except json.JSONDecodeError:
+                        continue
+    except Exception as e:
+        yield f"Error generating response with Ollama: {str(e)}"
+
+
+async def async_generate_rag_response(
+    query, index_name:str="pdf_content_index", search_type="hybrid", top_k=5, model_type="gemini-2.5-flash",
+    use_cache=True
+):
+    """
+    Stream a RAG response as an async generator.
+    Same steps and arguments as generation.generate_rag_response with stream=True.
+    """
+    started = time.perf_counter()
+    try:
+        # Step 0: Serve repeated questions from the answer cache. The query is
+        # only embedded for a near-match lookup, with the index's model, in a
+        # worker thread like the other blocking calls
+        answer_cache = get_answer_cache()
+        query_embedding = lambda: answer_cache_embedding(index_name, query)
+
+        if use_cache:
+            cached_answer = await asyncio.to_thread(
+                answer_cache.get, index_name, model_type, search_type, top_k, query, query_embedding
+            )
+            if cached_answer is not None:
+                print("Answer cache hit")
+                incr("answer_cache_hits", model=model_type)
+                for piece in replay_stream(cached_answer):
+                    yield piece
+                return
+            incr("answer_cache_misses", model=model_type)
+
+        # Step 1: Retrieve relevant chunks
+        results = await async_search(query, search_type, top_k, index_name)
+        if not results:
+            yield "No relevant information found. Please try a different search type or refine your question."
+            return
+
+        # Step 2-3: Pack contexts and format the prompt
+        prompt_text, _ = pack_context(results, query, model_type, prompt)
+
+        # Step 4: Stream the response from the selected model
+        if model_type == "gemini-2.5-flash":
+            generator = async_generate_with_gemini(prompt_text)
+        else:  # ollama
+            generator = async_generate_with_ollama(prompt_text)
+
+        with span("generation", model=model_type, path="async") as generation_span:
+            pieces = []
+            async for chunk in generator:
+                if not pieces:
+                    observe("time_to_first_token", time.perf_counter() - started, model=model_type, path="async")
+                pieces.append(chunk)
+                yield chunk
+            answer = "".join(pieces)
+            generation_span.add("output_tokens", count_tokens(answer, model_type))
+
+        # Step 5: Cache successful answers for repeated questions
+        if use_cache and answer and not answer.startswith("Error"):
+            await asyncio.to_thread(answer_cache.put, index_name, model_type, search_type, top_k, query, answer, query_embedding)
+
+    except Exception as e:
+        yield f"Error in RAG process: {str(e)}"
@@ -0,0 +1,249 @@
+import argparse
+import glob
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+# Settings are read from the environment when the project modules are imported, so .env goes first
+load_dotenv()
+
+from embedding_models import EMBEDDING_MODELS, embedding_config
+from ingestion import ingest_pdf_file
+from pdf_pages import index_name_for_filename, index_name_for_pdf, page_count
+from vector_store import SHARED_INDEX, SHARED_INDEX_NAME, existing_index_names, get_store
+
+CHECKPOINT_PATH = os.getenv("INGEST_CHECKPOINT_PATH", ".cache/ingest_checkpoint.sqlite")
+
+
+class IngestCheckpoint:
+    """
+    SQLite record of every document in a batch ingest and the stage it reached.
+
+    A document is "pending", "running" (with the stage it was in), "done"
+    or "failed". Rows survive a crash, so a restarted batch skips finished
+    documents and redoes interrupted ones.
+    """
+
+    def __init__(self, path=CHECKPOINT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "path TEXT PRIMARY KEY, index_name TEXT NOT NULL, status TEXT NOT NULL, stage TEXT, "
+            "size INTEGER, mtime REAL, pages INTEGER, chunks INTEGER, attempts INTEGER NOT NULL DEFAULT 0, "
+            "completed_once INTEGER NOT NULL DEFAULT 0, error TEXT, seconds REAL, updated_at REAL)"
+        )
+        self._conn.commit()
+
+    def get(self, path):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM documents WHERE path = ?", (path,)).fetchone()
+        return dict(row) if row else None
+
+    def index_names(self):
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT index_name FROM documents")}
+
+    def add(self, path, index_name):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO documents (path, index_name, status, updated_at) VALUES (?, ?, 'pending', ?)",
+                (path, index_name, time.time()),
+            )
+            self._conn.commit()
+
+    def update(self, path, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE documents SET {assignments} WHERE path = ?", (*fields.values(), path))
+            self._conn.commit()
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM documents GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+def find_pdfs(sources):
+    """Expand directories (recursively) and glob patterns into a sorted list of PDF paths."""
+    paths = set()
+    for source in sources:
+        if os.path.isdir(source):
+            matches = glob.glob(os.path.join(source, "**", "*.pdf"), recursive=True)
+        else:
+            matches = glob.glob(source, recursive=True)
+        paths.update(os.path.abspath(path) for path in matches if path.lower().endswith(".pdf"))
+    return sorted(paths)
+
+
+def _file_state(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
+
+
+def plan(checkpoint, paths, max_attempts, backend=None):
+    """
+    Register new documents and decide how each one is ingested this run.
+    New documents get a name not used by another document in the checkpoint
+    or by an index (or shared-index document) already in the store.
+
+    Returns:
+        list: (path, incremental) for documents to ingest, in path order
+    """
+    taken = None
+    jobs = []
+    for path in paths:
+        row = checkpoint.get(path)
+        if row is None:
+            if taken is None:
+                # Names in the checkpoint and in the store, fetched once for all new documents
+                taken = checkpoint.index_names() | existing_index_names(backend)
+            try:
+                base_name = index_name_for_pdf(path)
+            except Exception as e:
+                # Unreadable files still get a row, and fail when ingested
+                print(f"Could not read metadata of {path}: {e}")
+                base_name = index_name_for_filename(path)
+            # Documents sharing a title or filename prefix get a numbered suffix
+            index_name, suffix = base_name, 2
+            while index_name in taken:
+                index_name, suffix = f"{base_name}_{suffix}", suffix + 1
+            taken.add(index_name)
+            checkpoint.add(path, index_name)
+            jobs.append((path, False))
+            continue
+
+        size, mtime = _file_state(path)
+        if row["status"] == "done" and (row["size"], row["mtime"]) == (size, mtime):
+            continue
+        if row["status"] == "failed" and row["attempts"] >= max_attempts:
+            continue
+        # A document interrupted while indexing may have partial pages, so
+        # only documents that stopped before indexing are updated in place
+        jobs.append((path, bool(row["completed_once"]) and row["stage"] != "index"))
+    return jobs
+
+
+def ingest_document(checkpoint, path, incremental, **kwargs):
+    row = checkpoint.get(path)
+    size, mtime = _file_state(path)
+    checkpoint.update(path, status="running", stage=None, size=size, mtime=mtime,
+                      attempts=row["attempts"] + 1, error=None)
+
+    start = time.perf_counter()
+    try:
+        pages = page_count(path)
+        checkpoint.update(path, pages=pages)
+        chunks = ingest_pdf_file(
+            path, row["index_name"], incremental=incremental,
+            on_stage=lambda stage: checkpoint.update(path, stage=stage), **kwargs
+        )
+    except Exception as e:
+        checkpoint.update(path, status="failed", error=str(e), seconds=time.perf_counter() - start)
+        raise
+
+    checkpoint.update(path, status="done", stage=None, chunks=chunks, completed_once=1,
+                      seconds=time.perf_counter() - start)
+    return pages, chunks
+
+
+def _format_eta(seconds):
+    hours, rest = divmod(int(seconds), 3600)
+    return f"{hours}h{rest // 60:02d}m" if hours else f"{rest // 60}m{rest % 60:02d}s"
+
+
+def run_batch(sources, checkpoint_path=CHECKPOINT_PATH, workers=4, max_attempts=3, **kwargs):
+    """
+    Ingest every PDF under `sources` with `workers` documents in flight.
+
+    Args:
+        sources (list): Directories and glob patterns
+        checkpoint_path (str): SQLite checkpoint file; reuse it to resume
+        workers (int): Documents ingested concurrently
+        max_attempts (int): Attempts per document across runs before it is left as failed
+        **kwargs: Passed on to ingestion.ingest_pdf_file
+
+    Returns:
+        dict: Document counts per status
+    """
+    checkpoint = IngestCheckpoint(checkpoint_path)
+    paths = find_pdfs(sources)
+    jobs = plan(checkpoint, paths, max_attempts, kwargs.get("backend"))
+    print(f"Found {len(paths)} PDFs, {len(jobs)} to ingest ({len(paths) - len(jobs)} already done or given up)")
+    if not jobs:
+        return checkpoint.counts()
+
+    if SHARED_INDEX:
+        # Create the shared index once, before workers race to create it
+        get_store(SHARED_INDEX_NAME, kwargs.get("backend")).create_index(
+            SHARED_INDEX_NAME, recreate=False, shared=True, profile=kwargs.get("profile"), embedding=kwargs.get("embedding")
+        )
+
+    start = time.perf_counter()
+    finished = failed = total_pages = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(ingest_document, checkpoint, path, incremental, **kwargs): path for path, incremental in jobs}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                pages, chunks = future.result()
+                total_pages += pages
+                outcome = f"{pages} pages, {chunks} chunks"
+            except Exception as e:
+                failed += 1
+                outcome = f"FAILED: {e}"
+            finished += 1
+
+            elapsed = time.perf_counter() - start
+            remaining = len(jobs) - finished
+            print(
+                f"[{finished}/{len(jobs)}] {os.path.basename(path)}: {outcome} | "
+                f"{finished / elapsed * 60:.1f} docs/min, {total_pages / elapsed:.1f} pages/sec, "
+                f"{failed} failed | ETA {_format_eta(elapsed / finished * remaining)}"
+            )
+
+    counts = checkpoint.counts()
+    print(f"Batch finished in {_format_eta(time.perf_counter() - start)}: {counts}")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest directories or globs of PDFs, resuming from a checkpoint.")
+    parser.add_argument("sources", nargs="+", help="Directories (searched recursively) or glob patterns")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="Checkpoint file; rerun with the same file to resume")
+    parser.add_argument("--workers", type=int, default=4, help="Documents ingested concurrently")
+    parser.add_argument("--partition-workers", type=int, help="Partition processes per document (default: cores / workers)")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Attempts per document before giving up")
+    parser.add_argument("--strategy", default="fast", help="partition_pdf strategy")
+    parser.add_argument("--no-gemini", action="store_true", help="Skip image and table descriptions")
+    parser.add_argument("--backend", choices=["opensearch", "local"], help="Vector store backend")
+    parser.add_argument("--profile", help="ANN index profile for new indices")
+    parser.add_argument("--bulk-load", action="store_true", help="Index with the OpenSearch bulk-load mode")
+    parser.add_argument("--embedding-model", choices=sorted(EMBEDDING_MODELS), help="Embedding model for new indices")
+    parser.add_argument("--embedding-dimension", type=int, help="Stored vector dimension for new indices (default: native)")
+    parser.add_argument("--reduction", choices=["truncate", "pca"], help="How vectors are reduced to --embedding-dimension")
+    args = parser.parse_args()
+
+    run_batch(
+        args.sources,
+        checkpoint_path=args.checkpoint,
+        workers=args.workers,
+        max_attempts=args.max_attempts,
+        strategy=args.strategy,
+        use_gemini=not args.no_gemini,
+        backend=args.backend,
+        profile=args.profile,
+        bulk_load=args.bulk_load,
+        embedding=embedding_config(args.embedding_model, args.embedding_dimension, args.reduction),
+        partition_workers=args.partition_workers or max(1, (os.cpu_count() or 1) // args.workers),
+    )
@@ -0,0 +1,96 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from index_profiles import INDEX_PROFILES, bytes_per_vector
+from vector_store import OpenSearchStore
+
+DIMENSION = 768
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def load_vectors(store, args, rng):
+    """Corpus vectors scrolled from an existing index, or random ones."""
+    if not args.source_index:
+        return rng.normal(size=(args.vectors, DIMENSION)).astype(np.float32)
+
+    vectors = []
+    response = store.client.search(
+        index=args.source_index, body={"size": 500, "_source": ["embedding"]}, scroll="2m"
+    )
+    while response["hits"]["hits"] and len(vectors) < args.vectors:
+        vectors.extend(hit["_source"]["embedding"] for hit in response["hits"]["hits"])
+        response = store.client.scroll(scroll_id=response["_scroll_id"], scroll="2m")
+    store.client.clear_scroll(scroll_id=response["_scroll_id"])
+    return np.asarray(vectors[:args.vectors], dtype=np.float32)
+
+
+def exact_neighbours(vectors, queries, top_k):
+    # Ground truth by brute-force l2 distance
+    distances = (queries ** 2).sum(1)[:, None] - 2 * queries @ vectors.T + (vectors ** 2).sum(1)[None, :]
+    return np.argsort(distances, axis=1)[:, :top_k]
+
+
+def measure(store, index_name, queries, truth, top_k):
+    latencies = []
+    recalls = []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        hits = store.knn_search(index_name, query.tolist(), top_k, source_fields=["content"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        found = {int(hit["_source"]["content"]) for hit in hits}
+        recalls.append(len(found & set(expected.tolist())) / top_k)
+    return latencies, recalls
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall, latency and vector memory of each ANN index profile.")
+    parser.add_argument("--profiles", default=",".join(INDEX_PROFILES), help="Comma-separated profile names")
+    parser.add_argument("--source-index", help="Take corpus vectors from this index instead of random ones")
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    store = OpenSearchStore()
+    vectors = load_vectors(store, args, rng)
+    queries = rng.normal(size=(args.queries, DIMENSION)).astype(np.float32)
+    if args.source_index:
+        # Real queries sit near the corpus, so perturb stored vectors
+        picks = vectors[rng.integers(len(vectors), size=args.queries)]
+        queries = picks + 0.1 * rng.normal(size=picks.shape).astype(np.float32)
+
+    for name in args.profiles.split(","):
+        index_name = f"bench_profile_{name}"
+        corpus, query_set = vectors, queries
+        if INDEX_PROFILES[name]["data_type"] == "byte":
+            # Byte profiles compare unit-normalized vectors, so the ground truth must too
+            corpus = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+            query_set = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        truth = exact_neighbours(corpus, query_set, args.top_k)
+
+        store.create_index(index_name, recreate=True, profile=name)
+        chunks = ({"content": str(i), "content_type": "text", "embedding": vector.tolist()} for i, vector in enumerate(vectors))
+        start = time.perf_counter()
+        store.index_chunks(index_name, chunks)
+        store.client.indices.refresh(index=index_name)
+        build_seconds = time.perf_counter() - start
+
+        latencies, recalls = measure(store, index_name, queries, truth, args.top_k)
+        print(
+            f"{name:>11}: recall@{args.top_k} {statistics.mean(recalls):.3f}, "
+            f"p50 {statistics.median(latencies):.2f}ms, p95 {percentile(latencies, 95):.2f}ms, "
+            f"{bytes_per_vector(name, DIMENSION)} bytes/vector, indexed in {build_seconds:.1f}s"
+        )
+        store.delete_index(index_name)
@@ -0,0 +1,119 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding import get_embeddings
+from embedding_models import EMBEDDING_MODEL, embedding_config, fit_projection, get_model, reduce_vectors
+from index_profiles import bytes_per_vector
+from vector_store import LocalStore, OpenSearchStore
+
+
+def load_texts(args):
+    """Chunk contents of an existing index, or lines of a text file."""
+    if args.texts_file:
+        with open(args.texts_file) as f:
+            return [line.strip() for line in f if line.strip()][:args.limit]
+
+    if args.backend == "local":
+        sources = LocalStore()._load(args.source_index).sources
+        return [source["content"] for source in sources if source.get("content")][:args.limit]
+
+    store = OpenSearchStore()
+    texts = []
+    response = store.client.search(index=args.source_index, body={"size": 500, "_source": ["content"]}, scroll="2m")
+    while response["hits"]["hits"] and len(texts) < args.limit:
+        texts.extend(hit["_source"]["content"] for hit in response["hits"]["hits"] if hit["_source"].get("content"))
+        response = store.client.scroll(scroll_id=response["_scroll_id"], scroll="2m")
+    store.client.clear_scroll(scroll_id=response["_scroll_id"])
+    return texts[:args.limit]
+
+
+def load_queries(args, texts, rng):
+    """Questions from a file, or the opening words of random chunks."""
+    if args.queries_file:
+        with open(args.queries_file) as f:
+            return [line.strip() for line in f if line.strip()]
+    picks = rng.choice(len(texts), size=min(args.queries, len(texts)), replace=False)
+    return [" ".join(texts[i].split()[:12]) for i in picks]
+
+
+def embed(texts, model):
+    embeddings = get_embeddings(texts, model=model)
+    kept = [i for i, embedding in enumerate(embeddings) if embedding is not None]
+    return np.asarray([embeddings[i] for i in kept], dtype=np.float32), kept
+
+
+def unit(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def top_k(corpus, queries, k):
+    """Brute-force cosine kNN (both sides unit-normalized), with the mean latency per query in ms."""
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        scores = corpus @ query
+        best = np.argpartition(-scores, k - 1)[:k]
+        results.append(set(best.tolist()))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, statistics.mean(latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recall, memory and kNN latency of embeddings reduced by Matryoshka truncation or PCA, "
+                    "against the model's native dimension."
+    )
+    parser.add_argument("--source-index", default="pdf_content_index", help="Index whose chunk contents are re-embedded")
+    parser.add_argument("--backend", choices=["opensearch", "local"], default="opensearch")
+    parser.add_argument("--texts-file", help="Embed the lines of this file instead of an index")
+    parser.add_argument("--queries-file", help="One query per line (default: opening words of random chunks)")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--dimensions", help="Comma-separated dimensions (default: the model's Matryoshka dimensions)")
+    parser.add_argument("--fit-samples", type=int, default=2048, help="Chunks the PCA projection is fitted on")
+    parser.add_argument("--limit", type=int, default=20000, help="Maximum chunks embedded")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--profile", default="default", help="ANN profile used for the bytes/vector estimate")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    native = get_model(args.model)["dimension"]
+    dimensions = [int(value) for value in args.dimensions.split(",")] if args.dimensions else get_model(args.model)["matryoshka_dimensions"]
+
+    texts = load_texts(args)
+    queries = load_queries(args, texts, rng)
+    corpus, _ = embed(texts, args.model)
+    query_vectors, _ = embed(queries, args.model)
+    print(f"{len(corpus)} chunks and {len(query_vectors)} queries embedded with {args.model} ({native} dimensions)")
+
+    truth, native_ms = top_k(unit(corpus), unit(query_vectors), args.top_k)
+    print(
+        f"{'native':>8} {native:>5}: recall@{args.top_k} 1.000, {bytes_per_vector(args.profile, native)} bytes/vector, "
+        f"{native_ms:.3f}ms/query"
+    )
+
+    for dimension in dimensions:
+        for reduction in ("truncate", "pca"):
+            config = embedding_config(args.model, dimension, reduction)
+            projection = None
+            if reduction == "pca":
+                sample = corpus[rng.permutation(len(corpus))[:args.fit_samples]]
+                projection = fit_projection(sample, dimension)
+            reduced = np.asarray(reduce_vectors(config, corpus, projection), dtype=np.float32)
+            reduced_queries = np.asarray(reduce_vectors(config, query_vectors, projection), dtype=np.float32)
+
+            found, ms = top_k(reduced, reduced_queries, args.top_k)
+            recall = statistics.mean(len(f & t) / args.top_k for f, t in zip(found, truth))
+            print(
+                f"{reduction:>8} {dimension:>5}: recall@{args.top_k} {recall:.3f}, "
+                f"{bytes_per_vector(args.profile, dimension)} bytes/vector, {ms:.3f}ms/query"
+            )
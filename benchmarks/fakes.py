@@ -0,0 +1,190 @@
+"""
+Local stand-ins for the external services, so benchmarks run offline and
+repeatably: an Ollama-compatible HTTP server and a Gemini model object.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+DIMENSION = 768
+
+
+def fake_embedding(text, dimension=DIMENSION):
+    """Deterministic unit vector for `text`, so identical texts embed identically."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).normal(size=dimension)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def fake_answer(prompt_text, tokens=64):
+    words = prompt_text.split()[-tokens:] or ["answer"]
+    return [word + " " for word in words]
+
+
+class FakeOllamaServer:
+    """
+    Ollama-compatible server for /api/embed, /api/embeddings and /api/generate.
+
+    Args:
+        embed_latency (float): Seconds per embedding request
+        per_text_latency (float): Extra seconds per text in a batch request
+        first_token_latency (float): Seconds before the first generated token
+        token_latency (float): Seconds between generated tokens
+    """
+
+    def __init__(self, embed_latency=0.02, per_text_latency=0.002, first_token_latency=0.2, token_latency=0.01):
+        self.embed_latency = embed_latency
+        self.per_text_latency = per_text_latency
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.requests = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                server.requests += 1
+                data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                path = self.path.rstrip("/")
+
+                if path == "/api/embed":
+                    texts = data.get("input", [])
+                    texts = [texts] if isinstance(texts, str) else texts
+                    time.sleep(server.embed_latency + server.per_text_latency * len(texts))
+                    self._send_json({"embeddings": [fake_embedding(text) for text in texts]})
+                elif path == "/api/embeddings":
+                    time.sleep(server.embed_latency + server.per_text_latency)
+                    self._send_json({"embedding": fake_embedding(data.get("prompt", ""))})
+                elif path == "/api/generate":
+                    self._generate(data)
+                else:
+                    self.send_error(404)
+
+            def _generate(self, data):
+                tokens = fake_answer(data.get("prompt", ""))
+                time.sleep(server.first_token_latency)
+                if not data.get("stream", True):
+                    time.sleep(server.token_latency * len(tokens))
+                    self._send_json({"response": "".join(tokens), "done": True})
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i, token in enumerate(tokens):
+                    if i:
+                        time.sleep(server.token_latency)
+                    self._write_chunk(json.dumps({"response": token, "done": False}) + "\n")
+                self._write_chunk(json.dumps({"response": "", "done": True}) + "\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, text):
+                payload = text.encode("utf-8")
+                self.wfile.write(f"{len(payload):x}\r\n".encode("ascii") + payload + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+class _FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """
+    Stand-in for genai.GenerativeModel with the same generate_content and
+    generate_content_async call shapes used in this repo.
+    """
+
+    first_token_latency = 0.3
+    token_latency = 0.01
+    caption_latency = 0.5
+    item_latency = 0.0  # extra seconds per table described in a batched request
+
+    def __init__(self, model_name="gemini-2.5-flash", **kwargs):
+        self.model_name = model_name
+
+    def _prompt_text(self, contents):
+        parts = contents if isinstance(contents, list) else [contents]
+        return " ".join(part for part in parts if isinstance(part, str))
+
+    def generate_content(self, contents=None, generation_config=None, safety_settings=None, stream=False):
+        text = self._prompt_text(contents)
+        if not stream:
+            # Captions and table descriptions arrive as one response
+            numbers = re.findall(r"Table (\d+) in HTML format", text) if "JSON object" in text else []
+            time.sleep(self.caption_latency + self.item_latency * max(1, len(numbers)))
+            if numbers:
+                return _FakeChunk(json.dumps({number: f"Description of table {number}" for number in numbers}))
+            return _FakeChunk("".join(fake_answer(text)))
+        return self._stream(text)
+
+    def _stream(self, text):
+        time.sleep(self.first_token_latency)
+        for i, token in enumerate(fake_answer(text)):
+            if i:
+                time.sleep(self.token_latency)
+            yield _FakeChunk(token)
+
+    async def generate_content_async(self, contents=None, generation_config=None, safety_settings=None, stream=False):
+        text = self._prompt_text(contents)
+        if not stream:
+            await asyncio.sleep(self.caption_latency)
+            return _FakeChunk("".join(fake_answer(text)))
+        return self._astream(text)
+
+    async def _astream(self, text):
+        await asyncio.sleep(self.first_token_latency)
+        for i, token in enumerate(fake_answer(text)):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            yield _FakeChunk(token)
+
+
+def install_fake_gemini(first_token_latency=0.3, token_latency=0.01, caption_latency=0.5):
+    """Route every genai.GenerativeModel in this process to FakeGeminiModel."""
+    import google.generativeai as genai
+
+    FakeGeminiModel.first_token_latency = first_token_latency
+    FakeGeminiModel.token_latency = token_latency
+    FakeGeminiModel.caption_latency = caption_latency
+    genai.GenerativeModel = FakeGeminiModel
+    genai.configure = lambda **kwargs: None
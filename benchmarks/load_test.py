@@ -0,0 +1,73 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from async_pipeline import async_generate_rag_response
+from generation import generate_rag_response
+
+
+def run_sync_stream(args, started):
+    first_token = None
+    for _ in generate_rag_response(
+        args.query, args.index, args.search, args.top_k, args.model, stream=True, use_cache=False
+    ):
+        if first_token is None:
+            first_token = time.perf_counter() - started
+    return first_token, time.perf_counter() - started
+
+
+async def run_async_stream(args, started):
+    first_token = None
+    async for _ in async_generate_rag_response(
+        args.query, args.index, args.search, args.top_k, args.model, use_cache=False
+    ):
+        if first_token is None:
+            first_token = time.perf_counter() - started
+    return first_token, time.perf_counter() - started
+
+
+def report(name, results, elapsed):
+    first_tokens = [first for first, _ in results if first is not None]
+    totals = [total for _, total in results]
+    print(
+        f"{name:>6}: {len(results)} streams in {elapsed:.2f}s "
+        f"({len(results) / elapsed:.2f} streams/sec), "
+        f"mean time-to-first-token {statistics.mean(first_tokens):.2f}s, "
+        f"mean stream time {statistics.mean(totals):.2f}s"
+    )
+
+
+def load_test_sync(args):
+    # Mirrors a thread-per-request server with a fixed worker pool
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(run_sync_stream, args, started) for _ in range(args.concurrency)]
+        results = [future.result() for future in futures]
+    report("sync", results, time.perf_counter() - started)
+
+
+async def load_test_async(args):
+    started = time.perf_counter()
+    results = await asyncio.gather(*(run_async_stream(args, started) for _ in range(args.concurrency)))
+    report("async", results, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare concurrent streaming answers on the sync and async query paths.")
+    parser.add_argument("--index", default="pdf_content_index")
+    parser.add_argument("--query", default="What is attention?")
+    parser.add_argument("--search", default="hybrid", choices=["keyword", "semantic", "hybrid", "rrf"])
+    parser.add_argument("--model", default="gemini-2.5-flash")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=32, help="Number of simultaneous streams")
+    parser.add_argument("--workers", type=int, default=8, help="Worker threads for the sync path")
+    args = parser.parse_args()
+
+    load_test_sync(args)
+    asyncio.run(load_test_async(args))
@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fakes import FakeOllamaServer, install_fake_gemini
+
+QUERIES = [
+    "What is attention?",
+    "How does multi-head attention work?",
+    "What is the encoder architecture?",
+    "Which optimizer was used for training?",
+    "How are positional encodings computed?",
+    "What BLEU score does the model reach?",
+    "Why use self-attention instead of recurrence?",
+    "What is retrieval augmented generation?",
+]
+SEARCH_TYPES = ["keyword", "semantic", "hybrid", "rrf"]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def summarize(latencies_ms):
+    return {
+        "count": len(latencies_ms),
+        "mean_ms": statistics.mean(latencies_ms),
+        "p50_ms": percentile(latencies_ms, 50),
+        "p95_ms": percentile(latencies_ms, 95),
+        "p99_ms": percentile(latencies_ms, 99),
+    }
+
+
+def timed(results, stage, pages, func, *args, **kwargs):
+    start = time.perf_counter()
+    output = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    results[stage] = {"seconds": seconds, "pages_per_sec": pages / seconds if seconds else None}
+    print(f"{stage:>10}: {seconds:.2f}s ({pages / seconds if seconds else 0:.1f} pages/sec)")
+    return output
+
+
+def bench_ingest(args, index_name):
+    """Run the ingest stages one after another, so each is timed on its own."""
+    from chunking import chunk_elements_by_title, create_semantic_chunks, process_images_with_caption, process_tables_with_description
+    from ingestion import partition_pdf_pages, prepare_chunks_for_ingestion
+    from pdf_pages import fingerprint_pages
+    from vector_store import get_store
+
+    results = {}
+    pages = len(fingerprint_pages(args.pdf))
+    raw_chunks = timed(results, "partition", pages, partition_pdf_pages, args.pdf, None, args.strategy)
+    images = timed(results, "images", pages, process_images_with_caption, raw_chunks, rate=args.caption_rate)
+    tables = timed(results, "tables", pages, process_tables_with_description, raw_chunks, rate=args.caption_rate)
+    text_chunks = timed(results, "chunking", pages, lambda: create_semantic_chunks(chunk_elements_by_title(raw_chunks)))
+    prepared = timed(results, "embedding", pages, prepare_chunks_for_ingestion, images + tables + text_chunks)
+
+    store = get_store(index_name, "local")
+    store.create_index(index_name)
+    timed(results, "indexing", pages, store.index_chunks, index_name, prepared)
+
+    total = sum(stage["seconds"] for stage in results.values())
+    results["total"] = {"seconds": total, "pages_per_sec": pages / total}
+    results["pages"] = pages
+    results["chunks"] = len(prepared)
+    return results
+
+
+def bench_queries(args, index_name):
+    from helper import get_embedding
+    from retrieval import hybrid_search, keyword_search, rrf_search, semantic_search
+
+    search = {"keyword": keyword_search, "semantic": semantic_search, "hybrid": hybrid_search, "rrf": rrf_search}
+    # Embed every query once up front, so the latencies cover retrieval only
+    for query in QUERIES:
+        get_embedding(query)
+
+    results = {}
+    for search_type in SEARCH_TYPES:
+        latencies = []
+        for i in range(args.queries):
+            start = time.perf_counter()
+            search[search_type](QUERIES[i % len(QUERIES)], top_k=args.top_k, indexname=index_name)
+            latencies.append((time.perf_counter() - start) * 1000)
+        results[search_type] = summarize(latencies)
+        print(f"{search_type:>10}: p50 {results[search_type]['p50_ms']:.2f}ms, p95 {results[search_type]['p95_ms']:.2f}ms, p99 {results[search_type]['p99_ms']:.2f}ms")
+    return results
+
+
+def _stream_timings(first_tokens, totals):
+    return {"time_to_first_token": summarize(first_tokens), "total": summarize(totals)}
+
+
+def bench_generation(args, index_name):
+    from async_pipeline import async_generate_rag_response
+    from generation import generate_rag_response
+
+    async def async_streams(model):
+        timings = []
+        for i in range(args.generations):
+            started = time.perf_counter()
+            first_token = None
+            async for _ in async_generate_rag_response(QUERIES[i % len(QUERIES)], index_name, "hybrid", args.top_k, model, use_cache=False):
+                if first_token is None:
+                    first_token = (time.perf_counter() - started) * 1000
+            timings.append((first_token, (time.perf_counter() - started) * 1000))
+        return timings
+
+    results = {}
+    for model in ("gemini-2.5-flash", "deepseek-r1:1.5b"):
+        first_tokens, totals = [], []
+        for i in range(args.generations):
+            started = time.perf_counter()
+            first_token = None
+            for _ in generate_rag_response(QUERIES[i % len(QUERIES)], index_name, "hybrid", args.top_k, model, stream=True, use_cache=False):
+                if first_token is None:
+                    first_token = (time.perf_counter() - started) * 1000
+            first_tokens.append(first_token)
+            totals.append((time.perf_counter() - started) * 1000)
+        results[f"{model} sync"] = _stream_timings(first_tokens, totals)
+
+        timings = asyncio.run(async_streams(model))
+        results[f"{model} async"] = _stream_timings([first for first, _ in timings], [total for _, total in timings])
+
+    for name, timing in results.items():
+        print(f"{name:>23}: time-to-first-token p50 {timing['time_to_first_token']['p50_ms']:.0f}ms, p95 {timing['time_to_first_token']['p95_ms']:.0f}ms")
+    return results
+
+
+def compare(current, baseline_path):
+    """Print the relative change of every latency and throughput against an earlier run."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    def walk(new, old, path):
+        for key, value in new.items():
+            if isinstance(value, dict) and isinstance(old.get(key), dict):
+                walk(value, old[key], f"{path}{key}.")
+            elif key.endswith(("_ms", "seconds", "per_sec")) and old.get(key):
+                print(f"{path}{key}: {old[key]:.2f} -> {value:.2f} ({(value - old[key]) / old[key]:+.1%})")
+
+    print(f"\nCompared with {baseline_path}:")
+    for section in ("ingest", "query", "generation"):
+        walk(current[section], baseline.get(section, {}), f"{section}.")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline ingest, query and generation benchmarks against local service stand-ins.")
+    parser.add_argument("--pdf", default=os.path.join(ROOT, "files", "attention2017.pdf"))
+    parser.add_argument("--strategy", default="fast", help="partition_pdf strategy")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per search type")
+    parser.add_argument("--generations", type=int, default=10, help="Streamed answers per model and path")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--caption-rate", type=float, default=50.0, help="Gemini requests/sec allowed while captioning")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="Seconds per fake Ollama embed request")
+    parser.add_argument("--first-token-latency", type=float, default=0.2, help="Seconds before the first fake Ollama token")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Seconds between fake tokens")
+    parser.add_argument("--gemini-first-token-latency", type=float, default=0.3, help="Seconds before the first fake Gemini token")
+    parser.add_argument("--caption-latency", type=float, default=0.5, help="Seconds per fake Gemini caption")
+    parser.add_argument("--output", help="JSON results path (default benchmarks/results/offline-<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    ollama = FakeOllamaServer(
+        embed_latency=args.embed_latency,
+        first_token_latency=args.first_token_latency,
+        token_latency=args.token_latency,
+    ).start()
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+
+    # Service endpoints and caches are read from the environment at import time
+    os.environ.update({
+        "OLLAMA_BASE_URL": ollama.url,
+        "VECTOR_STORE_BACKEND": "local",
+        "LOCAL_STORE_PATH": os.path.join(workdir, "vector_store"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embeddings.sqlite"),
+        "CAPTION_STORE_PATH": os.path.join(workdir, "captions.sqlite"),
+        "SHARED_INDEX": "false",
+        "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY", "offline-benchmark"),
+    })
+    install_fake_gemini(args.gemini_first_token_latency, args.token_latency, args.caption_latency)
+
+    import metrics
+
+    metrics.set_enabled(True)
+
+    index_name = "bench_offline"
+    started_at = datetime.now(timezone.utc)
+    print("Ingest")
+    ingest = bench_ingest(args, index_name)
+    print("Query")
+    query = bench_queries(args, index_name)
+    print("Generation")
+    generation = bench_generation(args, index_name)
+    ollama.stop()
+
+    results = {
+        "started_at": started_at.isoformat(),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "config": vars(args),
+        "ingest": ingest,
+        "query": query,
+        "generation": generation,
+        "metrics": metrics.get_registry().snapshot(),
+    }
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"offline-{started_at:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
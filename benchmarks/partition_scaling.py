@@ -0,0 +1,34 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingestion import partition_pdf_pages, partition_pdf_parallel
+from pdf_pages import page_count
+
+
+def run(label, func, pages, baseline=None):
+    start = time.perf_counter()
+    elements = func()
+    elapsed = time.perf_counter() - start
+    speedup = f", {baseline / elapsed:.2f}x" if baseline else ""
+    print(f"{label:>12}: {elapsed:.1f}s ({pages / elapsed:.1f} pages/sec, {len(elements)} elements{speedup})")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partitioning throughput of a PDF, serial vs page-parallel.")
+    parser.add_argument("pdf", help="PDF to partition; larger documents show the scaling best")
+    parser.add_argument("--strategy", default="fast", help="partition_pdf strategy")
+    parser.add_argument("--workers", default="1,2,4,8,16,32", help="Comma-separated process counts")
+    args = parser.parse_args()
+
+    pages = page_count(args.pdf)
+    print(f"{args.pdf}: {pages} pages, {os.cpu_count()} cores")
+
+    serial = run("serial", lambda: partition_pdf_pages(args.pdf, None, args.strategy), pages)
+    for workers in (int(count) for count in args.workers.split(",")):
+        if workers > 1:
+            run(f"{workers} workers", lambda: partition_pdf_parallel(args.pdf, None, args.strategy, max_workers=workers), pages, serial)
@@ -0,0 +1,73 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_store import get_store
+
+DIMENSION = 768
+
+
+def synthetic_chunks(doc_id, chunks_per_doc, dimension, rng):
+    vectors = rng.normal(size=(chunks_per_doc, dimension)).astype(np.float32)
+    for i, vector in enumerate(vectors):
+        yield {
+            "content": f"chunk {i} of document {doc_id}",
+            "content_type": "text",
+            "doc_id": doc_id,
+            "embedding": vector.tolist(),
+        }
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def measure(store, index_name, doc_ids, queries, top_k, scoped):
+    latencies = []
+    for i, query in enumerate(queries):
+        doc_id = doc_ids[i % len(doc_ids)] if scoped else None
+        start = time.perf_counter()
+        store.knn_search(index_name, query.tolist(), top_k, doc_id=doc_id)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query latency of a shared multi-document index as documents are added.")
+    parser.add_argument("--backend", default="local", choices=["local", "opensearch"])
+    parser.add_argument("--index", default="bench_shared_index")
+    parser.add_argument("--doc-counts", default="10,100,1000", help="Comma-separated document counts to measure at")
+    parser.add_argument("--chunks-per-doc", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    store = get_store(args.index, args.backend)
+    store.create_index(args.index, recreate=True, shared=True)
+    queries = rng.normal(size=(args.queries, DIMENSION)).astype(np.float32)
+
+    doc_ids = []
+    for target in sorted(int(count) for count in args.doc_counts.split(",")):
+        while len(doc_ids) < target:
+            doc_id = f"doc_{len(doc_ids)}"
+            store.index_chunks(args.index, synthetic_chunks(doc_id, args.chunks_per_doc, DIMENSION, rng))
+            doc_ids.append(doc_id)
+        if args.backend == "opensearch":
+            store.client.indices.refresh(index=args.index)
+
+        for scoped in (True, False):
+            latencies = measure(store, args.index, doc_ids, queries, args.top_k, scoped)
+            print(
+                f"{len(doc_ids):>6} docs, {'filtered' if scoped else 'cross-doc':>9} kNN: "
+                f"p50 {statistics.median(latencies):.2f}ms, p95 {percentile(latencies, 95):.2f}ms"
+            )
+
+    store.delete_index(args.index)
@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fakes import FakeOllamaServer, fake_embedding
+
+MODULES = ["app", "async_pipeline", "generation", "retrieval", "ingest_jobs", "ingestion", "vector_store"]
+QUERY = "What is attention?"
+
+# Runs in a fresh interpreter: import the app, serve the UI, answer one question
+FIRST_REQUEST = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.demo.launch(server_name="127.0.0.1", server_port=int(sys.argv[1]), prevent_thread_lock=True, quiet=True)
+launched = time.perf_counter()
+
+async def first_request():
+    first_token = None
+    async for _ in app.answer_query(sys.argv[3], sys.argv[2], "hybrid", "deepseek-r1:1.5b"):
+        if first_token is None:
+            first_token = time.perf_counter()
+    return first_token
+
+first_token = asyncio.run(first_request())
+answered = time.perf_counter()
+app.demo.close()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "launch_ms": (launched - imported) * 1000,
+    "first_token_ms": (first_token - launched) * 1000,
+    "first_answer_ms": (answered - launched) * 1000,
+}))
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_python(args, env):
+    result = subprocess.run([sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit status {result.returncode}")
+    return result
+
+
+def import_time(module, env):
+    """Milliseconds to import `module` in a fresh interpreter, excluding interpreter startup."""
+    code = f"import time; start = time.perf_counter(); import {module}; print((time.perf_counter() - start) * 1000)"
+    return float(run_python(["-c", code], env).stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(module, env, count):
+    """Top-level packages with the largest cumulative import time, from python -X importtime."""
+    stderr = run_python(["-X", "importtime", "-c", f"import {module}"], env).stderr
+    cumulative = {}
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)", line)
+        # Only the outermost import of each package, so nested times are not counted twice
+        if match and len(match.group(2)) == 1:
+            cumulative[match.group(3)] = int(match.group(1)) / 1000
+    return sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[:count]
+
+
+def time_to_first_request(env, index_name):
+    start = time.perf_counter()
+    result = run_python(["-c", FIRST_REQUEST, str(free_port()), index_name, QUERY], env)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["total_ms"] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def seed_index(index_name, chunks=200):
+    """A small local index, so the first request exercises retrieval and generation."""
+    from vector_store import get_store
+
+    store = get_store(index_name, "local")
+    store.create_index(index_name)
+    store.index_chunks(index_name, [
+        {"content": f"chunk {i} about attention", "content_type": "text", "embedding": fake_embedding(f"chunk {i}")}
+        for i in range(chunks)
+    ])
+
+
+def median_of(samples):
+    return {key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold start: module import times and time to the first answered request.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per measurement")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports of app to list")
+    parser.add_argument("--modules", default=",".join(MODULES), help="Comma-separated modules to time")
+    parser.add_argument("--output", help="Optional JSON results path")
+    args = parser.parse_args()
+
+    ollama = FakeOllamaServer().start()
+    workdir = tempfile.mkdtemp(prefix="rag-startup-")
+    # Service endpoints and caches are read from the environment at import time
+    os.environ.update({
+        "OLLAMA_BASE_URL": ollama.url,
+        "VECTOR_STORE_BACKEND": "local",
+        "LOCAL_STORE_PATH": os.path.join(workdir, "vector_store"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embeddings.sqlite"),
+        "SHARED_INDEX": "false",
+    })
+    env = dict(os.environ)
+
+    index_name = "bench_startup"
+    seed_index(index_name)
+
+    results = {"python": sys.version.split()[0], "import_ms": {}}
+    print(f"Import time (median of {args.runs} fresh interpreters)")
+    for module in args.modules.split(","):
+        try:
+            results["import_ms"][module] = statistics.median(import_time(module, env) for _ in range(args.runs))
+            print(f"{module:>16}: {results['import_ms'][module]:.0f}ms")
+        except RuntimeError as e:
+            print(f"{module:>16}: failed ({e})")
+
+    print("\nSlowest imports of app (cumulative)")
+    try:
+        results["slowest_imports_ms"] = dict(slowest_imports("app", env, args.top))
+        for name, ms in results["slowest_imports_ms"].items():
+            print(f"{name:>28}: {ms:.0f}ms")
+    except RuntimeError as e:
+        print(f"failed ({e})")
+
+    print("\nTime to first request (median)")
+    try:
+        first = median_of([time_to_first_request(env, index_name) for _ in range(args.runs)])
+        results["first_request"] = first
+        print(
+            f"import {first['import_ms']:.0f}ms, launch {first['launch_ms']:.0f}ms, "
+            f"first token {first['first_token_ms']:.0f}ms, first answer {first['first_answer_ms']:.0f}ms, "
+            f"process start to answer {first['total_ms']:.0f}ms"
+        )
+    except RuntimeError as e:
+        print(f"failed ({e})")
+    ollama.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
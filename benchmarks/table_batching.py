@@ -0,0 +1,87 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fakes import FakeGeminiModel, _FakeChunk
+
+from captioning import caption_in_batches, caption_items
+from chunking import _table_batch_request, _table_request, _table_tokens
+
+
+class CountingModel(FakeGeminiModel):
+    """FakeGeminiModel that counts calls and leaves some tables out of batched answers."""
+
+    def __init__(self, drop_rate=0.0, seed=0):
+        super().__init__()
+        self.drop_rate = drop_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate_content(self, contents=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        response = super().generate_content(contents, **kwargs)
+        if self.drop_rate and response.text.startswith("{"):
+            descriptions = json.loads(response.text)
+            with self._lock:
+                kept = {key: value for key, value in descriptions.items() if self._random.random() >= self.drop_rate}
+            return _FakeChunk(json.dumps(kept))
+        return response
+
+
+def synthetic_table(i, rows, rng):
+    cells = "".join(
+        f"<tr><td>Line item {r}</td><td>{rng.randint(100, 99999):,}</td><td>{rng.randint(100, 99999):,}</td></tr>"
+        for r in range(rows)
+    )
+    html = f"<table><tr><th>Table {i}</th><th>FY2023</th><th>FY2024</th></tr>{cells}</table>"
+    return {"table_as_html": html, "table_text": html, "content": html, "content_type": "table"}
+
+
+def run(label, tables, model, func):
+    start = time.perf_counter()
+    func(tables, model)
+    elapsed = time.perf_counter() - start
+    described = sum(not table["content"].startswith("<table>") for table in tables)
+    print(
+        f"{label:>20}: {model.calls} calls ({model.calls / len(tables):.2f}/table), {elapsed:.1f}s "
+        f"({elapsed / len(tables) * 1000:.0f}ms/table), {described}/{len(tables)} described"
+    )
+    return {"calls": model.calls, "seconds": elapsed, "ms_per_table": elapsed / len(tables) * 1000, "described": described}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Table descriptions: one Gemini call per table vs batched calls, against a fake model.")
+    parser.add_argument("--tables", type=int, default=80)
+    parser.add_argument("--rows", type=int, default=8, help="Rows per synthetic table")
+    parser.add_argument("--budgets", default="1000,2000,4000", help="Comma-separated token budgets per batched call")
+    parser.add_argument("--max-batch", type=int, default=8, help="Tables per batched call")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=5.0, help="Calls started per second")
+    parser.add_argument("--call-latency", type=float, default=1.5, help="Fixed seconds per fake call (prompt processing)")
+    parser.add_argument("--table-latency", type=float, default=0.4, help="Extra seconds per table described in a call")
+    parser.add_argument("--drop-rate", type=float, default=0.05, help="Share of tables left out of batched answers")
+    args = parser.parse_args()
+
+    FakeGeminiModel.caption_latency = args.call_latency
+    FakeGeminiModel.item_latency = args.table_latency
+    rng = random.Random(0)
+    base = [synthetic_table(i, args.rows, rng) for i in range(args.tables)]
+    print(f"{args.tables} tables, ~{sum(map(_table_tokens, base)) / len(base):.0f} tokens each")
+
+    run("one call per table", [dict(table) for table in base], CountingModel(),
+        lambda tables, model: caption_items(tables, model, _table_request, max_concurrency=args.concurrency, rate=args.rate))
+    for budget in (int(value) for value in args.budgets.split(",")):
+        run(f"batched ({budget} tok)", [dict(table) for table in base], CountingModel(args.drop_rate),
+            lambda tables, model: caption_in_batches(
+                tables, model, _table_batch_request, _table_request, _table_tokens, budget, max_batch=args.max_batch,
+                max_concurrency=args.concurrency, rate=args.rate,
+            ))
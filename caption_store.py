@@ -0,0 +1,232 @@
+import base64
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from itertools import islice
+
+import numpy as np
+
+from captioning import caption_items, model_name
+from metrics import incr
+
+CAPTION_STORE_PATH = os.getenv("CAPTION_STORE_PATH", ".cache/captions.sqlite")
+IMAGE_MIN_SIDE = int(os.getenv("IMAGE_MIN_SIDE", 64))
+IMAGE_MIN_ENTROPY = float(os.getenv("IMAGE_MIN_ENTROPY", 0.2))
+IMAGE_HASH_DISTANCE = int(os.getenv("IMAGE_HASH_DISTANCE", 6))
+
+_DCT_SIZE = 32
+_HASH_SIZE = 8
+
+
+def _dct_matrix(size):
+    k = np.arange(size)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * size))
+    matrix[0] /= np.sqrt(2)
+    return matrix * np.sqrt(2 / size)
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def image_fingerprint(base64_image):
+    """
+    Decode an image and measure what the pre-filter and deduplication need.
+
+    Args:
+        base64_image (str): Base64 encoded image
+
+    Returns:
+        tuple: (width, height, grayscale entropy in bits, 64-bit perceptual hash)
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(base64.b64decode(base64_image))) as image:
+        width, height = image.size
+        gray = image.convert("L")
+
+    histogram = np.asarray(gray.histogram(), dtype=np.float64)
+    probabilities = histogram[histogram > 0] / histogram.sum()
+    entropy = float(-(probabilities * np.log2(probabilities)).sum())
+
+    # pHash: the low frequencies of a 32x32 DCT, thresholded at their median
+    pixels = np.asarray(gray.resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS), dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:_HASH_SIZE, :_HASH_SIZE].flatten()
+    bits = low > np.median(low[1:])
+    phash = int("".join("1" if bit else "0" for bit in bits), 2)
+
+    return width, height, entropy, phash
+
+
+def skip_reason(width, height, entropy, min_side=IMAGE_MIN_SIDE, min_entropy=IMAGE_MIN_ENTROPY):
+    """Why an image is not worth a model call (icons, rules, blank boxes), or None."""
+    if min(width, height) < min_side:
+        return "small"
+    if entropy < min_entropy:
+        return "low_entropy"
+    return None
+
+
+class CaptionStore:
+    """
+    Disk-backed store of model descriptions keyed by a hash of (model name,
+    perceptual image hash, normalized caption text), so a figure repeated
+    across documents is only described once.
+    """
+
+    def __init__(self, path=CAPTION_STORE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS captions ("
+            "key TEXT PRIMARY KEY, description TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(phash, caption, model):
+        normalized = " ".join((caption or "").split())
+        return hashlib.sha256(f"{model}\x00{phash:016x}\x00{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the stored description for `key`, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT description FROM captions WHERE key = ?", (key,)).fetchone()
+            if row:
+                self.hits += 1
+                self._conn.execute("UPDATE captions SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+                return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, description):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO captions (key, description, last_used) VALUES (?, ?, ?)",
+                (key, description, time.time()),
+            )
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM captions").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_caption_store():
+    """Return the process-wide caption store, creating it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CaptionStore()
+    return _store
+
+
+def iter_captioned_images(images, model, build_request, window=16, rate=5.0, use_store=True, max_distance=IMAGE_HASH_DISTANCE,
+                          **kwargs):
+    """
+    Describe images `window` at a time like captioning.iter_captioned, but
+    only call the model for images that need it.
+
+    Images that are too small or too uniform keep their raw text. An image
+    within `max_distance` bits (perceptual hash) of an earlier image in the
+    same document reuses that image's description, and an image already in
+    the caption store reuses the stored one.
+
+    Args:
+        images (iterable): Image dicts with "base64_image", "caption" and fallback "content"
+        model: Client exposing generate_content(request)
+        build_request (callable): Maps an image to the generate_content argument
+        window (int): Images handled per round of model calls
+        rate (float): Maximum calls started per second, across all callers of the model
+        use_store (bool): Whether to consult and fill the caption store
+        max_distance (int): Largest hash distance counted as the same image
+        **kwargs: Passed on to captioning.caption_items
+
+    Yields:
+        dict: The images, in order
+    """
+    store = get_caption_store() if use_store else None
+    seen = []  # (phash, first image with that hash)
+    described = set()  # ids of images whose content is a model description
+    stats = Counter()
+
+    images = iter(images)
+    while True:
+        batch = list(islice(images, window))
+        if not batch:
+            break
+
+        pending, copies, keys = [], [], {}
+        for image in batch:
+            stats["images"] += 1
+            if not image.get("base64_image"):
+                stats["no_payload"] += 1
+                continue
+            try:
+                width, height, entropy, phash = image_fingerprint(image["base64_image"])
+            except Exception as e:
+                print(f"Could not decode image on page {image.get('page_number')}: {e}")
+                stats["undecodable"] += 1
+                continue
+
+            reason = skip_reason(width, height, entropy)
+            if reason:
+                stats[reason] += 1
+                continue
+
+            original = next((first for seen_hash, first in seen if bin(seen_hash ^ phash).count("1") <= max_distance), None)
+            if original is not None:
+                stats["duplicates"] += 1
+                copies.append((image, original))
+                continue
+            seen.append((phash, image))
+
+            key = CaptionStore.make_key(phash, image.get("caption"), model_name(model))
+            cached = store.get(key) if store else None
+            if cached is not None:
+                stats["store_hits"] += 1
+                image["content"] = cached
+                described.add(id(image))
+                continue
+
+            keys[id(image)] = key
+            pending.append(image)
+
+        def on_captioned(image):
+            described.add(id(image))
+            if store:
+                store.put(keys[id(image)], image["content"])
+
+        caption_items(pending, model, build_request, rate=rate, on_captioned=on_captioned, **kwargs)
+        stats["model_calls"] += len(pending)
+
+        for image, original in copies:
+            if id(original) in described:
+                image["content"] = original["content"]
+
+        yield from batch
+
+    saved = stats["images"] - stats["model_calls"]
+    for reason in ("small", "low_entropy", "no_payload", "undecodable", "duplicates", "store_hits"):
+        if stats[reason]:
+            incr("caption_calls_saved", stats[reason], reason=reason)
+    print(
+        f"Images: {stats['images']} extracted, {stats['model_calls']} sent to the model, {saved} calls saved "
+        f"({stats['small']} small, {stats['low_entropy']} low entropy, {stats['no_payload'] + stats['undecodable']} "
+        f"without image data, {stats['duplicates']} duplicates, {stats['store_hits']} from caption store)"
+    )
@@ -0,0 +1,248 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from metrics import incr, span
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket allowing `rate` calls per second on average,
+    with bursts of up to `capacity` calls.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def model_name(model):
+    """Name of a model client, as used for caption store keys and rate limits."""
+    return getattr(model, "model_name", type(model).__name__)
+
+
+def get_rate_limiter(model, rate):
+    """
+    Return the process-wide token bucket for `model`, created with `rate` on
+    first use, so images, tables and concurrent ingests share one call budget.
+    """
+    if not rate:
+        return None
+    with _limiters_lock:
+        bucket = _limiters.get(model_name(model))
+        if bucket is None:
+            bucket = _limiters[model_name(model)] = TokenBucket(rate)
+    return bucket
+
+
+def caption_items(items, model, build_request, max_concurrency=4, rate=5.0, max_retries=3, backoff=1.0, bucket=None,
+                  stage="captioning", on_captioned=None):
+    """
+    Run model calls for `items` concurrently and store the result in each item's "content".
+
+    Args:
+        items (list): Dicts with a fallback "content" value
+        model: Client exposing generate_content(request), e.g. genai.GenerativeModel
+        build_request (callable): Maps an item to the generate_content argument
+        max_concurrency (int): Maximum number of calls in flight
+        rate (float): Maximum calls started per second, across all callers of the model
+        max_retries (int): Attempts per item before falling back
+        backoff (float): Base delay in seconds for exponential backoff
+        bucket (TokenBucket): Rate limiter overriding the model's process-wide one (see get_rate_limiter)
+        stage (str): Name of the timing span recorded for each call
+        on_captioned (callable): Called with each item whose model call succeeded
+
+    Returns:
+        list: The same items, in the same order
+    """
+    if not items:
+        return items
+
+    if bucket is None:
+        bucket = get_rate_limiter(model, rate)
+
+    def caption(item):
+        with span(stage) as call_span:
+            for attempt in range(max_retries):
+                if bucket:
+                    bucket.acquire()
+                try:
+                    response = model.generate_content(build_request(item))
+                    item["content"] = response.text
+                    call_span.add("items")
+                    if on_captioned:
+                        on_captioned(item)
+                    return
+                except Exception as e:
+                    print(f"Captioning failed (attempt {attempt + 1}/{max_retries}): {e}")
+                    call_span.add("retries")
+                    if attempt + 1 < max_retries:
+                        time.sleep(backoff * (2 ** attempt))
+            print("Falling back to raw content")
+            call_span.add("fallbacks")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        list(executor.map(caption, items))
+
+    elapsed = time.perf_counter() - start
+    rate_done = len(items) / elapsed if elapsed > 0 else float("inf")
+    print(f"Captioned {len(items)} items in {elapsed:.2f}s ({rate_done:.1f} items/sec)")
+
+    return items
+
+
+def iter_captioned(items, model, build_request, window=16, **kwargs):
+    """
+    Caption an iterable of items `window` at a time and yield them in order,
+    so later pipeline stages can start before every item is captioned.
+    """
+    items = iter(items)
+    while True:
+        batch = list(islice(items, window))
+        if not batch:
+            return
+        yield from caption_items(batch, model, build_request, **kwargs)
+
+
+def parse_json_object(text):
+    """Parse a JSON object from a model response, allowing a ```json fence around it; {} if there is none."""
+    text = (text or "").strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[-1].rsplit("```", 1)[0]
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        return {}
+    return parsed if isinstance(parsed, dict) else {}
+
+
+def pack_batches(items, size_of, budget, max_items):
+    """Group consecutive items into batches of at most `max_items` whose sizes sum to at most `budget`."""
+    batches, batch, used = [], [], 0
+    for item in items:
+        size = size_of(item)
+        if batch and (used + size > budget or len(batch) >= max_items):
+            batches.append(batch)
+            batch, used = [], 0
+        batch.append(item)
+        used += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def caption_in_batches(items, model, build_batch_request, build_request, size_of, budget, max_batch=8, stage="captioning",
+                       **kwargs):
+    """
+    Describe several items per model call and map the descriptions back.
+
+    `build_batch_request` gets a list of items and must ask for a JSON object
+    keyed by each item's 1-based position in that list ("1", "2", ...).
+    Items left out of a parsed response, and items whose batch call failed,
+    are retried with one `build_request` call each.
+
+    Args:
+        items (list): Dicts with a fallback "content" value
+        model: Client exposing generate_content(request)
+        build_batch_request (callable): Maps a list of items to one generate_content argument
+        build_request (callable): Maps a single item to a generate_content argument
+        size_of (callable): Estimated prompt tokens of an item
+        budget (int): Prompt tokens per batched request
+        max_batch (int): Items per batched request
+        stage (str): Name of the timing span; batched calls use "<stage>_batch"
+        **kwargs: Passed on to caption_items
+
+    Returns:
+        list: The same items, in the same order
+    """
+    batches = pack_batches(items, size_of, budget, max_batch)
+    jobs = [{"items": batch, "content": ""} for batch in batches if len(batch) > 1]
+    singles = [batch[0] for batch in batches if len(batch) == 1]
+
+    answered = set()
+    caption_items(jobs, model, lambda job: build_batch_request(job["items"]), stage=f"{stage}_batch",
+                  on_captioned=lambda job: answered.add(id(job)), **kwargs)
+
+    for job in jobs:
+        descriptions = parse_json_object(job["content"]) if id(job) in answered else {}
+        for position, item in enumerate(job["items"], start=1):
+            description = descriptions.get(str(position))
+            if isinstance(description, str) and description.strip():
+                item["content"] = description
+            else:
+                singles.append(item)
+
+    batched = len(items) - len(singles)
+    incr("batched_items", batched, stage=stage)
+    incr("batch_fallbacks", len(singles) - sum(len(batch) == 1 for batch in batches), stage=stage)
+    print(f"Described {batched} items in {len(jobs)} batched calls, {len(singles)} described one per call")
+
+    caption_items(singles, model, build_request, stage=stage, **kwargs)
+    return items
+
+
+def iter_captioned_batches(items, model, build_batch_request, build_request, size_of, budget, window=16, **kwargs):
+    """
+    Batched counterpart of iter_captioned: caption `window` items at a time
+    with caption_in_batches and yield them in order.
+    """
+    items = iter(items)
+    while True:
+        batch = list(islice(items, window))
+        if not batch:
+            return
+        yield from caption_in_batches(batch, model, build_batch_request, build_request, size_of, budget, **kwargs)
+
+
+if __name__ == "__main__":
+    import random
+
+    class FakeResponse:
+        def __init__(self, text):
+            self.text = text
+
+    class FakeModel:
+        """Local stand-in for genai.GenerativeModel with fixed latency and failure rate."""
+
+        def __init__(self, latency=0.2, failure_rate=0.1):
+            self.latency = latency
+            self.failure_rate = failure_rate
+
+        def generate_content(self, request):
+            time.sleep(self.latency)
+            if random.random() < self.failure_rate:
+                raise RuntimeError("simulated API error")
+            return FakeResponse(f"Description of {request[0]}")
+
+    items = [{"content": f"raw text {i}"} for i in range(40)]
+    for concurrency in (1, 4, 8):
+        caption_items(
+            [dict(item) for item in items],
+            FakeModel(),
+            lambda item: [item["content"]],
+            max_concurrency=concurrency,
+            rate=20,
+            backoff=0.1,
+        )
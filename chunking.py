@@ -1,22 +1,56 @@
 import base64
 import os
-import google.generativeai as genai
-from dotenv import load_dotenv
+from caption_store import iter_captioned_images
+from captioning import iter_captioned, iter_captioned_batches
+from context_packer import estimate_tokens
+from helper import get_gemini_model
+from unstructured.chunking.title import chunk_by_title
 from unstructured.documents.elements import Element,Text,Image,FigureCaption,Table,CompositeElement
 
-load_dotenv()
+# Tables are described several per Gemini call up to this many HTML tokens; 0 sends one call per table
+TABLE_BATCH_TOKENS = int(os.getenv("TABLE_BATCH_TOKENS", 0))
+TABLE_BATCH_SIZE = int(os.getenv("TABLE_BATCH_SIZE", 8))
 
-#processing images
-def process_images_with_caption(raw_chunks,use_gemini=True):
-    # Configure Gemini API
-    if use_gemini:
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY is not set in the environment variables.")
-        genai.configure(api_key=api_key)
-    
+def _image_request(image_data):
+    image_binary = base64.b64decode(image_data["base64_image"])
+
+    prompt = (
+        f"Describe the image in detail. The caption is: {image_data['caption']}."
+        f"The image text is: {image_data['image_text']}" 
+        f"Directly analyze the image and provide a detailed description without any additional text."
+    )
+
+    return [
+        prompt,
+        {"mime_type": "image/png", "data": image_binary},
+    ]
+
+def _table_request(table_data):
+    prompt = (
+        "Analyze the following table and provide a detailed description of its contents, "
+        "including the structure, key data points, and any notable trends or insights."
+        f"Here is the table in HTML format: {table_data['table_as_html']}"
+        "Directly analyze the table and provide a detailed description without any additional text."
+    )
+
+    return [prompt]
+
+def _table_batch_request(tables):
+    parts = [
+        "Analyze each of the following tables and provide a detailed description of its contents, "
+        "including the structure, key data points, and any notable trends or insights. "
+        "Respond with only a JSON object that maps each table number to its description, "
+        f"for example {{\"1\": \"...\", \"2\": \"...\"}}, with one entry for each of the {len(tables)} tables."
+    ]
+    for number, table_data in enumerate(tables, start=1):
+        parts.append(f"Table {number} in HTML format: {table_data['table_as_html']}")
+    return ["\n\n".join(parts)]
+
+def _table_tokens(table_data):
+    return estimate_tokens(table_data["table_as_html"] or table_data["table_text"] or "")
+
+def _extract_images(raw_chunks):
     # Extract images and their captions from the raw chunks
-    processed_images = []
     for idx, chunk in enumerate(raw_chunks):
         if isinstance(chunk, Image):
             # check idx + 1 is figure caption
@@ -26,94 +60,125 @@ def process_images_with_caption(raw_chunks,use_gemini=True):
             else:
                 caption = None
 
-            image_data=({
+            image_data = {
                 "caption": caption if caption else "No caption",
                 "image_text": chunk.text,
                 "base64_image": chunk.metadata.image_base64,
                 "content": chunk.text, #if gemini model doesnt run this will be saved
                 "content_type":"image",
-                "filename": chunk.metadata.filename
-            })
-
-            if use_gemini:
-                model = genai.GenerativeModel("gemini-2.5-flash") 
-
-                image_binary = base64.b64decode(image_data["base64_image"])
-
-                prompt = (
-                    f"Describe the image in detail. The caption is: {image_data['caption']}."
-                    f"The image text is: {image_data['image_text']}" 
-                    f"Directly analyze the image and provide a detailed description without any additional text."
-                )
-
-                response = model.generate_content([
-                    prompt,
-                    {"mime_type": "image/png", "data": image_binary},
-                ])
-                image_data["content"]=response.text
-            
-            processed_images.append(image_data)
-
-    return processed_images
-
-def process_tables_with_description(raw_chunks,use_gemini=True):
-
-    # Configure Gemini API
-    if use_gemini:
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY is not set in the environment variables.")
-        genai.configure(api_key=api_key)
+                "filename": chunk.metadata.filename,
+                "page_number": chunk.metadata.page_number
+            }
+            yield image_data
 
+def _extract_tables(raw_chunks):
     # Extract tables from the raw chunks
-    processed_tables = []
-    for idx, element in enumerate(raw_chunks):
+    for element in raw_chunks:
         if isinstance(element, Table):
-            table_data=({
+            yield {
                 "table_as_html": element.metadata.text_as_html,
                 "table_text": element.text,
                 "content": element.text,  # Fallback content
                 "content_type": "table",
-                "filename": element.metadata.filename
-            })
-
-            if use_gemini:
-                model = genai.GenerativeModel("gemini-2.5-flash") 
+                "filename": element.metadata.filename,
+                "page_number": element.metadata.page_number
+            }
 
-                prompt = (
-                    "Analyze the following table and provide a detailed description of its contents, "
-                    "including the structure, key data points, and any notable trends or insights."
-                    f"Here is the table in HTML format: {table_data['table_as_html']}"
-                    "Directly analyze the table and provide a detailed description without any additional text."
-                )
+#processing images
+def iter_images_with_caption(raw_chunks,use_gemini=True,model=None,max_concurrency=4,rate=5.0,window=16,use_caption_store=True):
+    """
+    Yield image chunks as they are described, `window` images at a time.
+    Small, blank and repeated images are not sent to Gemini, and descriptions
+    are reused from the caption store when `use_caption_store` is set.
+    The base64 payload is dropped from each chunk once it has been captioned.
+    """
+    # Configure Gemini API
+    if use_gemini and model is None:
+        model = get_gemini_model()
 
-                response = model.generate_content([prompt])
-                table_data["content"]=response.text
-            
-            processed_tables.append(table_data)
+    images = _extract_images(raw_chunks)
+    if use_gemini:
+        # Describe images concurrently, keeping the raw text for failed and skipped calls
+        images = iter_captioned_images(images, model, _image_request, window=window, rate=rate, use_store=use_caption_store,
+                                       max_concurrency=max_concurrency, stage="image_captioning")
+
+    for image_data in images:
+        image_data.pop("base64_image", None)
+        yield image_data
+
+def process_images_with_caption(raw_chunks,use_gemini=True,model=None,max_concurrency=4,rate=5.0):
+    return list(iter_images_with_caption(raw_chunks, use_gemini, model, max_concurrency, rate))
+
+def iter_tables_with_description(raw_chunks,use_gemini=True,model=None,max_concurrency=4,rate=5.0,window=16,batch_tokens=None):
+    """
+    Yield table chunks as they are described, `window` tables at a time.
+    With `batch_tokens` (TABLE_BATCH_TOKENS by default) set, tables are
+    described up to TABLE_BATCH_SIZE per call within that many HTML tokens.
+    """
+    batch_tokens = TABLE_BATCH_TOKENS if batch_tokens is None else batch_tokens
+    # Configure Gemini API
+    if use_gemini and model is None:
+        model = get_gemini_model()
+
+    tables = _extract_tables(raw_chunks)
+    if use_gemini and batch_tokens:
+        # Describe several tables per call; tables missing from a response are described on their own
+        tables = iter_captioned_batches(tables, model, _table_batch_request, _table_request, _table_tokens, batch_tokens,
+                                        window=window, max_batch=TABLE_BATCH_SIZE, max_concurrency=max_concurrency,
+                                        rate=rate, stage="table_description")
+    elif use_gemini:
+        # Describe tables concurrently, keeping the raw text for failed calls
+        tables = iter_captioned(tables, model, _table_request, window=window, max_concurrency=max_concurrency, rate=rate,
+                                stage="table_description")
+
+    yield from tables
+
+def process_tables_with_description(raw_chunks,use_gemini=True,model=None,max_concurrency=4,rate=5.0,batch_tokens=None):
+    return list(iter_tables_with_description(raw_chunks, use_gemini, model, max_concurrency, rate, batch_tokens=batch_tokens))
+
+def chunk_elements_by_title(raw_chunks):
+    """
+    Chunk already-partitioned elements by title in memory, so the PDF only
+    has to be partitioned once for images, tables and text.
+    """
+    return chunk_by_title(
+        raw_chunks,
+        max_characters=2000,
+        combine_text_under_n_chars=500,
+        new_after_n_chars=1500,
+    )
 
-    return processed_tables
+def _chunk_pages(chunk):
+    # A chunk built by title can run across pages; its original elements know which
+    elements = getattr(chunk.metadata, "orig_elements", None) or []
+    pages = sorted({element.metadata.page_number for element in elements if element.metadata.page_number})
+    return pages or ([chunk.metadata.page_number] if chunk.metadata.page_number else [])
 
-def create_semantic_chunks(text_chunks):
-    process_chunks=[]
-    for idx, chunk in enumerate(text_chunks):
+def iter_semantic_chunks(text_chunks):
+    for chunk in text_chunks:
         if isinstance(chunk,CompositeElement):
-            chunk_data={
+            yield {
                 "content": chunk.text,
                 "content_type": "text",
-                "filename": chunk.metadata.filename
+                "filename": chunk.metadata.filename,
+                "page_number": chunk.metadata.page_number,
+                "page_numbers": _chunk_pages(chunk)
             }
-            process_chunks.append(chunk_data)
-        
-    return process_chunks
+
+def create_semantic_chunks(text_chunks):
+    return list(iter_semantic_chunks(text_chunks))
 
 
 #chunking.py
 
 if __name__=="__main__":
+    import time
     from unstructured.partition.pdf import partition_pdf
 
     pdf_file_path="files/rag survey.pdf"
+
+    # Single pass: partition once, chunk the same elements in memory
+    start=time.perf_counter()
     raw_chunks = partition_pdf(
         filename=pdf_file_path,
         strategy="hi_res",
@@ -122,25 +187,20 @@ if __name__=="__main__":
         extract_image_block_to_payload=True,
         chunking_strategy=None,
     )
+    semantic_chunks=create_semantic_chunks(chunk_elements_by_title(raw_chunks))
+    single_pass=time.perf_counter()-start
 
-    # processed_images=process_images_with_caption(raw_chunks,use_gemini=True)
-
-    # for image in processed_images:
-    #     print(image) 
-    
-    # process_tables=process_tables_with_description(raw_chunks,use_gemini=True)
-    # for table in process_tables:
-    #     print(table)
-
+    # Two passes: the second partition_pdf call the pipeline used to make
+    start=time.perf_counter()
     text_chunks=partition_pdf(
         filename=pdf_file_path,
         strategy="hi_res",
         chunking_strategy="by_title",
-        max_character=2000,
+        max_characters=2000,
         combine_text_under_n_chars=500,
         new_after_n_chars=1500
     )
+    two_pass=single_pass+time.perf_counter()-start
 
-    semantic_chunks=create_semantic_chunks(text_chunks)
-    for chunk in semantic_chunks:
-        print(chunk)
\ No newline at end of file
+    print(f"Single pass: {single_pass:.2f}s, two passes: {two_pass:.2f}s")
+    print(f"Semantic chunks: {len(semantic_chunks)} vs {len(create_semantic_chunks(text_chunks))}")
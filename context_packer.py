@@ -0,0 +1,120 @@
+import math
+import re
+
+from metrics import incr, timed
+
+# Context budget and tokenizer ratio (tokens per base token) for each model.
+# Base tokens are words and punctuation marks, see estimate_tokens.
+MODEL_TOKEN_PROFILES = {
+    "gemini-2.5-flash": {"context_budget": 16000, "ratio": 1.0},
+    "deepseek-r1:1.5b": {"context_budget": 3000, "ratio": 1.2},
+}
+DEFAULT_TOKEN_PROFILE = {"context_budget": 4000, "ratio": 1.2}
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """
+    Model-independent token estimate: words and punctuation marks, with long
+    words counted as several sub-word pieces. This is what ingestion stores
+    as `token_count`.
+    """
+    return sum(max(1, math.ceil(len(token) / 6)) for token in _TOKEN_RE.findall(text))
+
+
+def get_token_profile(model_name):
+    return MODEL_TOKEN_PROFILES.get(model_name, DEFAULT_TOKEN_PROFILE)
+
+
+def count_tokens(text, model_name, base_count=None):
+    """Approximate token count of `text` for `model_name`."""
+    if base_count is None:
+        base_count = estimate_tokens(text)
+    return math.ceil(base_count * get_token_profile(model_name)["ratio"])
+
+
+def shingles(text, size=3):
+    """Word `size`-grams of the lowercased text; short texts are one shingle."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _is_near_duplicate(chunk_shingles, kept_shingles, threshold):
+    for other in kept_shingles:
+        union = len(chunk_shingles | other)
+        if union and len(chunk_shingles & other) / union >= threshold:
+            return True
+    return False
+
+
+@timed("prompt_assembly")
+def pack_context(hits, question, model_name, prompt_template, budget=None, dedup_threshold=0.8, separator="\n\n---\n\n"):
+    """
+    Build the prompt from ranked hits within the model's token budget.
+
+    Hits are taken in rank order. Near-duplicates of an already packed chunk
+    are dropped, and a chunk that does not fit the remaining budget is
+    skipped in favour of smaller, lower-ranked ones. The template and the
+    question are always included in full.
+
+    Args:
+        hits (list): Search hits, best first
+        question (str): User question
+        model_name (str): Model the prompt is for
+        prompt_template: Object with format(context=..., question=...)
+        budget (int): Total prompt token budget, from MODEL_TOKEN_PROFILES by default
+        dedup_threshold (float): Shingle Jaccard similarity treated as duplicate
+        separator (str): Text placed between context entries
+
+    Returns:
+        tuple: (prompt text, number of packed hits)
+    """
+    if budget is None:
+        budget = get_token_profile(model_name)["context_budget"]
+
+    remaining = budget - count_tokens(prompt_template.format(context="", question=question), model_name)
+    separator_tokens = count_tokens(separator, model_name)
+
+    contexts = []
+    kept_shingles = []
+    dropped_duplicates = 0
+    for hit in hits:
+        source = hit["_source"]
+        content = source.get("content", "")
+        content_type = source.get("content_type", "unknown")
+
+        chunk_shingles = shingles(content)
+        if _is_near_duplicate(chunk_shingles, kept_shingles, dedup_threshold):
+            dropped_duplicates += 1
+            continue
+
+        # Add metadata if available
+        metadata_info = ""
+        if "metadata" in source and source["metadata"]:
+            if "caption" in source["metadata"] and source["metadata"]["caption"]:
+                metadata_info += f"\nCaption: {source['metadata']['caption']}"
+
+        header = f"[Document {len(contexts) + 1} - {content_type}]{metadata_info}\n"
+        tokens = count_tokens(header, model_name) + count_tokens(content, model_name, source.get("token_count"))
+        if contexts:
+            tokens += separator_tokens
+        if tokens > remaining:
+            continue
+
+        contexts.append(header + content)
+        kept_shingles.append(chunk_shingles)
+        remaining -= tokens
+
+    print(
+        f"Packed {len(contexts)} of {len(hits)} chunks for {model_name} "
+        f"({dropped_duplicates} near-duplicates dropped, {max(remaining, 0)} tokens to spare)"
+    )
+
+    incr("packed_chunks", len(contexts), model=model_name)
+    incr("context_tokens", budget - remaining, model=model_name)
+
+    prompt_text = prompt_template.format(context=separator.join(contexts), question=question)
+    return prompt_text, len(contexts)
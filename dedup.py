@@ -0,0 +1,135 @@
+import hashlib
+import os
+from collections import defaultdict
+
+import numpy as np
+
+from context_packer import shingles
+from metrics import incr
+
+# Chunks whose estimated Jaccard similarity reaches this are merged; 0 turns deduplication off
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", 0.9))
+# Embedded chunks are indexed this many chunks late, so later duplicates can still record their pages on them
+DEDUP_WINDOW = int(os.getenv("DEDUP_WINDOW", 256))
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def lsh_bands(num_perm, threshold):
+    """
+    Pick (bands, rows) with bands * rows == num_perm whose LSH threshold
+    (1 / bands) ** (1 / rows) is closest to, and not above, `threshold`.
+    Candidates are verified afterwards, so erring low only costs comparisons.
+    """
+    options = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    below = [option for option in options if (1 / option[0]) ** (1 / option[1]) <= threshold] or options[:1]
+    return max(below, key=lambda option: (1 / option[0]) ** (1 / option[1]))
+
+
+class MinHashLSH:
+    """
+    MinHash signatures over word shingles with a banded LSH index, for
+    finding earlier texts whose Jaccard similarity reaches `threshold`.
+
+    Args:
+        threshold (float): Minimum estimated Jaccard similarity of a match
+        num_perm (int): Hash functions per signature
+        shingle_size (int): Words per shingle
+        seed (int): Seed of the hash functions, fixed so signatures are reproducible
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD, num_perm=128, shingle_size=3, seed=1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = lsh_bands(num_perm, threshold)
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._buckets = [defaultdict(list) for _ in range(self.bands)]
+        self._signatures = {}
+
+    def signature(self, text):
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little")
+             for shingle in shingles(text, self.shingle_size)),
+            dtype=np.uint64,
+        )
+        # Universal hashing (a * x + b) mod p, the minimum taken per hash function
+        with np.errstate(over="ignore"):
+            permuted = (hashes[:, None] * self._a + self._b) % _MERSENNE_PRIME
+        return np.bitwise_and(permuted, _MAX_HASH).min(axis=0)
+
+    def _band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def query(self, signature):
+        """Return the key of the most similar indexed text at or above the threshold, or None."""
+        candidates = {key for band, band_key in zip(self._buckets, self._band_keys(signature)) for key in band.get(band_key, ())}
+        best, best_similarity = None, self.threshold
+        for key in candidates:
+            similarity = float(np.mean(self._signatures[key] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = key, similarity
+        return best
+
+    def insert(self, key, signature):
+        self._signatures[key] = signature
+        for band, band_key in zip(self._buckets, self._band_keys(signature)):
+            band[band_key].append(key)
+
+
+def dedupe_chunks(chunks, threshold=DEDUP_THRESHOLD, on_merge=None):
+    """
+    Drop chunks that are near-duplicates of an earlier chunk in the stream,
+    e.g. repeated headers, boilerplate, or text already covered by a table.
+
+    Kept chunks are passed on as soon as they are seen. Each gets a
+    "source_pages" list, starting with its own page, to which the pages of
+    later duplicates are appended while the chunk moves through the
+    pipeline; what it holds when the chunk is indexed is stored. Only
+    `page_numbers` decide which chunks an incremental ingest replaces, so a
+    merged duplicate never widens that.
+
+    Args:
+        chunks (iterable): Chunk dicts with "content" and "page_number"
+        threshold (float): Minimum estimated Jaccard similarity to merge
+        on_merge (callable): Called with the running number of merged chunks
+
+    Yields:
+        dict: Kept chunks, in order
+    """
+    lsh = MinHashLSH(threshold)
+    source_pages = {}  # LSH key -> source_pages list of the kept chunk
+    total = dropped = 0
+
+    for chunk in chunks:
+        total += 1
+        content = chunk.get("content")
+        if not content:
+            yield chunk
+            continue
+
+        signature = lsh.signature(content)
+        match = lsh.query(signature)
+        if match is None:
+            lsh.insert(total, signature)
+            chunk["source_pages"] = source_pages[total] = [chunk["page_number"]] if chunk.get("page_number") else []
+            yield chunk
+            continue
+
+        dropped += 1
+        pages = source_pages[match]
+        if chunk.get("page_number") and chunk["page_number"] not in pages:
+            pages.append(chunk["page_number"])
+        if on_merge:
+            on_merge(dropped)
+
+    if dropped:
+        incr("dedup_dropped_chunks", dropped)
+    print(
+        f"Near-duplicate filter: {total} chunks in, {total - dropped} kept, {dropped} merged "
+        f"({dropped / total if total else 0:.1%} fewer vectors)"
+    )
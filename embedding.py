@@ -0,0 +1,245 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from embedding_models import EMBEDDING_MODEL
+from metrics import incr, span
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+EMBED_URL = f"{OLLAMA_BASE_URL}/api/embed"
+CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite")
+CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+
+class EmbeddingCache:
+    """
+    Disk-backed embedding cache keyed by a hash of (model name, normalized text).
+    Vectors are stored as float32 blobs in SQLite and the least recently used
+    entries are evicted once the stored vectors exceed `max_bytes`. Their total
+    size is kept in a one-row table, updated with every write.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY, bytes INTEGER NOT NULL)")
+        if self._conn.execute("SELECT 1 FROM cache_size WHERE id = 0").fetchone() is None:
+            # Caches from before the size table are measured once
+            self._conn.execute(
+                "INSERT INTO cache_size (id, bytes) SELECT 0, COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+            )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(text, model):
+        # Keyed by endpoint too: entries written by the old /api/embeddings query
+        # path hold unnormalized vectors and must not be served
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"api/embed\x00{model}\x00{normalized}".encode("utf-8")).hexdigest()
+
+    def get_many(self, texts, model):
+        """Return cached embeddings for `texts`, None where there is no entry."""
+        keys = [self.make_key(text, model) for text in texts]
+        found = {}
+
+        with self._lock:
+            unique_keys = list(set(keys))
+            for i in range(0, len(unique_keys), 500):
+                part = unique_keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+                found.update({key: array("f", vector).tolist() for key, vector in rows})
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+
+            results = [found.get(key) for key in keys]
+            hits = sum(result is not None for result in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+
+        return results
+
+    def put_many(self, texts, embeddings, model):
+        """Store embeddings for `texts`, skipping None entries."""
+        now = time.time()
+        vectors = {
+            self.make_key(text, model): array("f", embedding).tobytes()
+            for text, embedding in zip(texts, embeddings)
+            if embedding is not None
+        }
+        if not vectors:
+            return
+
+        with self._lock:
+            # Replaced entries no longer count towards the size
+            keys = list(vectors)
+            replaced = 0
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                replaced += self._conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE key IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, vector, now) for key, vector in vectors.items()],
+            )
+            self._add_size(sum(len(vector) for vector in vectors.values()) - replaced)
+            self._evict()
+            self._conn.commit()
+
+    def _size(self):
+        return self._conn.execute("SELECT bytes FROM cache_size WHERE id = 0").fetchone()[0]
+
+    def _add_size(self, delta):
+        self._conn.execute("UPDATE cache_size SET bytes = bytes + ? WHERE id = 0", (delta,))
+
+    def _evict(self):
+        total = self._size()
+        if total <= self.max_bytes:
+            return
+
+        # Drop least recently used entries until we are back under the limit
+        excess = total - self.max_bytes
+        removed = 0
+        keys = []
+        for key, size in self._conn.execute(
+            "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used ASC"
+        ):
+            keys.append((key,))
+            removed += size
+            if removed >= excess:
+                break
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", keys)
+        self._add_size(-removed)
+        print(f"Evicted {len(keys)} entries from embedding cache")
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            size = self._size()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """Return the process-wide embedding cache, creating it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+    return _cache
+
+
+def _embed_batch(session, texts, model, max_retries=3, backoff=0.5):
+    """
+    Embed one batch of texts through Ollama's multi-input embed endpoint.
+    Retries the whole batch with exponential backoff and returns None for
+    every text if it still fails.
+    """
+    data = {"model": model, "input": texts}
+
+    with span("embedding_batch", model=model) as batch_span:
+        batch_span.add("chunks", len(texts))
+        for attempt in range(max_retries):
+            try:
+                response = session.post(EMBED_URL, json=data)
+                response.raise_for_status()
+                embeddings = response.json().get("embeddings", [])
+                if len(embeddings) != len(texts):
+                    raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+                return embeddings
+            except Exception as e:
+                print(f"Embedding batch failed (attempt {attempt + 1}/{max_retries}): {e}")
+                batch_span.add("retries")
+                if attempt + 1 < max_retries:
+                    time.sleep(backoff * (2 ** attempt))
+
+        batch_span.add("failed_chunks", len(texts))
+        return [None] * len(texts)
+
+
+def get_embeddings(texts, model=EMBEDDING_MODEL, batch_size=32, max_workers=4, use_cache=True):
+    """
+    Embed a list of texts in batches with a bounded number of requests in flight.
+    Texts already in the embedding cache, or repeated within `texts`, are only
+    sent to Ollama once.
+
+    Args:
+        texts (list): Texts to embed
+        model (str): Ollama embedding model name
+        batch_size (int): Number of texts sent per request
+        max_workers (int): Maximum number of concurrent requests
+        use_cache (bool): Whether to consult and fill the embedding cache
+
+    Returns:
+        list: Embeddings in the same order as `texts`, None where a batch failed
+    """
+    if not texts:
+        return []
+
+    cache = get_embedding_cache() if use_cache else None
+    embeddings = cache.get_many(texts, model) if cache else [None] * len(texts)
+
+    # Only embed texts missing from the cache, once per distinct cache key
+    pending = {}
+    for idx, text in enumerate(texts):
+        if embeddings[idx] is None:
+            pending.setdefault(EmbeddingCache.make_key(text, model), []).append(idx)
+    if cache:
+        incr("embedding_cache_hits", len(texts) - sum(len(indices) for indices in pending.values()), model=model)
+    if not pending:
+        print(f"All {len(texts)} chunks served from embedding cache")
+        return embeddings
+
+    missing = [texts[indices[0]] for indices in pending.values()]
+    batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+    start = time.perf_counter()
+
+    from helper import get_http_session
+
+    session = get_http_session()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(lambda batch: _embed_batch(session, batch, model), batches)
+        new_embeddings = [embedding for batch in results for embedding in batch]
+
+    for indices, embedding in zip(pending.values(), new_embeddings):
+        for idx in indices:
+            embeddings[idx] = embedding
+    if cache:
+        cache.put_many(missing, new_embeddings, model)
+
+    elapsed = time.perf_counter() - start
+    rate = len(missing) / elapsed if elapsed > 0 else float("inf")
+    print(
+        f"Embedded {len(missing)} chunks in {elapsed:.2f}s ({rate:.1f} chunks/sec), "
+        f"{len(texts) - len(missing)} served from cache"
+    )
+
+    return embeddings
@@ -0,0 +1,153 @@
+import base64
+import os
+
+import numpy as np
+
+# Embedding models served by Ollama. `dimension` is the native vector size,
+# `normalize` whether the model's vectors are meant to be compared by cosine,
+# and `matryoshka_dimensions` the prefixes the model was trained to keep useful
+# on their own (Matryoshka representation learning).
+EMBEDDING_MODELS = {
+    "nomic-embed-text": {
+        "description": "nomic-embed-text v1.5, 8k context",
+        "dimension": 768,
+        "normalize": True,
+        "matryoshka_dimensions": [512, 256, 128, 64],
+    },
+    "mxbai-embed-large": {
+        "description": "mxbai-embed-large v1, 512 token context",
+        "dimension": 1024,
+        "normalize": True,
+        "matryoshka_dimensions": [512, 256, 128],
+    },
+    "all-minilm": {
+        "description": "all-MiniLM-L6-v2, small and fast",
+        "dimension": 384,
+        "normalize": True,
+        "matryoshka_dimensions": [],
+    },
+    "bge-m3": {
+        "description": "BGE-M3, multilingual, 8k context",
+        "dimension": 1024,
+        "normalize": True,
+        "matryoshka_dimensions": [],
+    },
+}
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
+# Stored vector size for new indices; 0 keeps the model's native dimension
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", 0))
+# How vectors are reduced to EMBEDDING_DIMENSION: "truncate" (Matryoshka prefix) or "pca"
+EMBEDDING_REDUCTION = os.getenv("EMBEDDING_REDUCTION", "truncate")
+# Embeddings a PCA projection is fitted on, taken from the first chunks ingested into an index
+PCA_FIT_SAMPLES = int(os.getenv("PCA_FIT_SAMPLES", 2048))
+
+# Indices created before the registry store full nomic-embed-text vectors
+LEGACY_EMBEDDING = {"model": "nomic-embed-text", "native_dimension": 768, "dimension": 768, "reduction": "none"}
+
+
+def get_model(name=None):
+    name = name or EMBEDDING_MODEL
+    if name not in EMBEDDING_MODELS:
+        raise ValueError(f"Unknown embedding model: {name}")
+    return EMBEDDING_MODELS[name]
+
+
+def embedding_config(model=None, dimension=None, reduction=None):
+    """
+    Embedding settings recorded on a new index.
+
+    Args:
+        model (str): Registry model name, EMBEDDING_MODEL by default
+        dimension (int): Stored dimension, EMBEDDING_DIMENSION (or native) by default
+        reduction (str): "truncate" or "pca", EMBEDDING_REDUCTION by default
+
+    Returns:
+        dict: {"model", "native_dimension", "dimension", "reduction"}
+    """
+    model = model or EMBEDDING_MODEL
+    native = get_model(model)["dimension"]
+    dimension = dimension or EMBEDDING_DIMENSION or native
+    reduction = reduction or EMBEDDING_REDUCTION
+
+    if dimension > native:
+        raise ValueError(f"{model} vectors have {native} dimensions, cannot store {dimension}")
+    if dimension == native:
+        reduction = "none"
+    elif reduction not in ("truncate", "pca"):
+        raise ValueError(f"Unknown embedding reduction: {reduction}")
+    elif reduction == "truncate" and dimension not in get_model(model)["matryoshka_dimensions"]:
+        print(f"Warning: {model} is not trained for {dimension}-dimension prefixes; truncation may lose recall")
+
+    return {"model": model, "native_dimension": native, "dimension": dimension, "reduction": reduction}
+
+
+def fit_projection(vectors, dimension):
+    """
+    Fit a PCA projection onto `dimension` components.
+
+    Fewer vectors than `dimension` give fewer components; the remaining
+    output dimensions are zero.
+
+    Returns:
+        dict: {"mean": (native,) array, "components": (dimension, native) array}
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    mean = vectors.mean(axis=0)
+    _, _, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+    components = np.zeros((dimension, vectors.shape[1]), dtype=np.float32)
+    components[:min(dimension, len(vt))] = vt[:dimension]
+    if len(vectors) < dimension:
+        print(f"Warning: PCA fitted on {len(vectors)} vectors, fewer than its {dimension} dimensions")
+    return {"mean": mean, "components": components}
+
+
+def encode_projection(projection):
+    """JSON-safe form of a projection, for backends that store it as a document."""
+    return {
+        "shape": list(projection["components"].shape),
+        "mean": base64.b64encode(projection["mean"].astype(np.float32).tobytes()).decode("ascii"),
+        "components": base64.b64encode(projection["components"].astype(np.float32).tobytes()).decode("ascii"),
+    }
+
+
+def decode_projection(encoded):
+    shape = tuple(encoded["shape"])
+    return {
+        "mean": np.frombuffer(base64.b64decode(encoded["mean"]), dtype=np.float32),
+        "components": np.frombuffer(base64.b64decode(encoded["components"]), dtype=np.float32).reshape(shape),
+    }
+
+
+def reduce_vectors(config, vectors, projection=None):
+    """
+    Reduce native embeddings to an index's stored dimension.
+
+    Reduced vectors are renormalized; an index without reduction gets its
+    vectors back unchanged.
+
+    Args:
+        config (dict): The index's embedding config
+        vectors (list): Native embeddings
+        projection (dict): Fitted projection, for "pca" indices
+
+    Returns:
+        list: Embeddings as lists of floats
+    """
+    if config["reduction"] == "none":
+        return [list(vector) for vector in vectors]
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if config["reduction"] == "truncate":
+        reduced = vectors[:, :config["dimension"]]
+    else:
+        if projection is None:
+            raise ValueError("A PCA-reduced index needs its fitted projection")
+        reduced = (vectors - projection["mean"]) @ projection["components"].T
+
+    norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+    return (reduced / np.where(norms == 0, 1, norms)).tolist()
+
+
+def reduce_vector(config, vector, projection=None):
+    return reduce_vectors(config, [vector], projection)[0]
@@ -1,24 +1,14 @@
 import json
-import os
+import time
 
-import google.generativeai as genai
-import requests
-from dotenv import load_dotenv
-from langchain.prompts import PromptTemplate
+from answer_cache import get_answer_cache, replay_stream
+from context_packer import count_tokens, pack_context
+from embedding import OLLAMA_BASE_URL
+from helper import get_gemini_model, get_http_session
+from metrics import incr, observe, span
 
 # Import retrieval functions
-from retrieval import hybrid_search, keyword_search, semantic_search
-
-# Load environment variables
-load_dotenv()
-
-# Configure Gemini API with validation
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-if not gemini_api_key:
-    print("ERROR: GEMINI_API_KEY not found in environment variables")
-else:
-    print(f"Configuring Gemini with API key: {gemini_api_key[:5]}...")
-    genai.configure(api_key=gemini_api_key)
+from retrieval import answer_cache_embedding, hybrid_search, keyword_search, rrf_search, semantic_search
 
 # Define RAG prompt template
 RAG_PROMPT_TEMPLATE = """
@@ -35,46 +25,42 @@ USER QUESTION:
 YOUR ANSWER (be comprehensive, accurate, and helpful):
 """
 
-prompt = PromptTemplate(
-    input_variables=["context", "question"],
-    template=RAG_PROMPT_TEMPLATE,
-)
+# Formatted with str.format(context=..., question=...); braces in the
+# arguments are left alone, so retrieved text needs no escaping
+prompt = RAG_PROMPT_TEMPLATE
+
+#Set up generation configuration
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 2048,
+}
+
+#Configure safety settings to prevent blocking
+SAFETY_SETTINGS = {
+    "harassment": "block_none",
+    "hate": "block_none",
+    "sexual": "block_none",
+    "dangerous": "block_none",
+}
+
+OLLAMA_GENERATE_URL = f"{OLLAMA_BASE_URL}/api/generate"
 
 
 def generate_with_gemini(prompt_text, model_name="gemini-2.5-flash", stream=False):
     try:
         # Initialize model
         print(f"Initializing Gemini model: {model_name}")
-        model = genai.GenerativeModel(model_name)
-
-        #Safety check for prompt length
-        if len(prompt_text) > 50000:
-            prompt_text = prompt_text[:50000] + "...[truncated due to length]"
-            print(f"Warning: Prompt was truncated to 30000 characters")
-
-        #Set up generation configuration
-        generation_config = {
-            "temperature": 0.7,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 2048,
-        }
-
-        #Configure safety settings to prevent blocking
-        safety_settings = {
-            "harassment": "block_none",
-            "hate": "block_none",
-            "sexual": "block_none",
-            "dangerous": "block_none",
-        }
+        model = get_gemini_model(model_name)
 
         # Handle streaming vs non-streaming differently
         if stream:
             print("Starting streaming response generation...")
             response_generator = model.generate_content(
                 contents=prompt_text,
-                generation_config=generation_config,
-                safety_settings=safety_settings,
+                generation_config=GENERATION_CONFIG,
+                safety_settings=SAFETY_SETTINGS,
                 stream=True,
             )
 
@@ -93,8 +79,8 @@ def generate_with_gemini(prompt_text, model_name="gemini-2.5-flash", stream=Fals
             print("Requesting non-streaming response...")
             response = model.generate_content(
                 contents=prompt_text,
-                generation_config=generation_config,
-                safety_settings=safety_settings,
+                generation_config=GENERATION_CONFIG,
+                safety_settings=SAFETY_SETTINGS,
             )
 
             # Extract text from response
@@ -119,7 +105,7 @@ def generate_with_gemini(prompt_text, model_name="gemini-2.5-flash", stream=Fals
 def generate_with_ollama(prompt_text, model_name="deepseek-r1:1.5b", stream=False):
     """Generate response using Ollama with Deepseek model"""
     try:
-        url = "http://localhost:11434/api/generate"
+        url = OLLAMA_GENERATE_URL
         data = {
             "model": model_name,
             "prompt": prompt_text,
@@ -128,7 +114,7 @@ def generate_with_ollama(prompt_text, model_name="deepseek-r1:1.5b", stream=Fals
         }
 
         if stream:
-            response = requests.post(url, json=data, stream=True)
+            response = get_http_session().post(url, json=data, stream=True)
             response.raise_for_status()
 
             for line in response.iter_lines():
@@ -140,7 +126,7 @@ def generate_with_ollama(prompt_text, model_name="deepseek-r1:1.5b", stream=Fals
                     except json.JSONDecodeError:
                         continue
         else:
-            response = requests.post(url, json=data)
+            response = get_http_session().post(url, json=data)
             response.raise_for_status()
             return response.json().get("response", "No response generated")
     except Exception as e:
@@ -152,27 +138,52 @@ def generate_with_ollama(prompt_text, model_name="deepseek-r1:1.5b", stream=Fals
 
 
 def generate_rag_response(
-    query, index_name:str="pdf_content_index",search_type="hybrid", top_k=5, model_type="gemini-2.5-flash", stream=False
+    query, index_name:str="pdf_content_index",search_type="hybrid", top_k=5, model_type="gemini-2.5-flash", stream=False,
+    use_cache=True
 ):
     """
     Generate RAG response using retrieved chunks.
 
     Args:
         query: User query
-        search_type: Type of search (keyword, semantic, hybrid)
+        search_type: Type of search (keyword, semantic, hybrid, rrf)
         top_k: Number of chunks to retrieve
         model_type: Type of model to use (gemini, ollama)
         stream: Whether to stream the response
+        use_cache: Whether to serve and store answers in the answer cache
 
     Returns:
         Generated response or generator for streaming
     """
+    started = time.perf_counter()
     try:
+        # Step 0: Serve repeated questions from the answer cache. The query is
+        # only embedded for a near-match lookup, with the index's model
+        answer_cache = get_answer_cache()
+        query_embedding = lambda: answer_cache_embedding(index_name, query)
+
+        cached_answer = None
+        if use_cache:
+            cached_answer = answer_cache.get(index_name, model_type, search_type, top_k, query, query_embedding)
+        if cached_answer is not None:
+            print("Answer cache hit")
+            incr("answer_cache_hits", model=model_type)
+            if stream:
+                yield from replay_stream(cached_answer)
+                return
+            else:
+                return cached_answer
+
+        if use_cache:
+            incr("answer_cache_misses", model=model_type)
+
         # Step 1: Retrieve relevant chunks based on search type
         if search_type == "keyword":
             results = keyword_search(query, top_k=top_k,indexname=index_name)
         elif search_type == "semantic":
             results = semantic_search(query, top_k=top_k,indexname=index_name)
+        elif search_type == "rrf":
+            results = rrf_search(query, top_k=top_k,indexname=index_name)
         else:  # hybrid
             results = hybrid_search(query, top_k=top_k,indexname=index_name)
 
@@ -184,39 +195,38 @@ def generate_rag_response(
             else:
                 return message
 
-        # Step 2: Format retrieved contexts
-        contexts = []
-        for i, hit in enumerate(results):
-            source = hit["_source"]
-            content = source.get("content", "")
-            content_type = source.get("content_type", "unknown")
-
-            # Add metadata if available
-            metadata_info = ""
-            if "metadata" in source and source["metadata"]:
-                if "caption" in source["metadata"] and source["metadata"]["caption"]:
-                    metadata_info += f"\nCaption: {source['metadata']['caption']}"
-
-            context_entry = (
-                f"[Document {i+1} - {content_type}]{metadata_info}\n{content}"
-            )
-            contexts.append(context_entry)
-
-        # Step 3: Format the prompt using LangChain template
-        context_text = "\n\n---\n\n".join(contexts)
-        prompt_text = prompt.format(context=context_text, question=query)
+        # Step 2-3: Pack deduplicated contexts into the model's token budget
+        # and format the prompt template
+        prompt_text, _ = pack_context(results, query, model_type, prompt)
 
         # Step 4: Generate response with selected model
         if model_type == "gemini-2.5-flash":
-            if stream:
-                yield from generate_with_gemini(prompt_text, stream=True)
-            else:
-                return generate_with_gemini(prompt_text, stream=False)
+            generate = generate_with_gemini
         else:  # ollama
+            generate = generate_with_ollama
+
+        with span("generation", model=model_type, stream=stream) as generation_span:
             if stream:
-                yield from generate_with_ollama(prompt_text, stream=True)
+                pieces = []
+                for chunk in generate(prompt_text, stream=True):
+                    if not pieces:
+                        observe("time_to_first_token", time.perf_counter() - started, model=model_type)
+                    pieces.append(chunk)
+                    yield chunk
+                answer = "".join(pieces)
             else:
-                return generate_with_ollama(prompt_text, stream=False)
+                # The generate functions are generators either way; without streaming
+                # they yield nothing and return the whole answer
+                answer = yield from generate(prompt_text, stream=False)
+            if isinstance(answer, str):
+                generation_span.add("output_tokens", count_tokens(answer, model_type))
+
+        # Step 5: Cache successful answers for repeated questions
+        if use_cache and answer and not answer.startswith("Error"):
+            answer_cache.put(index_name, model_type, search_type, top_k, query, answer, query_embedding)
+
+        if not stream:
+            return answer
 
     except Exception as e:
         error_message = f"Error in RAG process: {str(e)}"
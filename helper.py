@@ -1,28 +1,164 @@
-import requests
-from opensearchpy import OpenSearch
+import os
+import threading
+import time
 
-def get_embedding(prompt, model="nomic-embed-text"):
-    url = "http://localhost:11434/api/embeddings/"
-    data = {"prompt": prompt, "model": model}
+from embedding import EMBED_URL, OLLAMA_BASE_URL, get_embedding_cache
+from embedding_models import EMBEDDING_MODEL
+from metrics import incr, span
 
-    response = requests.post(url, json=data)
-    response.raise_for_status()
+OPENSEARCH_POOL_SIZE = int(os.getenv("OPENSEARCH_POOL_SIZE", 16))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 16))
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", 60))
+OLLAMA_WARMUP = os.getenv("OLLAMA_WARMUP", "false").lower() in ("1", "true", "yes")
+OLLAMA_WARMUP_MODELS = [m for m in os.getenv("OLLAMA_WARMUP_MODELS", f"{EMBEDDING_MODEL},deepseek-r1:1.5b").split(",") if m]
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
 
-    return response.json().get("embedding",None)
+_clients = {}
+_sessions = {}
+_last_health_check = {}
+_registry_lock = threading.Lock()
+_gemini_configured = False
+
+
+def get_http_session(base_url=OLLAMA_BASE_URL, pool_size=None):
+    """
+    Return a shared keep-alive requests session for `base_url`.
+    Sessions are created once per endpoint and reused across threads.
+    """
+    import requests
+
+    with _registry_lock:
+        session = _sessions.get(base_url)
+        if session is None:
+            size = pool_size or HTTP_POOL_SIZE
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=size)
+            session.mount(base_url, adapter)
+            _sessions[base_url] = session
+    return session
+
+
+def get_embedding(prompt, model=EMBEDDING_MODEL, use_cache=True):
+    cache = get_embedding_cache() if use_cache else None
+    if cache:
+        cached = cache.get_many([prompt], model)[0]
+        if cached is not None:
+            incr("embedding_cache_hits", model=model)
+            return cached
+
+    # Same endpoint as ingestion, which returns normalized vectors
+    data = {"model": model, "input": prompt}
+
+    with span("query_embedding", model=model):
+        response = get_http_session().post(EMBED_URL, json=data)
+        response.raise_for_status()
+
+    embedding = response.json()["embeddings"][0]
+    if cache:
+        cache.put_many([prompt], [embedding], model)
+    return embedding
 
 def get_opensearch_client(host,port):
-    client = OpenSearch(
-        hosts=[{"host": host, "port": port}],
-        http_compress=True,
-        timeout=30,
-        max_retries=3,
-        retry_on_timeout=True,
-    )
-    if client.ping():
-        print("Connected to OpenSearch")
+    """
+    Return the shared pooled OpenSearch client for (host, port).
+    The client is built once per process; its health is checked lazily,
+    at most once every HEALTH_CHECK_INTERVAL seconds.
+    """
+    key = (host, port)
+    with _registry_lock:
+        client = _clients.get(key)
+        if client is None:
+            from opensearchpy import OpenSearch
+
+            client = OpenSearch(
+                hosts=[{"host": host, "port": port}],
+                http_compress=True,
+                timeout=30,
+                max_retries=3,
+                retry_on_timeout=True,
+                maxsize=OPENSEARCH_POOL_SIZE,
+            )
+            _clients[key] = client
+
+        now = time.monotonic()
+        needs_check = now - _last_health_check.get(key, float("-inf")) >= HEALTH_CHECK_INTERVAL
+        if needs_check:
+            _last_health_check[key] = now
+
+    if needs_check:
+        if client.ping():
+            print("Connected to OpenSearch")
+        else:
+            print(f"OpenSearch at {host}:{port} did not respond to ping")
 
     return client
 
 
+def get_gemini_model(model_name="gemini-2.5-flash"):
+    """
+    Return a Gemini model, importing and configuring the SDK on first use.
+    The API key is read from the environment; the entry points load .env at
+    startup, and scripts that import this module directly load it here.
+    """
+    global _gemini_configured
+    import google.generativeai as genai
+
+    with _registry_lock:
+        if not _gemini_configured:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            api_key = os.getenv("GEMINI_API_KEY")
+            if not api_key:
+                raise ValueError("GEMINI_API_KEY is not set in the environment variables.")
+            print(f"Configuring Gemini with API key: {api_key[:5]}...")
+            genai.configure(api_key=api_key)
+            _gemini_configured = True
+
+    return genai.GenerativeModel(model_name)
+
+
+def warm_up_ollama(models=None, background=True):
+    """
+    Load Ollama models into memory ahead of the first request.
+
+    A request without a prompt or input only loads the model, which then
+    stays resident for OLLAMA_KEEP_ALIVE.
+
+    Args:
+        models (list): Model names, OLLAMA_WARMUP_MODELS by default
+        background (bool): Warm up in a daemon thread and return immediately
+
+    Returns:
+        threading.Thread: The warm-up thread, or None when run in the foreground
+    """
+    models = models or OLLAMA_WARMUP_MODELS
+
+    def warm_up():
+        session = get_http_session()
+        for model in models:
+            start = time.perf_counter()
+            # Embedding models reject /api/generate, so fall back to /api/embed
+            try:
+                for endpoint in ("generate", "embed"):
+                    response = session.post(
+                        f"{OLLAMA_BASE_URL}/api/{endpoint}", json={"model": model, "keep_alive": OLLAMA_KEEP_ALIVE}
+                    )
+                    if response.ok:
+                        print(f"Warmed up Ollama model {model} in {time.perf_counter() - start:.1f}s")
+                        break
+                else:
+                    print(f"Could not warm up Ollama model {model}: HTTP {response.status_code}")
+            except Exception as e:
+                print(f"Could not warm up Ollama model {model}: {e}")
+
+    if not background:
+        warm_up()
+        return None
+    thread = threading.Thread(target=warm_up, name="ollama-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
 if __name__ == "__main__":
     get_opensearch_client("localhost",9200)
\ No newline at end of file
@@ -0,0 +1,126 @@
+import os
+
+import numpy as np
+
+# Named ANN presets for the `embedding` field. `method` is the knn_vector
+# method mapping (None keeps the engine defaults), `ef_search` the query-time
+# candidate list size (applied per engine, see index_settings) and
+# `data_type` the stored vector type.
+INDEX_PROFILES = {
+    "default": {
+        "description": "Engine defaults (nmslib HNSW, l2), as before profiles existed",
+        "method": None,
+        "ef_search": None,
+        "data_type": "float",
+    },
+    "fast": {
+        "description": "Small graph, low latency and memory, lower recall",
+        "method": {"name": "hnsw", "engine": "faiss", "space_type": "l2", "parameters": {"m": 8, "ef_construction": 64}},
+        "ef_search": 32,
+        "data_type": "float",
+    },
+    "balanced": {
+        "description": "Moderate graph and search width",
+        "method": {"name": "hnsw", "engine": "faiss", "space_type": "l2", "parameters": {"m": 16, "ef_construction": 128}},
+        "ef_search": 100,
+        "data_type": "float",
+    },
+    "high_recall": {
+        "description": "Dense graph and wide search, highest recall and latency",
+        "method": {"name": "hnsw", "engine": "faiss", "space_type": "l2", "parameters": {"m": 32, "ef_construction": 256}},
+        "ef_search": 256,
+        "data_type": "float",
+    },
+    "fp16": {
+        "description": "Balanced graph with fp16 scalar-quantized vectors, half the vector memory",
+        "method": {
+            "name": "hnsw",
+            "engine": "faiss",
+            "space_type": "l2",
+            "parameters": {"m": 16, "ef_construction": 128, "encoder": {"name": "sq", "parameters": {"type": "fp16"}}},
+        },
+        "ef_search": 100,
+        "data_type": "float",
+    },
+    "byte": {
+        "description": "Lucene HNSW over int8 vectors, a quarter of the vector memory",
+        "method": {"name": "hnsw", "engine": "lucene", "space_type": "l2", "parameters": {"m": 16, "ef_construction": 128}},
+        "ef_search": 100,
+        "data_type": "byte",
+    },
+    "shared": {
+        "description": "Lucene HNSW for the shared multi-document index (efficient filtered kNN)",
+        "method": {"name": "hnsw", "engine": "lucene", "space_type": "l2", "parameters": {"m": 16, "ef_construction": 128}},
+        "ef_search": 100,
+        "data_type": "float",
+    },
+}
+
+DEFAULT_INDEX_PROFILE = os.getenv("INDEX_PROFILE", "default")
+
+
+def get_profile(name=None):
+    name = name or DEFAULT_INDEX_PROFILE
+    if name not in INDEX_PROFILES:
+        raise ValueError(f"Unknown index profile: {name}")
+    return INDEX_PROFILES[name]
+
+
+def knn_field_mapping(name=None, dimension=768):
+    """Mapping of the `embedding` field for a profile."""
+    profile = get_profile(name)
+    mapping = {"type": "knn_vector", "dimension": dimension}
+    if profile["method"]:
+        mapping["method"] = dict(profile["method"], parameters=dict(profile["method"].get("parameters", {})))
+        # Faiss reads its search width from the method parameters, not the index setting
+        if profile["method"]["engine"] == "faiss" and profile["ef_search"]:
+            mapping["method"]["parameters"]["ef_search"] = profile["ef_search"]
+    if profile["data_type"] != "float":
+        mapping["data_type"] = profile["data_type"]
+    return mapping
+
+
+def index_settings(name=None):
+    """Index-level settings for a profile."""
+    profile = get_profile(name)
+    settings = {"knn": True}
+    engine = (profile["method"] or {}).get("engine", "nmslib")
+    # Only nmslib reads this setting: faiss takes ef_search from the mapping
+    # (see knn_field_mapping) and Lucene its search width from `k` at query time
+    if profile["ef_search"] and engine == "nmslib":
+        settings["knn.algo_param.ef_search"] = profile["ef_search"]
+    return settings
+
+
+def search_k(name, top_k):
+    """Number of neighbours to request from the graph for `top_k` results."""
+    profile = get_profile(name)
+    engine = (profile["method"] or {}).get("engine", "nmslib")
+    if engine == "lucene" and profile["ef_search"]:
+        return max(top_k, profile["ef_search"])
+    return top_k
+
+
+def quantize_vector(name, vector):
+    """
+    Convert an embedding to the profile's stored type. Byte profiles store
+    unit-normalized vectors scaled to int8.
+    """
+    if get_profile(name)["data_type"] != "byte":
+        return vector
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector = vector / norm
+    return np.clip(np.round(vector * 127), -128, 127).astype(int).tolist()
+
+
+def bytes_per_vector(name=None, dimension=768):
+    """Approximate raw vector memory per chunk for a profile."""
+    profile = get_profile(name)
+    if profile["data_type"] == "byte":
+        return dimension
+    encoder = (profile["method"] or {}).get("parameters", {}).get("encoder", {})
+    if encoder.get("parameters", {}).get("type") == "fp16":
+        return dimension * 2
+    return dimension * 4
@@ -0,0 +1,187 @@
+import hashlib
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from ingestion import PARTITION_WORKERS, ingest_pdf_file
+from vector_store import index_exists
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 1))
+# Seconds a finished job is kept for get() and jobs() before it is pruned
+INGEST_JOB_RETENTION = float(os.getenv("INGEST_JOB_RETENTION", 3600))
+
+# Progress stages in pipeline order, with the unit shown next to their counts
+PROGRESS_STAGES = [
+    ("partitioned", "pages"), ("captioned", "images/tables"), ("merged", "duplicates"), ("embedded", "chunks"), ("indexed", "chunks"),
+]
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestJob:
+    """State of one background ingest, updated by the worker running it."""
+
+    def __init__(self, job_id, key, pdf_path, index_name, force):
+        self.id = job_id
+        self.key = key
+        self.pdf_path = pdf_path
+        self.index_name = index_name
+        self.force = force
+        self.status = "queued"  # queued, running, done, skipped or failed
+        self.stage = None
+        self.progress = {}
+        self.message = ""
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def set_stage(self, stage):
+        with self._lock:
+            self.stage = stage
+
+    def set_progress(self, stage, done, total):
+        with self._lock:
+            self.progress[stage] = (done, total)
+
+    def finish(self, status, message):
+        with self._lock:
+            self.status = status
+            self.message = message
+            self.finished_at = time.time()
+
+    def describe(self):
+        """One-line status for the UI."""
+        with self._lock:
+            if self.status == "queued":
+                return f"⏳ `{self.index_name}` is queued for ingestion."
+            if not self.active:
+                return self.message
+
+            parts = []
+            for stage, unit in PROGRESS_STAGES:
+                if stage in self.progress:
+                    done, total = self.progress[stage]
+                    parts.append(f"{stage} {done}/{total} {unit}" if total else f"{stage} {done} {unit}")
+            elapsed = time.time() - self.submitted_at
+            return f"⏳ Ingesting `{self.index_name}` ({elapsed:.0f}s): " + (" · ".join(parts) or f"{self.stage or 'starting'}...")
+
+
+class IngestJobQueue:
+    """
+    Runs PDF ingests on a pool of background workers.
+
+    Submitting a file whose contents match a queued or running job returns
+    that job instead of starting another one. A forced submission upgrades
+    a queued job to a forced one, and queues a forced follow-up behind a
+    running job that was not forced. Jobs for the same index run one at a
+    time, in submission order. Finished jobs are pruned after `retention`
+    seconds.
+    """
+
+    def __init__(self, workers=INGEST_WORKERS, retention=INGEST_JOB_RETENTION):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest-job")
+        # Concurrent jobs share the cores between their partition pools, as in batch_ingest
+        self._partition_workers = max(1, PARTITION_WORKERS // workers)
+        self.retention = retention
+        self._jobs = {}
+        self._active_by_key = {}
+        self._waiting_by_index = {}  # index name -> jobs queued behind the one running on it
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, pdf_path, index_name, force=False):
+        key = file_digest(pdf_path)
+        with self._lock:
+            self._prune()
+            job = self._active_by_key.get(key)
+            if job is not None and job.status == "queued":
+                job.force = job.force or force
+                print(f"Merged duplicate submission of {os.path.basename(pdf_path)} into job {job.id}")
+                return job
+            if job is not None and job.active and (job.force or not force):
+                print(f"Merged duplicate submission of {os.path.basename(pdf_path)} into job {job.id}")
+                return job
+
+            job = IngestJob(next(self._ids), key, pdf_path, index_name, force)
+            self._jobs[job.id] = job
+            self._active_by_key[key] = job
+            waiting = self._waiting_by_index.get(index_name)
+            if waiting is not None:
+                # Started by the job ahead of it once that one finishes
+                waiting.append(job)
+                return job
+            self._waiting_by_index[index_name] = deque()
+
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs(self):
+        return sorted(self._jobs.values(), key=lambda job: job.id)
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _run(self, job):
+        # Under the queue lock, so a forced submission either upgrades the job or follows it
+        with self._lock:
+            job.status = "running"
+        try:
+            if not index_exists(job.index_name):
+                ingest_pdf_file(
+                    job.pdf_path, job.index_name, partition_workers=self._partition_workers,
+                    on_stage=job.set_stage, on_progress=job.set_progress,
+                )
+                job.finish("done", "✅ Ingestion completed successfully!")
+            elif job.force:
+                # Only pages that changed since the last ingest are re-processed
+                ingest_pdf_file(
+                    job.pdf_path, job.index_name, incremental=True, partition_workers=self._partition_workers,
+                    on_stage=job.set_stage, on_progress=job.set_progress,
+                )
+                job.finish("done", "✅ Re-ingestion completed successfully!")
+            else:
+                job.finish("skipped", f"⚠️ Index `{job.index_name}` already exists. Skipping ingestion.")
+        except Exception as e:
+            print(f"Ingest job {job.id} failed: {e}")
+            job.finish("failed", f"❌ Ingestion of `{job.index_name}` failed: {e}")
+        finally:
+            with self._lock:
+                if self._active_by_key.get(job.key) is job:
+                    del self._active_by_key[job.key]
+                waiting = self._waiting_by_index[job.index_name]
+                next_job = waiting.popleft() if waiting else None
+                if next_job is None:
+                    del self._waiting_by_index[job.index_name]
+            if next_job is not None:
+                self._executor.submit(self._run, next_job)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_ingest_queue():
+    """Return the process-wide ingest job queue, creating it on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = IngestJobQueue()
+    return _queue
@@ -1,59 +1,219 @@
-from helper import get_embedding
+import json
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import chain, islice
 
-def create_index_if_not_exists(client, index_name):
+import numpy as np
+
+from context_packer import estimate_tokens
+from dedup import DEDUP_THRESHOLD, DEDUP_WINDOW, dedupe_chunks
+from embedding import get_embeddings
+from embedding_models import EMBEDDING_MODEL, PCA_FIT_SAMPLES, embedding_config, fit_projection, get_model, reduce_vectors
+from index_profiles import DEFAULT_INDEX_PROFILE, index_settings, knn_field_mapping
+from metrics import span
+
+def create_index_if_not_exists(client, index_name, recreate=True, shared=False, profile=None, embedding=None):
     """
     Create an OpenSearch index with proper mapping for vector search if it doesn't exist.
+    An existing index is deleted and rebuilt when `recreate` is True, and kept otherwise.
+
+    `profile` names the ANN preset from index_profiles used for the embedding
+    field; it is recorded in the index `_meta` so searches can apply it too.
+    A `shared` multi-document index defaults to the "shared" profile, whose
+    Lucene engine supports filtered kNN on `doc_id`. `embedding` (see
+    embedding_models.embedding_config) sets the model and stored dimension,
+    and is recorded in `_meta` the same way.
     """
     if client.indices.exists(index=index_name):
         print(f"Index '{index_name}' already exists")
+        if not recreate:
+            return
         client.indices.delete(index=index_name)
 
+    if profile is None:
+        profile = "shared" if shared else DEFAULT_INDEX_PROFILE
+    embedding = embedding or embedding_config()
+
     # Define correct mapping using knn_vector
     mappings = {
         "mappings": {
+            "_meta": {"index_profile": profile, "embedding": embedding},
             "properties": {
                 "content": {"type": "text"},
                 "content_type": {"type": "keyword"},
                 "filename": {"type": "keyword"},
-                "embedding": {"type": "knn_vector", "dimension": 768}
+                "doc_id": {"type": "keyword"},
+                "page_number": {"type": "integer"},
+                "page_numbers": {"type": "integer"},
+                "page_hash": {"type": "keyword"},
+                "page_hashes": {"type": "keyword"},
+                "source_pages": {"type": "integer"},
+                "token_count": {"type": "integer"},
+                "embedding": knn_field_mapping(profile, embedding["dimension"])
             }
         },
         "settings": {
-            "index": {
-                "knn": True
-            }
+            "index": index_settings(profile)
         }
     }
 
     try:
         client.indices.create(index=index_name, body=mappings)
-        print(f"Created index '{index_name}' with vector search capabilities.")
+        print(f"Created index '{index_name}' with vector search capabilities ({profile} profile).")
     except Exception as e:
         print(f"Error creating index: {e}")
         raise
 
 
-def prepare_chunks_for_ingestion(chunks):
+def supports_incremental_ingestion(client, index_name):
+    """
+    Check whether an existing index stores page hashes, which incremental
+    re-ingestion needs. Indices created before page hashing return False.
+    """
+    if not client.indices.exists(index=index_name):
+        return False
+    mapping = client.indices.get_mapping(index=index_name)
+    properties = mapping.get(index_name, {}).get("mappings", {}).get("properties", {})
+    return "page_hash" in properties
+
+
+def get_stored_page_hashes(client, index_name, doc_id=None):
+    """
+    Return {page_number: page_hash} for the pages currently stored in the index,
+    or for one document of a shared index.
+
+    Every page a chunk covers is read from its "page:hash" `page_hashes`
+    entries; chunks from indices without them only give their first page.
+    """
+    search_query = {
+        "size": 0,
+        "query": {"term": {"doc_id": doc_id}} if doc_id else {"match_all": {}},
+        "aggs": {
+            "pages": {
+                "terms": {"field": "page_number", "size": 65536},
+                "aggs": {"page_hash": {"terms": {"field": "page_hash", "size": 1}}},
+            },
+            "page_hashes": {"terms": {"field": "page_hashes", "size": 65536}},
+        },
+    }
+
+    response = client.search(index=index_name, body=search_query, routing=doc_id)
+    page_hashes = {}
+    for bucket in response["aggregations"]["pages"]["buckets"]:
+        hash_buckets = bucket["page_hash"]["buckets"]
+        if hash_buckets:
+            page_hashes[int(bucket["key"])] = hash_buckets[0]["key"]
+    for bucket in response["aggregations"]["page_hashes"]["buckets"]:
+        page, page_hash = bucket["key"].split(":", 1)
+        page_hashes[int(page)] = page_hash
+    return page_hashes
+
+
+def _page_query(page_numbers, doc_id=None):
+    """Chunks covering any of the pages, by `page_numbers` or, in older indices, `page_number`."""
+    pages = sorted(page_numbers)
+    query = {"bool": {"should": [{"terms": {"page_numbers": pages}}, {"terms": {"page_number": pages}}], "minimum_should_match": 1}}
+    if doc_id:
+        query["bool"]["filter"] = [{"term": {"doc_id": doc_id}}]
+    return query
+
+
+def get_pages_sharing_chunks(client, index_name, page_numbers, doc_id=None):
+    """Return every page covered by a chunk that covers one of `page_numbers`."""
+    if not page_numbers:
+        return set()
+
+    search_query = {
+        "size": 0,
+        "query": _page_query(page_numbers, doc_id),
+        "aggs": {"pages": {"terms": {"field": "page_numbers", "size": 65536}}},
+    }
+    response = client.search(index=index_name, body=search_query, routing=doc_id)
+    return set(page_numbers) | {int(bucket["key"]) for bucket in response["aggregations"]["pages"]["buckets"]}
+
+
+def stale_pages(store, index_name, page_numbers, doc_id=None):
+    """
+    Close a set of changed pages over the chunks that span them: a chunk
+    covering pages 3-4 goes stale when page 4 changes, so page 3 has to be
+    processed again too, and so on for the chunks covering page 3.
+    """
+    pages = set(page_numbers)
+    while True:
+        expanded = store.pages_sharing_chunks(index_name, pages, doc_id)
+        if expanded <= pages:
+            return pages
+        pages |= expanded
+
+
+def delete_page_chunks(client, index_name, page_numbers, doc_id=None):
+    """
+    Delete every chunk covering any of the given pages, within one document
+    of a shared index when `doc_id` is given.
+    """
+    if not page_numbers:
+        return 0
+
+    response = client.delete_by_query(
+        index=index_name,
+        body={"query": _page_query(page_numbers, doc_id)},
+        routing=doc_id,
+        refresh=True,
+    )
+    deleted = response.get("deleted", 0)
+    print(f"Deleted {deleted} stale chunks from {len(page_numbers)} pages in '{index_name}'")
+    return deleted
+
+
+def prepare_chunks_for_ingestion(chunks, batch_size=32, max_workers=4, model=EMBEDDING_MODEL):
     """
     Prepare chunks for ingestion by adding embeddings.
+    Embeddings are requested in batches with several requests in flight,
+    and have the model's native dimension.
     """
+    dimension = get_model(model)["dimension"]
     prepared_chunks = []
 
+    valid_chunks = []
     for idx, chunk in enumerate(chunks):
         if not chunk.get("content"):
             print(f"Skipping Chunk {idx} due to missing content")
             continue
+        valid_chunks.append((idx, chunk))
+
+    # Generate embeddings
+    embeddings = get_embeddings(
+        [chunk["content"] for _, chunk in valid_chunks],
+        model=model,
+        batch_size=batch_size,
+        max_workers=max_workers,
+    )
 
+    for (idx, chunk), embedding in zip(valid_chunks, embeddings):
         try:
-            # Generate embedding
-            embedding = get_embedding(chunk["content"])
-            if len(embedding) != 768:
+            if embedding is None:
+                raise ValueError("No embedding returned")
+            if len(embedding) != dimension:
                 raise ValueError(f"Invalid embedding dimension: {len(embedding)}")
 
             chunk_data = {
                 "content": chunk.get("content", ""),
                 "content_type": chunk.get("content_type", "text"),
                 "filename": chunk.get("filename", None),
+                "doc_id": chunk.get("doc_id", None),
+                "page_number": chunk.get("page_number", None),
+                "page_numbers": chunk.get("page_numbers", None),
+                "page_hash": chunk.get("page_hash", None),
+                "page_hashes": chunk.get("page_hashes", None),
+                "source_pages": chunk.get("source_pages", None),
+                "token_count": estimate_tokens(chunk["content"]),
                 "embedding": embedding
             }
 
@@ -66,88 +226,731 @@ def prepare_chunks_for_ingestion(chunks):
     return prepared_chunks
 
 
-def ingest_chunks_into_opensearch(client, index_name, chunks):
+def _bulk_action(index_name, chunk):
+    return {
+        "_index": index_name,
+        "_source": chunk,
+        # Keep each document of a shared index on a single shard
+        **({"_routing": chunk["doc_id"]} if chunk.get("doc_id") else {})
+    }
+
+
+def ingest_chunks_into_opensearch(client, index_name, chunks, chunk_size=500):
     """
     Ingest prepared chunks into the specified OpenSearch index.
+    `chunks` may be any iterable; documents are sent with streaming_bulk so
+    only `chunk_size` of them are held in memory at a time.
     """
     from opensearchpy import helpers
 
-    actions = []
-    for chunk in chunks:
-        action = {
-            "_index": index_name,
-            "_source": chunk
-        }
-        actions.append(action)
+    actions = (_bulk_action(index_name, chunk) for chunk in chunks)
 
+    indexed = 0
+    failed = 0
     try:
-        helpers.bulk(client, actions)
-        print(f"Ingested {len(actions)} chunks into index '{index_name}'.")
+        for ok, info in helpers.streaming_bulk(client, actions, chunk_size=chunk_size, raise_on_error=False):
+            if ok:
+                indexed += 1
+            else:
+                failed += 1
+                print(f"Failed to index chunk: {info}")
+        print(f"Ingested {indexed} chunks into index '{index_name}' ({failed} failed).")
     except Exception as e:
         print(f"Error ingesting chunks into index '{index_name}': {e}")
         raise
 
+    return indexed
+
 
-def ingest_all_content_into_opensearch(processed_images, processed_tables, semantic_chunks, index_name):
+BULK_THREAD_COUNT = int(os.getenv("BULK_THREAD_COUNT", 4))
+BULK_MAX_CHUNK_BYTES = int(os.getenv("BULK_MAX_CHUNK_BYTES", 10 * 1024 * 1024))
+# Rejections from a busy cluster (or a failed request) are worth retrying; mapping errors are not
+_RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+
+_bulk_loads = {}  # index name -> [loads in progress, settings to restore]
+_bulk_loads_lock = threading.Lock()
+
+
+@contextmanager
+def bulk_load_settings(client, index_name):
     """
-    Ingest all content into OpenSearch.
+    Turn off refresh and replicas on `index_name` for the duration of a load,
+    then restore the previous settings and refresh. Searches on the index do
+    not see new documents until the load finishes.
+
+    Overlapping loads into one index (e.g. batch ingestion into the shared
+    index) are counted: the first one saves and changes the settings, and
+    the last one to finish restores them.
     """
-    from helper import get_opensearch_client
+    with _bulk_loads_lock:
+        entry = _bulk_loads.get(index_name)
+        if entry is None:
+            current = client.indices.get_settings(index=index_name)[index_name]["settings"]["index"]
+            # A missing refresh_interval means the default, which `None` restores
+            restore = {
+                "refresh_interval": current.get("refresh_interval"),
+                "number_of_replicas": current.get("number_of_replicas", "1"),
+            }
+            client.indices.put_settings(index=index_name, body={"index": {"refresh_interval": "-1", "number_of_replicas": 0}})
+            entry = _bulk_loads[index_name] = [0, restore]
+        entry[0] += 1
 
-    # Create OpenSearch client
-    client = get_opensearch_client("localhost", 9200)
+    try:
+        yield
+    finally:
+        with _bulk_loads_lock:
+            entry[0] -= 1
+            if entry[0] == 0:
+                del _bulk_loads[index_name]
+                client.indices.put_settings(index=index_name, body={"index": entry[1]})
+                print(f"Restored settings of '{index_name}' after bulk load: {entry[1]}")
+        client.indices.refresh(index=index_name)
 
-    # Create index
-    create_index_if_not_exists(client, index_name)
 
-    # Prepare and ingest images
-    image_chunks = prepare_chunks_for_ingestion(processed_images)
-    ingest_chunks_into_opensearch(client, index_name, image_chunks)
+def bulk_load_into_opensearch(client, index_name, chunks, chunk_size=500, max_chunk_bytes=BULK_MAX_CHUNK_BYTES,
+                              thread_count=BULK_THREAD_COUNT, max_retries=3, backoff=2.0, force_merge=False):
+    """
+    Load prepared chunks with parallel bulk requests, for large backfills.
 
-    # Prepare and ingest tables
-    table_chunks = prepare_chunks_for_ingestion(processed_tables)
-    ingest_chunks_into_opensearch(client, index_name, table_chunks)
+    Refresh and replicas are disabled during the load (see bulk_load_settings).
+    Documents rejected with a retryable status are sent again with
+    exponential backoff; other failures are reported and skipped.
 
-    # Prepare and ingest semantic chunks
-    semantic_chunks_data = prepare_chunks_for_ingestion(semantic_chunks)
-    ingest_chunks_into_opensearch(client, index_name, semantic_chunks_data)
+    Args:
+        client (OpenSearch): OpenSearch client
+        index_name (str): Target index
+        chunks (iterable): Prepared chunks with embeddings
+        chunk_size (int): Maximum documents per bulk request
+        max_chunk_bytes (int): Maximum bytes per bulk request
+        thread_count (int): Bulk requests in flight
+        max_retries (int): Retry rounds for rejected documents
+        backoff (float): Base delay in seconds between retry rounds
+        force_merge (bool): Force-merge the index to one segment after the load
 
+    Returns:
+        int: Number of indexed chunks
+    """
+    from opensearchpy import helpers
 
-if __name__ == "__main__":
-    from unstructured.partition.pdf import partition_pdf
-    from chunking import process_images_with_caption, process_tables_with_description, create_semantic_chunks
+    stats = {"indexed": 0, "failed": 0, "bytes": 0}
 
-    pdf_file_path = "files/rag survey.pdf"
+    def load(actions):
+        # parallel_bulk yields one result per action, in order, so the
+        # in-flight queue pairs each result with its document
+        in_flight = deque()
+
+        def tracked():
+            for action in actions:
+                in_flight.append(action)
+                yield action
+
+        rejected = []
+        for ok, info in helpers.parallel_bulk(
+            client, tracked(), thread_count=thread_count, chunk_size=chunk_size,
+            max_chunk_bytes=max_chunk_bytes, raise_on_error=False, raise_on_exception=False,
+        ):
+            action = in_flight.popleft()
+            if ok:
+                stats["indexed"] += 1
+                continue
+            status = next(iter(info.values()), {}).get("status")
+            if status in _RETRYABLE_STATUSES or not isinstance(status, int):
+                rejected.append(action)
+            else:
+                stats["failed"] += 1
+                print(f"Failed to index chunk: {info}")
+        return rejected
+
+    def sized(chunk):
+        stats["bytes"] += len(json.dumps(chunk))
+        return _bulk_action(index_name, chunk)
+
+    start = time.perf_counter()
+    with bulk_load_settings(client, index_name):
+        rejected = load(sized(chunk) for chunk in chunks)
+        for attempt in range(max_retries):
+            if not rejected:
+                break
+            delay = backoff * (2 ** attempt)
+            print(f"Retrying {len(rejected)} rejected chunks in {delay:.1f}s (attempt {attempt + 1}/{max_retries})")
+            time.sleep(delay)
+            rejected = load(rejected)
+        stats["failed"] += len(rejected)
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Bulk-loaded {stats['indexed']} chunks into '{index_name}' in {elapsed:.1f}s "
+        f"({stats['indexed'] / elapsed:.0f} docs/sec, {stats['bytes'] / elapsed / 1024 / 1024:.2f} MB/sec), "
+        f"{stats['failed']} failed"
+    )
+
+    if force_merge:
+        start = time.perf_counter()
+        client.indices.forcemerge(index=index_name, max_num_segments=1, request_timeout=3600)
+        print(f"Force-merged '{index_name}' in {time.perf_counter() - start:.1f}s")
+
+    return stats["indexed"]
+
+
+_STAGE_DONE = object()
+# Seconds a stage waits on a full or empty queue before checking whether the pipeline stopped
+_QUEUE_POLL = 0.5
+
+
+def _put(out_queue, item, stop):
+    """Put `item` on a bounded queue, giving up once `stop` is set. Returns whether it was put."""
+    while not stop.is_set():
+        try:
+            out_queue.put(item, timeout=_QUEUE_POLL)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _run_stage(name, produce, out_queue, errors, stop):
+    """
+    Run `produce()` in a background thread, feeding its items into the
+    bounded `out_queue` and closing it with a sentinel when done.
+    An error sets `stop`; once it is set the stage stops and closes its producer.
+    """
+    def target():
+        items = None
+        try:
+            items = produce()
+            for item in items:
+                if not _put(out_queue, item, stop):
+                    break
+        except Exception as e:
+            print(f"Error in {name} stage: {e}")
+            errors.append(e)
+            stop.set()
+        finally:
+            if hasattr(items, "close"):
+                items.close()
+            _put(out_queue, _STAGE_DONE, stop)
+
+    thread = threading.Thread(target=target, name=f"ingest-{name}", daemon=True)
+    thread.start()
+    return thread
+
+
+def _drain(in_queue, stop):
+    while True:
+        try:
+            item = in_queue.get(timeout=_QUEUE_POLL)
+        except queue.Empty:
+            if stop.is_set():
+                return
+            continue
+        if item is _STAGE_DONE:
+            return
+        yield item
+
+
+def _discard(*queues):
+    for pending in queues:
+        while True:
+            try:
+                pending.get_nowait()
+            except queue.Empty:
+                break
+
+
+def _counted(iterable, callback):
+    """Yield from `iterable`, calling `callback` with the running count."""
+    for count, item in enumerate(iterable, start=1):
+        yield item
+        callback(count)
+
+
+def _delayed(iterable, window):
+    """Yield items `window` items after they arrive."""
+    held = deque()
+    for item in iterable:
+        held.append(item)
+        if len(held) > window:
+            yield held.popleft()
+    yield from held
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+_projection_lock = threading.Lock()
+
+
+def _reduced(store, index_name, config, chunks, batch_size=256, fit_samples=PCA_FIT_SAMPLES):
+    """
+    Reduce prepared chunks' embeddings to the index's stored dimension.
+
+    A "pca" index without a projection gets one fitted on its first
+    max(`fit_samples`, 2 * dimension) chunks, which are held back until it
+    is saved. An ingest that ends before that many chunks arrive switches
+    the index to truncation for good, since a projection fitted on fewer
+    vectors would leave most dimensions empty, and vectors already stored
+    cannot be re-projected later.
+    """
+    projection = None
+    chunks = iter(chunks)
+    if config["reduction"] == "pca":
+        projection = store.projection(index_name)
+        if projection is None:
+            # Collected outside the lock: this pulls chunks through captioning and embedding
+            needed = max(fit_samples, 2 * config["dimension"])
+            sample = list(islice(chunks, needed))
+            if not sample:
+                return
+            chunks = chain(sample, chunks)
+
+            # Another ingest into the same index may have fitted or switched it meanwhile
+            with _projection_lock:
+                config = store.embedding_config(index_name)
+                projection = store.projection(index_name) if config["reduction"] == "pca" else None
+                if config["reduction"] == "pca" and projection is None:
+                    if len(sample) < needed:
+                        config = dict(config, reduction="truncate")
+                        store.set_embedding_config(index_name, config)
+                        print(
+                            f"Warning: '{index_name}' needs {needed} chunks to fit its PCA projection but got "
+                            f"{len(sample)}; it stores truncated {config['dimension']}-dimension vectors instead"
+                        )
+                    else:
+                        with span("fit_projection", dimension=config["dimension"]):
+                            projection = fit_projection([chunk["embedding"] for chunk in sample], config["dimension"])
+                        store.save_projection(index_name, projection)
+                        print(f"Fitted a {config['dimension']}-dimension PCA projection for '{index_name}' on {len(sample)} chunks")
+
+    for batch in _batched(chunks, batch_size):
+        for chunk, embedding in zip(batch, reduce_vectors(config, [chunk["embedding"] for chunk in batch], projection)):
+            chunk["embedding"] = embedding
+            yield chunk
+
+
+def ingest_chunk_stream(store, index_name, chunks, batch_size=32, queue_size=64, bulk_chunk_size=500, bulk_load=False,
+                        on_progress=None, dedup_threshold=DEDUP_THRESHOLD, dedup_window=DEDUP_WINDOW):
+    """
+    Ingest an iterable of chunks through an enrich -> embed -> index pipeline.
+
+    Each stage runs concurrently and hands items on through bounded queues,
+    so memory stays flat regardless of document size and embedding can run
+    while captioning is still producing chunks. Near-duplicate chunks are
+    dropped while enriching, before they cost an embedding, and embedded chunks
+    are indexed `dedup_window` chunks late so the pages of duplicates seen
+    meanwhile are stored with them; see dedup.dedupe_chunks.
+    Chunks are embedded with the index's embedding model and reduced to its
+    stored dimension before indexing; see embedding_models.
+
+    Args:
+        store (VectorStore): Backend the chunks are indexed into
+        index_name (str): Target index
+        chunks (iterable): Chunk dicts, typically lazy captioning generators
+        batch_size (int): Number of chunks embedded per batch
+        queue_size (int): Maximum number of items buffered between stages
+        bulk_chunk_size (int): Number of documents per bulk request
+        bulk_load (bool): Index through the store's bulk-load mode, for large backfills
+        on_progress (callable): Called as on_progress(stage, done, None) with running
+            "merged", "embedded" and "indexed" chunk counts
+        dedup_threshold (float): Jaccard similarity at which chunks are merged; 0 keeps every chunk
+        dedup_window (int): Embedded chunks held back before indexing
+
+    Returns:
+        int: Number of indexed chunks
+    """
+    enriched = queue.Queue(maxsize=queue_size)
+    prepared = queue.Queue(maxsize=queue_size)
+    errors = []
+    stop = threading.Event()
+    config = store.embedding_config(index_name)
+    on_progress = on_progress or (lambda stage, done, total: None)
 
-    # 1. Extract raw chunks
-    raw_chunks = partition_pdf(
-        filename=pdf_file_path,
-        strategy="hi_res",
+    # Enrich: pull chunks (and so run captioning) ahead of the embedder, merging near-duplicates
+    if dedup_threshold:
+        chunks = dedupe_chunks(chunks, dedup_threshold, on_merge=lambda merged: on_progress("merged", merged, None))
+    _run_stage("enrich", lambda: chunks, enriched, errors, stop)
+
+    # Embed: batch enriched chunks and attach embeddings
+    def embed():
+        embedded = 0
+        for batch in _batched(_drain(enriched, stop), batch_size):
+            yield from prepare_chunks_for_ingestion(batch, model=config["model"])
+            embedded += len(batch)
+            on_progress("embedded", embedded, None)
+
+    _run_stage("embed", embed, prepared, errors, stop)
+
+    # Index: stream prepared chunks into the store, one bulk request at a time
+    indexed = 0
+    try:
+        ready = _drain(prepared, stop)
+        if dedup_threshold:
+            ready = _delayed(ready, dedup_window)
+        if config["reduction"] != "none":
+            ready = _reduced(store, index_name, config, ready)
+        if bulk_load:
+            with span("bulk_load", backend=type(store).__name__) as index_span:
+                indexed = store.bulk_load_chunks(index_name, ready, chunk_size=bulk_chunk_size)
+                index_span.add("chunks", indexed)
+            on_progress("indexed", indexed, None)
+        else:
+            for batch in _batched(ready, bulk_chunk_size):
+                with span("bulk_index", backend=type(store).__name__) as index_span:
+                    count = store.index_chunks(index_name, batch, chunk_size=bulk_chunk_size)
+                    index_span.add("chunks", count)
+                indexed += count
+                on_progress("indexed", indexed, None)
+    finally:
+        # Stop the stage threads (also when indexing failed) and unblock any waiting put
+        stop.set()
+        _discard(enriched, prepared)
+
+    if errors:
+        raise errors[0]
+    return indexed
+
+
+@contextmanager
+def _invalidating_answers(store, physical_index, index_name, doc_id=None):
+    """
+    Drop cached answers for an index when an ingest starts changing it, and
+    again when it ends, so answers generated from partial contents while it
+    ran are not served afterwards. The index generation is bumped at the end,
+    which retires the answers cached by other processes too.
+    """
+    from answer_cache import get_answer_cache
+    from vector_store import ALL_DOCUMENTS
+
+    names = [index_name, ALL_DOCUMENTS] if doc_id else [index_name]
+    for name in names:
+        get_answer_cache().invalidate(name)
+    try:
+        yield
+    finally:
+        try:
+            if store.exists(physical_index):
+                store.bump_generation(physical_index)
+        except Exception as e:
+            print(f"Could not bump the generation of index '{physical_index}': {e}")
+        for name in names:
+            get_answer_cache().invalidate(name)
+
+
+def ingest_all_content_into_opensearch(processed_images, processed_tables, semantic_chunks, index_name, backend=None, profile=None,
+                                       bulk_load=False, embedding=None):
+    """
+    Ingest all content into OpenSearch, or the backend selected for the index.
+    The three inputs may be lists or generators; they are streamed through
+    one pipeline in order. `profile` names the ANN preset and `embedding`
+    the embedding config (see embedding_models.embedding_config) of a new
+    index, and `bulk_load` indexes through the bulk-load mode.
+    """
+    from vector_store import get_store, resolve_index
+
+    physical_index, doc_id = resolve_index(index_name)
+    store = get_store(physical_index, backend)
+
+    # Answers generated from the old or partial index contents are no longer valid
+    with _invalidating_answers(store, physical_index, index_name, doc_id):
+        # Create index, or replace just this document in a shared index
+        if doc_id:
+            store.create_index(physical_index, recreate=False, shared=True, profile=profile, embedding=embedding)
+            store.delete_document(physical_index, doc_id)
+        else:
+            store.create_index(physical_index, profile=profile, embedding=embedding)
+
+        # Prepare and ingest images, tables and semantic chunks
+        chunks = chain(processed_images, processed_tables, semantic_chunks)
+        if doc_id:
+            chunks = (dict(chunk, doc_id=doc_id) for chunk in chunks)
+        return ingest_chunk_stream(store, physical_index, chunks, bulk_load=bulk_load)
+
+
+def partition_pdf_pages(pdf_path, page_numbers=None, strategy="fast"):
+    """
+    Partition a whole PDF, or only the given pages (1-based).
+    Elements from a page subset keep their original page numbers and filename.
+    """
+    from unstructured.partition.pdf import partition_pdf
+    from pdf_pages import write_page_subset
+
+    partition_kwargs = dict(
+        strategy=strategy,
         infer_table_structure=True,
         extract_image_block_types=["Image", "Figure", "Table"],
         extract_image_block_to_payload=True,
         chunking_strategy=None,
     )
 
-    # 2. Process images
-    processed_images = process_images_with_caption(raw_chunks, use_gemini=True)
+    with span("partition_pdf", strategy=strategy) as partition_span:
+        if page_numbers is None:
+            raw_chunks = partition_pdf(filename=pdf_path, **partition_kwargs)
+            partition_span.add("elements", len(raw_chunks))
+            return raw_chunks
+
+        subset_path = write_page_subset(pdf_path, page_numbers)
+        try:
+            raw_chunks = partition_pdf(filename=subset_path, **partition_kwargs)
+        finally:
+            os.remove(subset_path)
+        partition_span.add("elements", len(raw_chunks))
+
+    # Map subset page numbers back to the original document
+    for element in raw_chunks:
+        if element.metadata.page_number:
+            element.metadata.page_number = page_numbers[element.metadata.page_number - 1]
+        element.metadata.filename = os.path.basename(pdf_path)
+        element.metadata.file_directory = os.path.dirname(pdf_path)
+
+    return raw_chunks
+
+
+PARTITION_WORKERS = int(os.getenv("PARTITION_WORKERS", os.cpu_count() or 1))
+# Each range pays for writing a subset PDF and starting a partition, so ranges stay a few pages long
+MIN_PAGES_PER_RANGE = 4
+
 
-    # 3. Process tables
-    processed_tables = process_tables_with_description(raw_chunks, use_gemini=True)
+def _partition_range(job):
+    pdf_path, page_numbers, strategy = job
+    return partition_pdf_pages(pdf_path, page_numbers, strategy)
 
-    # 4. Re-partition for semantic chunks
-    text_chunks = partition_pdf(
-        filename=pdf_file_path,
-        strategy="hi_res",
-        chunking_strategy="by_title",
-        max_characters=2000,
-        min_chars_to_combine=500,
-        chars_before_new_chunk=1500,
+
+def partition_pdf_parallel(pdf_path, page_numbers=None, strategy="fast", max_workers=None, pages_per_range=None):
+    """
+    Partition a PDF in page ranges across a process pool.
+
+    Each range is written to its own PDF with PyMuPDF and partitioned in a
+    worker process; elements are merged back in page order with their
+    original page numbers and filename. Title-based chunking runs on the
+    merged elements afterwards, so a section crossing a range edge is still
+    chunked as one.
+
+    Args:
+        pdf_path (str): Path to the PDF
+        page_numbers (list): Pages to partition (1-based), all pages by default
+        strategy (str): partition_pdf strategy
+        max_workers (int): Worker processes, PARTITION_WORKERS by default
+        pages_per_range (int): Pages per task, about four tasks per worker by default
+
+    Returns:
+        list: Elements in document order
+    """
+    from pdf_pages import page_count, split_page_ranges
+
+    max_workers = max_workers or PARTITION_WORKERS
+    pages = page_numbers or list(range(1, page_count(pdf_path) + 1))
+    if pages_per_range is None:
+        # Several ranges per worker even out pages that are slower to partition
+        pages_per_range = max(MIN_PAGES_PER_RANGE, math.ceil(len(pages) / (max_workers * 4)))
+    ranges = split_page_ranges(pages, pages_per_range)
+
+    if max_workers <= 1 or len(ranges) <= 1:
+        return partition_pdf_pages(pdf_path, page_numbers, strategy)
+
+    workers = min(max_workers, len(ranges))
+    start = time.perf_counter()
+    with span("partition_pdf_parallel", strategy=strategy) as partition_span:
+        # Spawned, not forked: ingests run in threaded processes (the app, batch ingestion),
+        # and a fork can copy a lock another thread holds into the child
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            jobs = [(pdf_path, page_range, strategy) for page_range in ranges]
+            raw_chunks = [element for elements in executor.map(_partition_range, jobs) for element in elements]
+        partition_span.add("pages", len(pages))
+        partition_span.add("elements", len(raw_chunks))
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Partitioned {len(pages)} pages in {len(ranges)} ranges on {workers} processes "
+        f"in {elapsed:.1f}s ({len(pages) / elapsed:.1f} pages/sec)"
+    )
+    return raw_chunks
+
+
+def _tag_pages(chunk, page_hashes, doc_id):
+    pages = chunk.get("page_numbers") or ([chunk["page_number"]] if chunk.get("page_number") else [])
+    return dict(
+        chunk,
+        page_numbers=pages,
+        page_hash=page_hashes.get(chunk.get("page_number")),
+        page_hashes=[f"{page}:{page_hashes[page]}" for page in pages if page in page_hashes],
+        doc_id=doc_id,
     )
 
-    # 5. Semantic text chunks
-    semantic_chunks = create_semantic_chunks(text_chunks)
 
-    # 6. Ingest all to OpenSearch
+def ingest_pdf_file(pdf_path, index_name, incremental=False, strategy="fast", use_gemini=True, backend=None, profile=None,
+                    bulk_load=False, partition_workers=None, on_stage=None, on_progress=None, embedding=None):
+    """
+    Partition, caption, embed and index a PDF.
+
+    With `incremental`, an existing index is kept: only pages whose fingerprint
+    changed since the last ingest are processed, and chunks of changed or
+    removed pages are deleted first. Text chunking runs within each run of
+    consecutive changed pages, so a chunk never mixes old and new pages.
+
+    In shared mode (see vector_store.resolve_index) `index_name` is the
+    document id within the shared index, and only that document is replaced.
+
+    Args:
+        pdf_path (str): Path to the PDF
+        index_name (str): Target index, or document id in shared mode
+        incremental (bool): Only re-ingest changed pages of an existing index
+        strategy (str): partition_pdf strategy
+        use_gemini (bool): Describe images and tables with Gemini
+        backend (str): "opensearch" or "local"; see vector_store.get_store
+        profile (str): ANN preset for a newly created index; see index_profiles
+        bulk_load (bool): Load with refresh and replicas off; see bulk_load_into_opensearch
+        partition_workers (int): Processes partitioning page ranges; see partition_pdf_parallel
+        on_stage (callable): Called with "fingerprint", "partition" and "index" as each stage starts
+        on_progress (callable): Called as on_progress(stage, done, total) for the
+            "partitioned" (pages), "captioned", "embedded" and "indexed" counts
+        embedding (dict): Embedding model and stored dimension of a newly created
+            index; see embedding_models.embedding_config
+
+    Returns:
+        int: Number of indexed chunks
+    """
+    from chunking import iter_images_with_caption, iter_tables_with_description, iter_semantic_chunks, chunk_elements_by_title
+    from pdf_pages import contiguous_runs, fingerprint_pages
+    from vector_store import get_store, resolve_index
+
+    on_stage = on_stage or (lambda stage: None)
+    on_progress = on_progress or (lambda stage, done, total: None)
+    physical_index, doc_id = resolve_index(index_name)
+    store = get_store(physical_index, backend)
+    on_stage("fingerprint")
+    page_hashes = fingerprint_pages(pdf_path)
+
+    # Answers generated from the old or partial index contents are no longer valid
+    with _invalidating_answers(store, physical_index, index_name, doc_id):
+        if incremental and store.supports_incremental(physical_index):
+            stored_hashes = store.stored_page_hashes(physical_index, doc_id)
+            changed_pages = [page for page, page_hash in page_hashes.items() if stored_hashes.get(page) != page_hash]
+            removed_pages = [page for page in stored_hashes if page not in page_hashes]
+            # Chunks spanning a changed page are replaced whole, so their other pages are redone too
+            stale = stale_pages(store, physical_index, changed_pages + removed_pages, doc_id)
+            print(
+                f"{len(changed_pages)} of {len(page_hashes)} pages changed, "
+                f"{len(removed_pages)} removed in '{index_name}' "
+                f"({len(stale) - len(changed_pages) - len(removed_pages)} more share chunks with them)"
+            )
+            changed_pages = sorted(page for page in stale if page in page_hashes)
+
+            store.delete_pages(physical_index, stale, doc_id)
+            if not changed_pages:
+                return 0
+            pages = sorted(changed_pages) if len(changed_pages) < len(page_hashes) else None
+        elif doc_id:
+            # Shared index: keep the other documents and replace this one
+            store.create_index(physical_index, recreate=False, shared=True, profile=profile, embedding=embedding)
+            store.delete_document(physical_index, doc_id)
+            pages = None
+        else:
+            store.create_index(physical_index, profile=profile, embedding=embedding)
+            pages = None
+
+        # 1. Raw chunks, only for the pages being (re)processed
+        on_stage("partition")
+        raw_chunks = partition_pdf_parallel(pdf_path, pages, strategy, max_workers=partition_workers)
+        page_total = len(pages) if pages else len(page_hashes)
+        on_progress("partitioned", page_total, page_total)
+
+        # 2-3. Images and tables, captioned lazily as the pipeline pulls them
+        processed_images = iter_images_with_caption(raw_chunks, use_gemini=use_gemini)
+        processed_tables = iter_tables_with_description(raw_chunks, use_gemini=use_gemini)
+
+        # 4. Chunk text by title within each run of consecutive pages
+        if pages is None:
+            text_chunks = chunk_elements_by_title(raw_chunks)
+        else:
+            text_chunks = []
+            for run in contiguous_runs(pages):
+                run_pages = set(run)
+                text_chunks.extend(chunk_elements_by_title(
+                    [element for element in raw_chunks if element.metadata.page_number in run_pages]
+                ))
+        semantic_chunks = iter_semantic_chunks(text_chunks)
+
+        # Totals for progress reporting: one chunk per image, table and composite text element
+        media_total = sum(1 for element in raw_chunks if element.category in ("Image", "Table"))
+        chunk_total = media_total + sum(1 for chunk in text_chunks if chunk.category == "CompositeElement")
+        media = _counted(chain(processed_images, processed_tables), lambda done: on_progress("captioned", done, media_total))
+
+        # 5. Tag chunks with the fingerprints of the pages they cover and their document, and stream into the store
+        chunks = (_tag_pages(chunk, page_hashes, doc_id) for chunk in chain(media, semantic_chunks))
+        on_stage("index")
+        merged = [0]
+
+        def report(stage, done, total):
+            # Merged near-duplicates are never embedded or indexed
+            if stage == "merged":
+                merged[0] = done
+                on_progress(stage, done, None)
+            else:
+                on_progress(stage, done, chunk_total - merged[0])
+
+        return ingest_chunk_stream(store, physical_index, chunks, bulk_load=bulk_load, on_progress=report)
+
+
+def migrate_to_shared_index(index_names, backend=None, delete_source=False):
+    """
+    Copy existing per-PDF indices into the shared multi-document index.
+    Each index name becomes the document id of its chunks, so the app keeps
+    addressing documents by the same name once shared mode is enabled.
+    Vectors are copied as stored, so every index must use the shared index's
+    embedding config (and, for PCA, the same projection); a new shared index
+    takes the config of the first index migrated.
+
+    Args:
+        index_names (list): Per-PDF indices to migrate
+        backend (str): "opensearch" or "local"; see vector_store.get_store
+        delete_source (bool): Delete each per-PDF index after copying it
+
+    Returns:
+        dict: Index name -> number of migrated chunks
+    """
+    from answer_cache import get_answer_cache
+    from vector_store import SHARED_INDEX_NAME, get_store
+
+    migrated = {}
+    for index_name in index_names:
+        # The shared index lives in the same backend as the index being migrated
+        store = get_store(index_name, backend)
+        config = store.embedding_config(index_name)
+        store.create_index(SHARED_INDEX_NAME, recreate=False, shared=True, embedding=config)
+        if store.embedding_config(SHARED_INDEX_NAME) != config:
+            raise ValueError(
+                f"'{index_name}' stores {config['model']} vectors of {config['dimension']} dimensions "
+                f"({config['reduction']}), which do not match '{SHARED_INDEX_NAME}'"
+            )
+        if config["reduction"] == "pca":
+            projection = store.projection(index_name)
+            shared_projection = store.projection(SHARED_INDEX_NAME)
+            if shared_projection is None:
+                store.save_projection(SHARED_INDEX_NAME, projection)
+            elif not all(np.array_equal(projection[key], shared_projection[key]) for key in ("mean", "components")):
+                raise ValueError(f"'{index_name}' was reduced with a different PCA projection than '{SHARED_INDEX_NAME}'")
+        store.delete_document(SHARED_INDEX_NAME, index_name)
+
+        migrated[index_name] = store.copy_into(index_name, SHARED_INDEX_NAME, index_name)
+        print(f"Migrated {migrated[index_name]} chunks from '{index_name}' into '{SHARED_INDEX_NAME}'")
+
+        store.bump_generation(SHARED_INDEX_NAME)
+        if delete_source:
+            store.delete_index(index_name)
+        get_answer_cache().invalidate(index_name)
+
+    return migrated
+
+
+if __name__ == "__main__":
+    pdf_file_path = "files/rag survey.pdf"
+
+    # Partition, caption, embed and index; re-runs only touch changed pages
     index_name = "pdf_content_index"
-    ingest_all_content_into_opensearch(processed_images, processed_tables, semantic_chunks, index_name)
+    ingest_pdf_file(pdf_file_path, index_name, incremental=True, strategy="hi_res")
@@ -0,0 +1,263 @@
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Metrics are off unless asked for; a disabled span is a shared no-op object
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRICS_LOG = os.getenv("METRICS_LOG", "")  # "stdout" or a file path for JSON span logs
+METRICS_ENABLED = (
+    os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+    or bool(METRICS_PORT)
+    or bool(METRICS_LOG)
+)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_enabled = METRICS_ENABLED
+
+
+class MetricsRegistry:
+    """Thread-safe counters and duration histograms, keyed by name and labels."""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def incr(self, name, value=1, labels=None):
+        key = self._key(name, labels or {})
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, labels=None):
+        key = self._key(name, labels or {})
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+
+    def snapshot(self):
+        """Plain-dict copy of every metric, e.g. for benchmark reports."""
+        with self._lock:
+            return {
+                "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in self._counters.items()],
+                "histograms": [
+                    {"name": name, "labels": dict(labels), "count": h["count"], "sum": h["sum"]}
+                    for (name, labels), h in self._histograms.items()
+                ],
+            }
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, dict(h, buckets=list(h["buckets"]))) for key, h in self._histograms.items())
+
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for bound, count in zip(self.buckets, histogram["buckets"]):
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+_registry = MetricsRegistry()
+_log_lock = threading.Lock()
+_log_file = None
+
+
+def _log(record):
+    global _log_file
+    if not METRICS_LOG:
+        return
+    line = json.dumps(record, default=str) + "\n"
+    with _log_lock:
+        if METRICS_LOG in ("stdout", "-"):
+            sys.stdout.write(line)
+            sys.stdout.flush()
+            return
+        if _log_file is None:
+            _log_file = open(METRICS_LOG, "a", buffering=1)
+        _log_file.write(line)
+
+
+class Span:
+    """
+    Times one pipeline stage. Counters added with `add` are exported as
+    `rag_<counter>_total`, the duration as `rag_stage_duration_seconds`.
+    """
+
+    __slots__ = ("stage", "labels", "counters", "start")
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+        self.counters = {}
+        self.start = None
+
+    def add(self, counter, value=1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        labels = {"stage": self.stage, **self.labels}
+        _registry.observe("rag_stage_duration_seconds", duration, labels)
+        for counter, value in self.counters.items():
+            _registry.incr(f"rag_{counter}_total", value, labels)
+        if exc_type is not None:
+            _registry.incr("rag_stage_errors_total", 1, labels)
+
+        _log({
+            "ts": time.time(),
+            "stage": self.stage,
+            "duration_ms": round(duration * 1000, 3),
+            **self.labels,
+            **self.counters,
+            **({"error": repr(exc)} if exc_type is not None else {}),
+        })
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def add(self, counter, value=1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(stage, **labels):
+    """
+    Context manager timing a pipeline stage:
+
+        with span("embedding", model=model) as s:
+            ...
+            s.add("cache_hits", hits)
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return Span(stage, labels)
+
+
+def timed(stage, **labels):
+    """Decorator form of `span` for whole functions, sync or async."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage, **labels):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def incr(name, value=1, **labels):
+    if _enabled:
+        _registry.incr(f"rag_{name}_total", value, labels)
+
+
+def observe(name, seconds, **labels):
+    if _enabled:
+        _registry.observe(f"rag_{name}_seconds", seconds, labels)
+        _log({"ts": time.time(), "metric": name, "duration_ms": round(seconds * 1000, 3), **labels})
+
+
+def set_enabled(enabled=True):
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled():
+    return _enabled
+
+
+def get_registry():
+    return _registry
+
+
+def start_metrics_server(port=None, host="0.0.0.0"):
+    """
+    Serve the registry at http://<host>:<port>/metrics from a daemon thread.
+
+    Returns:
+        ThreadingHTTPServer: The running server
+    """
+    port = port or METRICS_PORT or 9464
+    set_enabled(True)
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = _registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
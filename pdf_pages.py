@@ -0,0 +1,94 @@
+import hashlib
+import os
+import tempfile
+
+
+
+def fingerprint_pages(pdf_path):
+    """
+    Fingerprint every page of a PDF from its content stream and embedded images.
+
+    Args:
+        pdf_path (str): Path to the PDF
+
+    Returns:
+        dict: Page number (1-based) -> sha256 hex digest
+    """
+    import fitz
+
+    hashes = {}
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            digest = hashlib.sha256()
+            digest.update(page.read_contents())
+            for image in page.get_images(full=True):
+                xref = image[0]
+                try:
+                    digest.update(doc.xref_stream_raw(xref) or b"")
+                except Exception:
+                    digest.update(str(xref).encode("utf-8"))
+            hashes[page.number + 1] = digest.hexdigest()
+
+    return hashes
+
+
+def index_name_for_pdf(pdf_path):
+    """Index name of a PDF: its title metadata, or else its filename up to a year."""
+    import fitz
+
+    with fitz.open(pdf_path) as doc:
+        title = doc.metadata.get("title")
+
+    if title and title.strip():
+        return title.strip().lower().replace(" ", "_")
+    return index_name_for_filename(pdf_path)
+
+
+def index_name_for_filename(pdf_path):
+    """Index name from a PDF's filename up to a year, for files without (readable) title metadata."""
+    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    return base_name.lower().split('20')[0].replace(" ", "_")
+
+
+def page_count(pdf_path):
+    import fitz
+
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def write_page_subset(pdf_path, page_numbers):
+    """
+    Copy the given pages (1-based, in order) into a temporary PDF.
+    The caller is responsible for deleting the returned file.
+    """
+    import fitz
+
+    fd, subset_path = tempfile.mkstemp(suffix=".pdf")
+    os.close(fd)
+
+    with fitz.open(pdf_path) as doc, fitz.open() as subset:
+        for page_number in page_numbers:
+            subset.insert_pdf(doc, from_page=page_number - 1, to_page=page_number - 1)
+        subset.save(subset_path)
+
+    return subset_path
+
+
+def contiguous_runs(page_numbers):
+    """Group sorted page numbers into runs of consecutive pages."""
+    runs = []
+    for page_number in sorted(page_numbers):
+        if runs and page_number == runs[-1][-1] + 1:
+            runs[-1].append(page_number)
+        else:
+            runs.append([page_number])
+    return runs
+
+
+def split_page_ranges(page_numbers, range_size):
+    """Split page numbers into ranges of at most `range_size` consecutive pages."""
+    ranges = []
+    for run in contiguous_runs(page_numbers):
+        ranges.extend(run[i:i + range_size] for i in range(0, len(run), range_size))
+    return ranges
@@ -1,6 +1,37 @@
-from helper import get_embedding, get_opensearch_client
+from embedding_models import reduce_vector
+from helper import get_embedding
+from metrics import timed
+from vector_store import get_store, resolve_index
 
 
+def embed_query(store, index_name, query_text):
+    """
+    Embed a query the way `index_name` stores its chunks: with the index's
+    embedding model, reduced to its stored dimension.
+    """
+    config = store.embedding_config(index_name)
+    embedding = get_embedding(query_text, model=config["model"])
+    if config["reduction"] == "none":
+        return embedding
+    return reduce_vector(config, embedding, store.projection(index_name))
+
+
+def answer_cache_embedding(index_name, query_text):
+    """
+    Query embedding the answer cache matches similar questions on: from the
+    embedding model of `index_name` at its native dimension, so retrieval
+    then finds it in the embedding cache. None if embedding fails.
+    """
+    physical_index, _ = resolve_index(index_name)
+    try:
+        config = get_store(physical_index).embedding_config(physical_index)
+        return get_embedding(query_text, model=config["model"])
+    except Exception as e:
+        print(f"Could not embed query for answer cache: {e}")
+        return None
+
+
+@timed("search", search_type="keyword")
 def keyword_search(query_text, top_k=20,indexname:str="pdf_content_index"): #default
     """
     Perform keyword search using OpenSearch.
@@ -12,24 +43,17 @@ def keyword_search(query_text, top_k=20,indexname:str="pdf_content_index"): #def
     Returns:
         list: Search results
     """
-    client = get_opensearch_client("localhost", 9200)
-    index_name = indexname
+    # In shared mode the index name is a document id within the shared index
+    index_name, doc_id = resolve_index(indexname)
 
     try:
-        # Create a keyword search query
-        search_query = {
-            "size": top_k,
-            "query": {"match": {"content": query_text}},
-            "_source": ["content", "content_type", "token_count"],
-        }
-
-        response = client.search(index=index_name, body=search_query)
-        return response["hits"]["hits"]
+        return get_store(index_name).keyword_search(index_name, query_text, top_k, doc_id=doc_id)
     except Exception as e:
         print(f"Keyword search error: {e}")
         return []
 
 
+@timed("search", search_type="semantic")
 def semantic_search(query_text, top_k=20,indexname:str="pdf_content_index"):
     """
     Perform semantic search using vector embeddings.
@@ -41,34 +65,21 @@ def semantic_search(query_text, top_k=20,indexname:str="pdf_content_index"):
     Returns:
         list: Search results
     """
-    client = get_opensearch_client("localhost", 9200)
-    index_name = indexname
+    # In shared mode the index name is a document id within the shared index
+    index_name, doc_id = resolve_index(indexname)
 
     try:
         # Get embedding for the query
-        query_embedding = get_embedding(query_text)
-
-        # Create a semantic search query
-        search_query = {
-            "size": top_k,
-            "query": {
-                "knn": {
-                    "embedding": {
-                        "vector": query_embedding,
-                        "k": top_k,
-                    }
-                }
-            },
-            "_source": ["content", "content_type", "token_count"],
-        }
-
-        response = client.search(index=index_name, body=search_query)
-        return response["hits"]["hits"]
+        store = get_store(index_name)
+        query_embedding = embed_query(store, index_name, query_text)
+
+        return store.knn_search(index_name, query_embedding, top_k, doc_id=doc_id)
     except Exception as e:
         print(f"Semantic search error: {e}")
         return []
 
 
+@timed("search", search_type="hybrid")
 def hybrid_search(query_text, top_k=20,indexname:str="pdf_content_index"):
     """
     Perform hybrid search using both keyword and semantic search.
@@ -80,45 +91,94 @@ def hybrid_search(query_text, top_k=20,indexname:str="pdf_content_index"):
     Returns:
         list: Search results
     """
-    client = get_opensearch_client("localhost", 9200)
-    index_name = indexname
+    # In shared mode the index name is a document id within the shared index
+    index_name, doc_id = resolve_index(indexname)
+    store = get_store(index_name)
 
     try:
         # Get embedding for the query
-        query_embedding = get_embedding(query_text)
-
-        # Create a hybrid search query
-        search_query = {
-            "size": top_k,
-            "query": {
-                "bool": {
-                    "should": [
-                        {"knn": {"embedding": {"vector": query_embedding, "k": top_k}}},
-                        {"match": {"content": query_text}},
-                    ]
-                }
-            },
-            "_source": ["content", "content_type", "token_count"],
-        }
-
-        response = client.search(index=index_name, body=search_query)
-        return response["hits"]["hits"]
+        query_embedding = embed_query(store, index_name, query_text)
+
+        return store.hybrid_search(index_name, query_text, query_embedding, top_k, doc_id=doc_id)
     except Exception as e:
         print(f"Hybrid search error: {e}")
         # Fall back to keyword search
         try:
-            fallback_query = {
-                "size": top_k,
-                "query": {"match": {"content": query_text}},
-                "_source": ["content", "content_type", "token_count"],
-            }
-            response = client.search(index=index_name, body=fallback_query)
-            return response["hits"]["hits"]
+            return store.keyword_search(index_name, query_text, top_k, doc_id=doc_id)
         except Exception as e2:
             print(f"Fallback search error: {e2}")
             return []
 
 
+def reciprocal_rank_fusion(result_lists, weights=None, rrf_k=60):
+    """
+    Fuse ranked hit lists with weighted reciprocal rank fusion.
+
+    Args:
+        result_lists (list): Lists of hits, each ordered best first
+        weights (list): Weight per list, 1.0 each by default
+        rrf_k (int): Rank smoothing constant
+
+    Returns:
+        list: Hits ordered by fused score, with "_score" set to that score
+    """
+    weights = weights or [1.0] * len(result_lists)
+    fused = {}
+    for hits, weight in zip(result_lists, weights):
+        for rank, hit in enumerate(hits, start=1):
+            entry = fused.setdefault(hit["_id"], {**hit, "_score": 0.0})
+            entry["_score"] += weight / (rrf_k + rank)
+
+    return sorted(fused.values(), key=lambda hit: hit["_score"], reverse=True)
+
+
+@timed("search", search_type="rrf")
+def rrf_search(query_text, top_k=20, indexname:str="pdf_content_index", candidate_depth=50,
+               keyword_weight=1.0, semantic_weight=1.0, rrf_k=60):
+    """
+    Perform hybrid search by fusing keyword and semantic rankings.
+
+    Unlike hybrid_search, raw BM25 and kNN scores are never added together;
+    each leg is ranked on its own and the ranks are fused. Both legs are
+    fetched in one round trip.
+
+    Args:
+        query_text (str): The query text to search for
+        top_k (int): Number of results to return
+        candidate_depth (int): Number of candidates fetched per leg
+        keyword_weight (float): Weight of the keyword ranking
+        semantic_weight (float): Weight of the semantic ranking
+        rrf_k (int): Rank smoothing constant
+
+    Returns:
+        list: Search results
+    """
+    # In shared mode the index name is a document id within the shared index
+    index_name, doc_id = resolve_index(indexname)
+    store = get_store(index_name)
+
+    try:
+        # Get embedding for the query
+        query_embedding = embed_query(store, index_name, query_text)
+
+        keyword_hits, semantic_hits, latencies = store.keyword_and_knn_search(
+            index_name, query_text, query_embedding, max(candidate_depth, top_k), doc_id=doc_id
+        )
+        print(
+            f"RRF search legs: keyword {latencies['keyword']:.1f}ms ({len(keyword_hits)} hits), "
+            f"semantic {latencies['semantic']:.1f}ms ({len(semantic_hits)} hits)"
+        )
+
+        fused = reciprocal_rank_fusion(
+            [keyword_hits, semantic_hits], [keyword_weight, semantic_weight], rrf_k
+        )
+        return fused[:top_k]
+    except Exception as e:
+        print(f"RRF search error: {e}")
+        # Fall back to keyword search
+        return keyword_search(query_text, top_k=top_k, indexname=indexname)
+
+
 if __name__ == "__main__":
     from pprint import pprint
 
@@ -126,4 +186,5 @@ if __name__ == "__main__":
     #results = keyword_search(query, top_k=10,indexname="attention_content")
     results = semantic_search(query, top_k=10,indexname="attention_content")
     #results = hybrid_search(query, top_k=10,indexname="attention_content")
+    #results = rrf_search(query, top_k=10,indexname="attention_content")
     pprint(results)
\ No newline at end of file
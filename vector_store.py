@@ -0,0 +1,855 @@
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from embedding_models import LEGACY_EMBEDDING, decode_projection, embedding_config, encode_projection
+from index_profiles import quantize_vector, search_k
+
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "opensearch")
+LOCAL_STORE_PATH = os.getenv("LOCAL_STORE_PATH", ".cache/vector_store")
+SOURCE_FIELDS = ["content", "content_type", "token_count"]
+
+# Shared mode stores every document in one index, keyed and routed by document id
+SHARED_INDEX = os.getenv("SHARED_INDEX", "false").lower() in ("1", "true", "yes")
+SHARED_INDEX_NAME = os.getenv("SHARED_INDEX_NAME", "pdf_documents")
+ALL_DOCUMENTS = "__all__"
+
+
+def resolve_index(index_name, shared=None):
+    """
+    Map a per-document index name to (physical index, document id).
+
+    In shared mode every document lives in SHARED_INDEX_NAME and the
+    per-document name becomes its document id; ALL_DOCUMENTS searches
+    across documents. Otherwise the name is the index and there is no
+    document id.
+    """
+    if shared is None:
+        shared = SHARED_INDEX
+    if not shared:
+        return index_name, None
+    return SHARED_INDEX_NAME, None if index_name == ALL_DOCUMENTS else index_name
+
+
+class VectorStore:
+    """
+    Storage and search backend for one or more indices.
+    Search methods return OpenSearch-style hits: {"_id", "_score", "_source"}
+    and, given a `doc_id`, only consider chunks of that document.
+    """
+
+    def exists(self, index_name):
+        raise NotImplementedError
+
+    def create_index(self, index_name, recreate=True, shared=False, profile=None, embedding=None):
+        raise NotImplementedError
+
+    def delete_index(self, index_name):
+        raise NotImplementedError
+
+    def embedding_config(self, index_name):
+        """Embedding model and stored dimension of an index; see embedding_models.embedding_config."""
+        return LEGACY_EMBEDDING
+
+    def projection(self, index_name):
+        """PCA projection fitted for an index, or None."""
+        return None
+
+    def save_projection(self, index_name, projection):
+        raise NotImplementedError
+
+    def set_embedding_config(self, index_name, config):
+        """Record a changed embedding config, e.g. a PCA index that fell back to truncation."""
+        raise NotImplementedError
+
+    def generation(self, index_name):
+        """
+        Counter bumped after every ingest into an index, read from the store
+        each time so changes made by other processes are seen; None if the
+        index does not exist.
+        """
+        raise NotImplementedError
+
+    def bump_generation(self, index_name):
+        raise NotImplementedError
+
+    def index_names(self):
+        """Names of every index in the store."""
+        raise NotImplementedError
+
+    def document_exists(self, index_name, doc_id):
+        raise NotImplementedError
+
+    def document_ids(self, index_name):
+        """Ids of every document in a shared index."""
+        raise NotImplementedError
+
+    def delete_document(self, index_name, doc_id):
+        raise NotImplementedError
+
+    def copy_into(self, source_index, dest_index, doc_id):
+        """Copy every chunk of `source_index` into `dest_index` under `doc_id`."""
+        raise NotImplementedError
+
+    def index_chunks(self, index_name, chunks, chunk_size=500):
+        raise NotImplementedError
+
+    def bulk_load_chunks(self, index_name, chunks, chunk_size=500, **kwargs):
+        """Index a large stream of chunks; backends without a bulk-load mode just index them."""
+        return self.index_chunks(index_name, chunks, chunk_size=chunk_size)
+
+    def keyword_search(self, index_name, query_text, top_k, source_fields=SOURCE_FIELDS, doc_id=None):
+        raise NotImplementedError
+
+    def knn_search(self, index_name, query_vector, top_k, source_fields=SOURCE_FIELDS, doc_id=None):
+        raise NotImplementedError
+
+    def hybrid_search(self, index_name, query_text, query_vector, top_k, source_fields=SOURCE_FIELDS, doc_id=None):
+        raise NotImplementedError
+
+    def keyword_and_knn_search(self, index_name, query_text, query_vector, depth, source_fields=SOURCE_FIELDS, doc_id=None):
+        """
+        Run the keyword and kNN legs of a hybrid query together.
+
+        Returns:
+            tuple: (keyword_hits, knn_hits, {"keyword": ms, "semantic": ms})
+        """
+        raise NotImplementedError
+
+    def supports_incremental(self, index_name):
+        raise NotImplementedError
+
+    def stored_page_hashes(self, index_name, doc_id=None):
+        raise NotImplementedError
+
+    def pages_sharing_chunks(self, index_name, page_numbers, doc_id=None):
+        """Every page covered by a chunk that covers one of `page_numbers`, including those pages."""
+        raise NotImplementedError
+
+    def delete_pages(self, index_name, page_numbers, doc_id=None):
+        """Delete every chunk covering any of the pages."""
+        raise NotImplementedError
+
+
+def _doc_filter(doc_id):
+    return {"term": {"doc_id": doc_id}}
+
+
+def keyword_query_body(query_text, top_k, source_fields=SOURCE_FIELDS, doc_id=None):
+    query = {"match": {"content": query_text}}
+    if doc_id:
+        query = {"bool": {"must": [query], "filter": [_doc_filter(doc_id)]}}
+    return {"size": top_k, "query": query, "_source": source_fields}
+
+
+def _knn_clause(query_vector, top_k, doc_id=None, profile=None):
+    knn = {"vector": quantize_vector(profile, query_vector), "k": search_k(profile, top_k)}
+    if doc_id:
+        # Efficient filtering: the filter is applied during the graph search
+        knn["filter"] = _doc_filter(doc_id)
+    return {"knn": {"embedding": knn}}
+
+
+def knn_query_body(query_vector, top_k, source_fields=SOURCE_FIELDS, doc_id=None, profile=None):
+    return {
+        "size": top_k,
+        "query": _knn_clause(query_vector, top_k, doc_id, profile),
+        "_source": source_fields,
+    }
+
+
+def hybrid_query_body(query_text, query_vector, top_k, source_fields=SOURCE_FIELDS, doc_id=None, profile=None):
+    query = {
+        "bool": {
+            "should": [
+                _knn_clause(query_vector, top_k, doc_id, profile),
+                {"match": {"content": query_text}},
+            ],
+            # With a filter clause, should clauses otherwise become optional and every chunk of the document matches
+            "minimum_should_match": 1,
+        }
+    }
+    if doc_id:
+        query["bool"]["filter"] = [_doc_filter(doc_id)]
+    return {"size": top_k, "query": query, "_source": source_fields}
+
+
+def keyword_and_knn_msearch_body(index_name, query_text, query_vector, depth, source_fields=SOURCE_FIELDS, doc_id=None, profile=None):
+    header = {"index": index_name}
+    if doc_id:
+        header["routing"] = doc_id
+    return [
+        header,
+        keyword_query_body(query_text, depth, source_fields, doc_id),
+        header,
+        knn_query_body(query_vector, depth, source_fields, doc_id, profile),
+    ]
+
+
+def parse_keyword_and_knn_msearch(response):
+    """Split an _msearch response into (keyword_hits, knn_hits, latencies in ms)."""
+    responses = response["responses"]
+    for leg in responses:
+        if "error" in leg:
+            raise RuntimeError(leg["error"])
+
+    keyword_response, knn_response = responses
+    # `took` is optional in msearch items; a missing one must not fail the fused search
+    latencies = {"keyword": keyword_response.get("took") or 0, "semantic": knn_response.get("took") or 0}
+    return keyword_response["hits"]["hits"], knn_response["hits"]["hits"], latencies
+
+
+def _projection_index(index_name):
+    return f"{index_name}__projection"
+
+
+class OpenSearchStore(VectorStore):
+    """Backend for the OpenSearch cluster at `host:port`."""
+
+    def __init__(self, host="localhost", port=9200):
+        self.host = host
+        self.port = port
+        self._meta = {}
+        self._projections = {}
+
+    @property
+    def client(self):
+        from helper import get_opensearch_client
+
+        return get_opensearch_client(self.host, self.port)
+
+    def exists(self, index_name):
+        return self.client.indices.exists(index=index_name)
+
+    def _forget(self, index_name):
+        self._meta.pop(index_name, None)
+        self._projections.pop(index_name, None)
+
+    def create_index(self, index_name, recreate=True, shared=False, profile=None, embedding=None):
+        from ingestion import create_index_if_not_exists
+
+        self._forget(index_name)
+        if recreate:
+            self.client.indices.delete(index=_projection_index(index_name), ignore_unavailable=True)
+        create_index_if_not_exists(
+            self.client, index_name, recreate=recreate, shared=shared, profile=profile, embedding=embedding
+        )
+
+    def delete_index(self, index_name):
+        self._forget(index_name)
+        self.client.indices.delete(index=index_name)
+        self.client.indices.delete(index=_projection_index(index_name), ignore_unavailable=True)
+
+    def _index_meta(self, index_name):
+        """The index mapping's `_meta`, read once per index."""
+        meta = self._meta.get(index_name)
+        if meta is None:
+            mapping = self.client.indices.get_mapping(index=index_name)
+            meta = mapping.get(index_name, {}).get("mappings", {}).get("_meta", {})
+            self._meta[index_name] = meta
+        return meta
+
+    def index_profile(self, index_name):
+        """Name of the ANN profile an index was created with, read from its `_meta`."""
+        return self._index_meta(index_name).get("index_profile", "default")
+
+    def embedding_config(self, index_name):
+        return self._index_meta(index_name).get("embedding", LEGACY_EMBEDDING)
+
+    def set_embedding_config(self, index_name, config):
+        # put_mapping replaces `_meta` as a whole, so start from the current one
+        self._meta.pop(index_name, None)
+        meta = dict(self._index_meta(index_name), embedding=config)
+        self.client.indices.put_mapping(index=index_name, body={"_meta": meta})
+        self._meta[index_name] = meta
+
+    def generation(self, index_name):
+        from opensearchpy.exceptions import NotFoundError
+
+        try:
+            mapping = self.client.indices.get_mapping(index=index_name)
+        except NotFoundError:
+            return None
+        return mapping.get(index_name, {}).get("mappings", {}).get("_meta", {}).get("generation", 0)
+
+    def bump_generation(self, index_name):
+        self._meta.pop(index_name, None)
+        meta = self._index_meta(index_name)
+        meta = dict(meta, generation=meta.get("generation", 0) + 1)
+        self.client.indices.put_mapping(index=index_name, body={"_meta": meta})
+        self._meta[index_name] = meta
+
+    def projection(self, index_name):
+        # Kept in a one-document companion index, since mapping _meta lives in the cluster state
+        if index_name not in self._projections:
+            projection_index = _projection_index(index_name)
+            projection = None
+            if self.client.indices.exists(index=projection_index):
+                source = self.client.get(index=projection_index, id="projection")["_source"]
+                projection = decode_projection(source)
+            self._projections[index_name] = projection
+        return self._projections[index_name]
+
+    def save_projection(self, index_name, projection):
+        projection_index = _projection_index(index_name)
+        if not self.client.indices.exists(index=projection_index):
+            self.client.indices.create(index=projection_index, body={"mappings": {"dynamic": False}})
+        self.client.index(index=projection_index, id="projection", body=encode_projection(projection), refresh=True)
+        self._projections[index_name] = projection
+
+    def index_names(self):
+        return {name for name in self.client.indices.get_alias(index="*") if not name.startswith(".")}
+
+    def document_exists(self, index_name, doc_id):
+        if not self.exists(index_name):
+            return False
+        response = self.client.count(index=index_name, body={"query": _doc_filter(doc_id)}, routing=doc_id)
+        return response["count"] > 0
+
+    def document_ids(self, index_name):
+        if not self.exists(index_name):
+            return set()
+        response = self.client.search(
+            index=index_name, body={"size": 0, "aggs": {"docs": {"terms": {"field": "doc_id", "size": 65536}}}}
+        )
+        return {bucket["key"] for bucket in response["aggregations"]["docs"]["buckets"]}
+
+    def delete_document(self, index_name, doc_id):
+        response = self.client.delete_by_query(
+            index=index_name, body={"query": _doc_filter(doc_id)}, routing=doc_id, refresh=True
+        )
+        return response.get("deleted", 0)
+
+    def copy_into(self, source_index, dest_index, doc_id):
+        body = {
+            "source": {"index": source_index},
+            "dest": {"index": dest_index, "routing": f"={doc_id}"},
+            "script": {"source": "ctx._source.doc_id = params.doc_id", "params": {"doc_id": doc_id}},
+        }
+        response = self.client.reindex(body=body, refresh=True, wait_for_completion=True, request_timeout=3600)
+        return response.get("created", 0) + response.get("updated", 0)
+
+    def index_chunks(self, index_name, chunks, chunk_size=500):
+        from ingestion import ingest_chunks_into_opensearch
+
+        profile = self.index_profile(index_name)
+        chunks = (dict(chunk, embedding=quantize_vector(profile, chunk["embedding"])) for chunk in chunks)
+        return ingest_chunks_into_opensearch(self.client, index_name, chunks, chunk_size=chunk_size)
+
+    def bulk_load_chunks(self, index_name, chunks, chunk_size=500, **kwargs):
+        from ingestion import bulk_load_into_opensearch
+
+        profile = self.index_profile(index_name)
+        chunks = (dict(chunk, embedding=quantize_vector(profile, chunk["embedding"])) for chunk in chunks)
+        return bulk_load_into_opensearch(self.client, index_name, chunks, chunk_size=chunk_size, **kwargs)
+
+    def _search(self, index_name, body, doc_id=None):
+        # A document's chunks are routed to one shard, so scoped searches only hit that shard
+        response = self.client.search(index=index_name, body=body, routing=doc_id)
+        return response["hits"]["hits"]
+
+    def keyword_search(self, index_name, query_text, top_k, source_fields=SOURCE_FIELDS, doc_id=None):
+        return self._search(index_name, keyword_query_body(query_text, top_k, source_fields, doc_id), doc_id)
+
+    def knn_search(self, index_name, query_vector, top_k, source_fields=SOURCE_FIELDS, doc_id=None):
+        body = knn_query_body(query_vector, top_k, source_fields, doc_id, self.index_profile(index_name))
+        return self._search(index_name, body, doc_id)
+
+    def hybrid_search(self, index_name, query_text, query_vector, top_k, source_fields=SOURCE_FIELDS, doc_id=None):
+        body = hybrid_query_body(query_text, query_vector, top_k, source_fields, doc_id, self.index_profile(index_name))
+        return self._search(index_name, body, doc_id)
+
+    def keyword_and_knn_search(self, index_name, query_text, query_vector, depth, source_fields=SOURCE_FIELDS, doc_id=None):
+        # Both legs go out in a single _msearch round trip
+        body = keyword_and_knn_msearch_body(
+            index_name, query_text, query_vector, depth, source_fields, doc_id, self.index_profile(index_name)
+        )
+        return parse_keyword_and_knn_msearch(self.client.msearch(body=body))
+
+    def supports_incremental(self, index_name):
+        from ingestion import supports_incremental_ingestion
+
+        return supports_incremental_ingestion(self.client, index_name)
+
+    def stored_page_hashes(self, index_name, doc_id=None):
+        from ingestion import get_stored_page_hashes
+
+        return get_stored_page_hashes(self.client, index_name, doc_id)
+
+    def pages_sharing_chunks(self, index_name, page_numbers, doc_id=None):
+        from ingestion import get_pages_sharing_chunks
+
+        return get_pages_sharing_chunks(self.client, index_name, page_numbers, doc_id)
+
+    def delete_pages(self, index_name, page_numbers, doc_id=None):
+        from ingestion import delete_page_chunks
+
+        return delete_page_chunks(self.client, index_name, page_numbers, doc_id)
+
+
+def _tokenize(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def _top_k(scores, top_k):
+    """Indices of the `top_k` highest scores, best first."""
+    if top_k <= 0 or len(scores) == 0:
+        return np.array([], dtype=np.int64)
+    if top_k < len(scores):
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class _LocalIndex:
+    """
+    In-memory view of one local index: a memory-mapped float32 embedding
+    matrix plus chunk sources and BM25 postings.
+    """
+
+    def __init__(self, path, k1=1.2, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.dimension = meta["dimension"]
+        self.embedding = meta.get("embedding", LEGACY_EMBEDDING)
+
+        projection_path = os.path.join(path, "projection.npz")
+        self.projection = None
+        if os.path.exists(projection_path):
+            with np.load(projection_path) as data:
+                self.projection = {"mean": data["mean"], "components": data["components"]}
+
+        with open(os.path.join(path, "chunks.jsonl")) as f:
+            self.sources = [json.loads(line) for line in f]
+
+        # Only whole rows that have a source count: a concurrent or interrupted append
+        # can leave vectors without sources, or a partial row
+        vectors_path = os.path.join(path, "vectors.f32")
+        rows = min(len(self.sources), os.path.getsize(vectors_path) // (4 * self.dimension))
+        self.sources = self.sources[:rows]
+        if rows:
+            self.vectors = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dimension))
+        else:
+            self.vectors = np.zeros((0, self.dimension), dtype=np.float32)
+
+        self.doc_ids = np.array([source.get("doc_id") or "" for source in self.sources], dtype=object)
+
+        # BM25 statistics
+        self.postings = {}
+        lengths = []
+        for doc_idx, source in enumerate(self.sources):
+            terms = Counter(_tokenize(source.get("content", "")))
+            lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self.postings.setdefault(term, []).append((doc_idx, tf))
+        self.doc_lengths = np.array(lengths, dtype=np.float32)
+        self.avg_length = float(self.doc_lengths.mean()) if lengths else 0.0
+
+    def bm25_scores(self, query_text):
+        scores = np.zeros(len(self.sources), dtype=np.float32)
+        n_docs = len(self.sources)
+        for term in set(_tokenize(query_text)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            doc_ids = np.fromiter((doc_idx for doc_idx, _ in postings), dtype=np.int64, count=len(postings))
+            tfs = np.fromiter((tf for _, tf in postings), dtype=np.float32, count=len(postings))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_ids] / self.avg_length)
+            scores[doc_ids] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+        return scores
+
+    def knn_scores(self, query_vector):
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        return self.vectors @ query
+
+    def doc_mask(self, doc_id):
+        return self.doc_ids == doc_id
+
+    def hits(self, scores, top_k, source_fields, doc_id=None):
+        if doc_id:
+            mask = self.doc_mask(doc_id)
+            scores = np.where(mask, scores, -np.inf)
+            top_k = min(top_k, int(mask.sum()))
+        return [
+            {
+                "_id": str(doc_idx),
+                "_score": float(scores[doc_idx]),
+                "_source": {field: self.sources[doc_idx].get(field) for field in source_fields if field in self.sources[doc_idx]},
+            }
+            for doc_idx in _top_k(scores, top_k)
+        ]
+
+
+def _source_pages(source):
+    """Pages a stored chunk covers; chunks from before `page_numbers` only know their first page."""
+    pages = set(source.get("page_numbers") or [])
+    if source.get("page_number") is not None:
+        pages.add(source["page_number"])
+    return pages
+
+
+class LocalStore(VectorStore):
+    """
+    In-process backend keeping each index under `root/<index_name>/` as a
+    float32 embedding matrix (memory-mapped for search), a JSON-lines file
+    of chunk sources and a small metadata file. Search is brute force:
+    a dot product over normalized vectors and a BM25 keyword scorer.
+    """
+
+    def __init__(self, root=LOCAL_STORE_PATH):
+        self.root = root
+        self._loaded = {}
+        self._rows = {}
+        self._index_locks = {}
+        self._lock = threading.Lock()
+
+    def _path(self, index_name):
+        return os.path.join(self.root, index_name)
+
+    def _index_lock(self, index_name):
+        """Lock held while an index's files are written, or read into a _LocalIndex."""
+        with self._lock:
+            return self._index_locks.setdefault(index_name, threading.RLock())
+
+    def _version(self, index_name):
+        # Size and nanosecond mtime of both files, to notice writes from other processes;
+        # writes in this process invalidate the cache directly
+        path = self._path(index_name)
+        return tuple(
+            (stat.st_size, stat.st_mtime_ns)
+            for stat in (os.stat(os.path.join(path, name)) for name in ("chunks.jsonl", "vectors.f32"))
+        )
+
+    def _load(self, index_name):
+        with self._index_lock(index_name):
+            version = self._version(index_name)
+            cached = self._loaded.get(index_name)
+            if cached is None or cached[0] != version:
+                cached = (version, _LocalIndex(self._path(index_name)))
+                self._loaded[index_name] = cached
+        return cached[1]
+
+    def _invalidate(self, index_name):
+        with self._index_lock(index_name):
+            self._loaded.pop(index_name, None)
+
+    def _forget_rows(self, index_name):
+        with self._index_lock(index_name):
+            self._rows.pop(index_name, None)
+
+    @staticmethod
+    def _replace(path, write):
+        """Write a file under a temporary name and swap it in, so open memory maps keep the old file."""
+        tmp_path = f"{path}.tmp"
+        write(tmp_path)
+        os.replace(tmp_path, path)
+
+    def exists(self, index_name):
+        return os.path.exists(os.path.join(self._path(index_name), "meta.json"))
+
+    def create_index(self, index_name, recreate=True, shared=False, profile=None, embedding=None):
+        path = self._path(index_name)
+        with self._index_lock(index_name):
+            if self.exists(index_name):
+                print(f"Index '{index_name}' already exists")
+                if not recreate:
+                    return
+                shutil.rmtree(path)
+            self._invalidate(index_name)
+            self._forget_rows(index_name)
+
+            embedding = embedding or embedding_config()
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, "meta.json"), "w") as f:
+                json.dump({"dimension": embedding["dimension"], "embedding": embedding}, f)
+            open(os.path.join(path, "chunks.jsonl"), "w").close()
+            open(os.path.join(path, "vectors.f32"), "wb").close()
+        print(f"Created local index '{index_name}'.")
+
+    def index_chunks(self, index_name, chunks, chunk_size=500):
+        indexed = 0
+        batch = []
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) >= chunk_size:
+                indexed += self._append(index_name, batch)
+                batch = []
+        if batch:
+            indexed += self._append(index_name, batch)
+
+        print(f"Ingested {indexed} chunks into local index '{index_name}'.")
+        return indexed
+
+    def _append(self, index_name, chunks):
+        vectors = np.asarray([chunk["embedding"] for chunk in chunks], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        # The lock is taken per batch, so searches can reload the index between batches
+        path = self._path(index_name)
+        with self._index_lock(index_name):
+            self._trim_vectors(index_name, vectors.shape[1])
+            with open(os.path.join(path, "vectors.f32"), "ab") as vectors_file:
+                vectors_file.write(vectors.tobytes())
+            with open(os.path.join(path, "chunks.jsonl"), "a") as sources_file:
+                for chunk in chunks:
+                    source = {key: value for key, value in chunk.items() if key != "embedding"}
+                    sources_file.write(json.dumps(source) + "\n")
+            self._rows[index_name] += len(chunks)
+            self._invalidate(index_name)
+        return len(chunks)
+
+    def _trim_vectors(self, index_name, dimension):
+        """
+        Cut vectors left without a source by an interrupted append, so new rows
+        line up with their sources. The row count is read once per index and
+        then kept up to date by _append.
+        """
+        if index_name in self._rows:
+            return
+        path = self._path(index_name)
+        with open(os.path.join(path, "chunks.jsonl"), "rb") as f:
+            rows = sum(block.count(b"\n") for block in iter(lambda: f.read(1 << 20), b""))
+        vectors_path = os.path.join(path, "vectors.f32")
+        if os.path.getsize(vectors_path) > rows * 4 * dimension:
+            # Only the unmapped tail past the last whole row with a source is cut
+            os.truncate(vectors_path, rows * 4 * dimension)
+        self._rows[index_name] = rows
+
+    def delete_index(self, index_name):
+        with self._index_lock(index_name):
+            self._invalidate(index_name)
+            self._forget_rows(index_name)
+            shutil.rmtree(self._path(index_name))
+
+    def embedding_config(self, index_name):
+        return self._load(index_name).embedding
+
+    def projection(self, index_name):
+        return self._load(index_name).projection
+
+    def save_projection(self, index_name, projection):
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                np.savez(f, **projection)
+
+        with self._index_lock(index_name):
+            self._replace(os.path.join(self._path(index_name), "projection.npz"), write)
+            self._invalidate(index_name)
+
+    def _update_meta(self, index_name, update):
+        """Rewrite an index's meta.json with `update(meta)` applied."""
+        path = os.path.join(self._path(index_name), "meta.json")
+
+        def write(tmp_path):
+            with open(tmp_path, "w") as f:
+                json.dump(meta, f)
+
+        with self._index_lock(index_name):
+            with open(path) as f:
+                meta = update(json.load(f))
+            self._replace(path, write)
+            self._invalidate(index_name)
+
+    def set_embedding_config(self, index_name, config):
+        self._update_meta(index_name, lambda meta: dict(meta, dimension=config["dimension"], embedding=config))
+
+    def generation(self, index_name):
+        try:
+            with open(os.path.join(self._path(index_name), "meta.json")) as f:
+                return json.load(f).get("generation", 0)
+        except FileNotFoundError:
+            return None
+
+    def bump_generation(self, index_name):
+        self._update_meta(index_name, lambda meta: dict(meta, generation=meta.get("generation", 0) + 1))
+
+    def index_names(self):
+        if not os.path.isdir(self.root):
+            return set()
+        return {name for name in os.listdir(self.root) if self.exists(name)}
+
+    def document_exists(self, index_name, doc_id):
+        if not self.exists(index_name):
+            return False
+        return any(source.get("doc_id") == doc_id for source in self._load(index_name).sources)
+
+    def document_ids(self, index_name):
+        if not self.exists(index_name):
+            return set()
+        return {source["doc_id"] for source in self._load(index_name).sources if source.get("doc_id")}
+
+    def delete_document(self, index_name, doc_id):
+        return self._rewrite(index_name, lambda source: source.get("doc_id") != doc_id)
+
+    def copy_into(self, source_index, dest_index, doc_id):
+        source = self._load(source_index)
+        chunks = (
+            dict(chunk, doc_id=doc_id, embedding=vector)
+            for chunk, vector in zip(source.sources, source.vectors)
+        )
+        return self.index_chunks(dest_index, chunks)
+
+    def keyword_search(self, index_name, query_text, top_k, source_fields=SOURCE_FIELDS, doc_id=None):
+        index = self._load(index_name)
+        scores = index.bm25_scores(query_text)
+        hits = index.hits(scores, top_k, source_fields, doc_id)
+        return [hit for hit in hits if hit["_score"] > 0]
+
+    def knn_search(self, index_name, query_vector, top_k, source_fields=SOURCE_FIELDS, doc_id=None):
+        index = self._load(index_name)
+        return index.hits(index.knn_scores(query_vector), top_k, source_fields, doc_id)
+
+    def hybrid_search(self, index_name, query_text, query_vector, top_k, source_fields=SOURCE_FIELDS, doc_id=None):
+        # Same additive scoring as the OpenSearch bool/should query
+        index = self._load(index_name)
+        scores = index.bm25_scores(query_text) + index.knn_scores(query_vector)
+        return index.hits(scores, top_k, source_fields, doc_id)
+
+    def keyword_and_knn_search(self, index_name, query_text, query_vector, depth, source_fields=SOURCE_FIELDS, doc_id=None):
+        start = time.perf_counter()
+        keyword_hits = self.keyword_search(index_name, query_text, depth, source_fields, doc_id)
+        keyword_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        knn_hits = self.knn_search(index_name, query_vector, depth, source_fields, doc_id)
+        knn_ms = (time.perf_counter() - start) * 1000
+
+        return keyword_hits, knn_hits, {"keyword": keyword_ms, "semantic": knn_ms}
+
+    def supports_incremental(self, index_name):
+        return self.exists(index_name)
+
+    def stored_page_hashes(self, index_name, doc_id=None):
+        index = self._load(index_name)
+        page_hashes = {}
+        for source in index.sources:
+            if doc_id is not None and source.get("doc_id") != doc_id:
+                continue
+            if source.get("page_number") is not None and source.get("page_hash"):
+                page_hashes[source["page_number"]] = source["page_hash"]
+            for entry in source.get("page_hashes") or []:
+                page, page_hash = entry.split(":", 1)
+                page_hashes[int(page)] = page_hash
+        return page_hashes
+
+    def pages_sharing_chunks(self, index_name, page_numbers, doc_id=None):
+        pages = set(page_numbers)
+        shared = set(pages)
+        for source in self._load(index_name).sources:
+            covered = _source_pages(source)
+            if covered & pages and (doc_id is None or source.get("doc_id") == doc_id):
+                shared |= covered
+        return shared
+
+    def delete_pages(self, index_name, page_numbers, doc_id=None):
+        if not page_numbers:
+            return 0
+
+        pages = set(page_numbers)
+        deleted = self._rewrite(
+            index_name,
+            lambda source: not _source_pages(source) & pages
+            or (doc_id is not None and source.get("doc_id") != doc_id),
+        )
+        print(f"Deleted {deleted} stale chunks from {len(pages)} pages in local index '{index_name}'")
+        return deleted
+
+    def _rewrite(self, index_name, keep_source):
+        """Rewrite an index keeping only chunks whose source passes `keep_source`."""
+        path = self._path(index_name)
+        with self._index_lock(index_name):
+            index = self._load(index_name)
+            keep = [i for i, source in enumerate(index.sources) if keep_source(source)]
+            deleted = len(index.sources) - len(keep)
+            if not deleted:
+                return 0
+
+            vectors = np.array(index.vectors[keep], dtype=np.float32)
+            sources = [index.sources[i] for i in keep]
+
+            def write_vectors(tmp_path):
+                with open(tmp_path, "wb") as f:
+                    f.write(vectors.tobytes())
+
+            def write_sources(tmp_path):
+                with open(tmp_path, "w") as f:
+                    for source in sources:
+                        f.write(json.dumps(source) + "\n")
+
+            # Searches may still hold a memory map of the old vectors file, so it is replaced, not truncated
+            self._replace(os.path.join(path, "vectors.f32"), write_vectors)
+            self._replace(os.path.join(path, "chunks.jsonl"), write_sources)
+            self._invalidate(index_name)
+            self._rows[index_name] = len(sources)
+
+        return deleted
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(index_name=None, backend=None):
+    """
+    Return the storage backend for an index.
+
+    An explicit `backend` ("opensearch" or "local") wins. Otherwise an index
+    that already exists in the local store uses it, and everything else uses
+    VECTOR_STORE_BACKEND.
+    """
+    if backend is None:
+        local = get_store(backend="local")
+        if index_name and local.exists(index_name):
+            return local
+        backend = VECTOR_STORE_BACKEND
+
+    with _stores_lock:
+        store = _stores.get(backend)
+        if store is None:
+            if backend == "local":
+                store = LocalStore()
+            elif backend == "opensearch":
+                store = OpenSearchStore()
+            else:
+                raise ValueError(f"Unknown vector store backend: {backend}")
+            _stores[backend] = store
+    return store
+
+
+def existing_index_names(backend=None):
+    """
+    Per-document index names already in use, fetched at once: the indices,
+    or in shared mode the documents of the shared index. Without a
+    `backend` both stores get_store may pick are included.
+    """
+    stores = {get_store(backend=name) for name in ([backend] if backend else ["local", VECTOR_STORE_BACKEND])}
+    names = set()
+    for store in stores:
+        names |= store.document_ids(SHARED_INDEX_NAME) if SHARED_INDEX else store.index_names()
+    return names
+
+
+def index_exists(index_name, backend=None):
+    """Whether the index (or, in shared mode, the document) already exists."""
+    physical_index, doc_id = resolve_index(index_name)
+    store = get_store(physical_index, backend)
+    if doc_id:
+        return store.document_exists(physical_index, doc_id)
+    return store.exists(physical_index)